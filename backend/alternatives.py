@@ -0,0 +1,135 @@
+"""
+Safer-alternative recommendations without a similarity matrix
+Keeps one L2-normalised feature vector per product and answers top-k cosine
+queries with a blocked matrix-vector product, so memory stays linear in the
+catalog size. The vectors are normally precomputed into the catalog store and
+memory-mapped. An optional IVF partition (k-means lists) narrows the scan.
+"""
+
+import numpy as np
+
+RISK_BINS = [(20, 'Low'), (40, 'Moderate'), (60, 'High'), (100, 'Very High')]
+
+
+def risk_category(risk_score):
+    for upper, label in RISK_BINS:
+        if risk_score <= upper:
+            return label
+    return RISK_BINS[-1][1]
+
+
+def _kmeans(vectors, n_lists, n_iter=10, sample_size=20000, seed=0):
+    """Spherical k-means centroids fitted on a sample of the rows"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+
+def feature_vectors(features):
+    """(N, d) raw features -> standardised, L2-normalised float32 vectors, the
+    notebook's StandardScaler + cosine_similarity preprocessing"""
+    features = np.asarray(features, dtype=np.float64)
+    mean = features.mean(axis=0) if len(features) else 0.0
+    std = features.std(axis=0) if len(features) else 1.0
+    vectors = (features - mean) / np.where(std > 0, std, 1.0)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors.astype(np.float32)
+
+
+class AlternativesIndex:
+    def __init__(self, vectors, risk_scores, block_size=8192, n_lists=0, n_probe=8):
+        """vectors: (N, d) output of feature_vectors, used as given (e.g. memory-mapped)
+        unless IVF needs them reordered; risk_scores: (N,), NaN for products that
+        can't be scored (they are never recommended)"""
+        self.n_products = len(vectors)
+        self.block_size = block_size
+
+        # IVF: rows are stored grouped by list so each list is one contiguous slice
+        self.n_lists = min(n_lists, self.n_products) if n_lists else 0
+        self.n_probe = n_probe
+        if self.n_lists:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            self.centroids = _kmeans(vectors, self.n_lists)
+            assign = np.argmax(vectors @ self.centroids.T, axis=1)
+            order = np.argsort(assign, kind='stable')
+            self.list_offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+            self.list_offsets[1:] = np.cumsum(np.bincount(assign, minlength=self.n_lists))
+            self.doc_ids = order.astype(np.int64)
+            self.positions = np.empty(self.n_products, dtype=np.int64)
+            self.positions[order] = np.arange(self.n_products)
+            self.vectors = vectors[order]
+            self.risk_scores = np.asarray(risk_scores, dtype=np.float32)[order]
+        else:
+            # Catalog order: positions are doc ids and the arrays are not copied
+            self.centroids = None
+            self.doc_ids = self.positions = None
+            self.vectors = np.asarray(vectors, dtype=np.float32)
+            self.risk_scores = np.asarray(risk_scores, dtype=np.float32)
+
+    @classmethod
+    def from_features(cls, features, risk_scores, **kwargs):
+        return cls(feature_vectors(features), risk_scores, **kwargs)
+
+    def _position(self, doc_id):
+        return doc_id if self.positions is None else int(self.positions[doc_id])
+
+    def _doc_id(self, pos):
+        return int(pos) if self.doc_ids is None else int(self.doc_ids[pos])
+
+    def risk_score(self, doc_id):
+        return float(self.risk_scores[self._position(doc_id)])
+
+    def _ranges(self, query):
+        if self.centroids is None:
+            return [(0, self.n_products)]
+        n_probe = min(self.n_probe, self.n_lists)
+        lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        return [(self.list_offsets[c], self.list_offsets[c + 1]) for c in sorted(lists)]
+
+    def query(self, doc_id, k=5):
+        """[(doc_id, similarity, recommendation_score)] for the k best products that
+        are similar to doc_id and have a strictly lower risk score"""
+        pos = self._position(doc_id)
+        query = self.vectors[pos]
+        max_risk = self.risk_scores[pos]
+        if np.isnan(max_risk):
+            return []
+
+        best_pos, best_scores = [], []
+        for start, end in self._ranges(query):
+            for block in range(start, end, self.block_size):
+                stop = min(block + self.block_size, end)
+                risk = self.risk_scores[block:stop]
+                # Recommendation score = similarity * (1 - risk / 100)
+                scores = (self.vectors[block:stop] @ query) * (1.0 - risk / 100.0)
+                eligible = risk < max_risk  # NaN never qualifies
+                if block <= pos < stop:
+                    eligible[pos - block] = False
+                candidates = np.flatnonzero(eligible)
+                if len(candidates) > k:
+                    candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+                best_pos.append(candidates + block)
+                best_scores.append(scores[candidates])
+
+        if not best_pos:
+            return []
+        best_pos = np.concatenate(best_pos)
+        best_scores = np.concatenate(best_scores)
+        top = np.lexsort((best_pos, -best_scores))[:k]
+
+        return [(self._doc_id(p), float(self.vectors[p] @ query), float(s))
+                for p, s in zip(best_pos[top], best_scores[top])]
+
+    def nbytes(self):
+        arrays = [self.vectors, self.risk_scores, self.doc_ids, self.positions]
+        return sum(a.nbytes for a in arrays if a is not None)
@@ -1,21 +1,56 @@
+import os
+import threading
+from dotenv import load_dotenv
+from password_hasher import AuthOverloaded, PasswordHasher
+
+# Load environment variables
+load_dotenv()
+
+# Password hashing runs in its own worker processes. They are forked here, first,
+# while this is still the only thread: gRPC (google.generativeai) and the rest of
+# startup below run threads of their own, and a process with threads can't be
+# forked safely.
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+AUTH_HASH_WORKERS = int(os.getenv('AUTH_HASH_WORKERS', 2))
+AUTH_HASH_MAX_QUEUE = int(os.getenv('AUTH_HASH_MAX_QUEUE', 32))
+password_hasher = PasswordHasher(AUTH_HASH_WORKERS, AUTH_HASH_MAX_QUEUE, BCRYPT_ROUNDS)
+
 import google.generativeai as genai
-from PIL import Image
-import io
 import json
-import os
+import re
+import time
+import hashlib
+import atexit
 import joblib
-import bcrypt
 import jwt
 import base64
 import numpy as np
+from collections import namedtuple
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from dotenv import load_dotenv
+from werkzeug.exceptions import RequestEntityTooLarge
+from term_matcher import PhraseMatcher, TermMatcher
+from tree_compiler import compile_risk_model
+from micro_batcher import MicroBatcher
+from ttl_cache import LRUTTLCache
+from ingredient_registry import IngredientRegistry, compile_allergens
+from product_search import ProductCatalog, load_product_catalog
+from alternatives import AlternativesIndex, feature_vectors, risk_category
+from llm_client import GeminiClient
+from single_flight import SingleFlight
+from llm_guard import CircuitBreaker, GuardedExecutor, LLMUnavailable
+from chat_sessions import ChatSession, clip_to_tokens, estimate_tokens, extract_allergy_text
+from image_prep import ImagePreprocessor, ImageRejected, ImageTooLarge, UploadUnsupported
+from image_cache import ImageAnalysisCache, image_hashes, normalize_text
+from job_queue import JobQueue, JobStore, QueueFull
+from structured_output import IMAGE_ANALYSIS_SCHEMA, OutputInvalid, StructuredOutput
+from write_behind import WriteBehindBuffer
+from leaderboard import Leaderboards
+from review_summary import ReviewSummaries
+from storage import SQLiteStorage, SupabaseStorage
 
-# Load environment variables
-load_dotenv()
 # After this line:
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
@@ -33,32 +68,137 @@ CORS(app, resources={r"/api/*": {"origins": "*"}})
 # Configuration
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'supabase').lower()
+SQLITE_PATH = os.getenv('SQLITE_PATH', 'data/dermamon.db')
 JWT_SECRET = os.getenv('SECRET_KEY', 'your-secret-key-change-this')
+PREDICT_BATCH_MAX = int(os.getenv('PREDICT_BATCH_MAX', 500))
+COMPILE_RISK_MODEL = os.getenv('COMPILE_RISK_MODEL', 'true').lower() == 'true'
+MICRO_BATCHING = os.getenv('MICRO_BATCHING', 'true').lower() == 'true'
+MICRO_BATCH_MAX_ROWS = int(os.getenv('MICRO_BATCH_MAX_ROWS', 64))
+MICRO_BATCH_WAIT_MS = float(os.getenv('MICRO_BATCH_WAIT_MS', 2.0))
+PREDICT_CACHE_SIZE = int(os.getenv('PREDICT_CACHE_SIZE', 2048))
+PREDICT_CACHE_TTL = float(os.getenv('PREDICT_CACHE_TTL', 3600))
+ALLERGEN_CACHE_SIZE = int(os.getenv('ALLERGEN_CACHE_SIZE', 4096))
+PRODUCT_CATALOG_PATH = os.getenv('PRODUCT_CATALOG_PATH', 'skincare_datasets/master_products.csv')
+PRODUCT_CATALOG_STORE = os.getenv('PRODUCT_CATALOG_STORE', 'models/product_catalog.dmcat')
+PRODUCT_CATALOG_VERIFY = os.getenv('PRODUCT_CATALOG_VERIFY', 'false').lower() == 'true'
+PRODUCT_MATCH_THRESHOLD = float(os.getenv('PRODUCT_MATCH_THRESHOLD', 0.7))
+KNOWLEDGE_CHECK_SECONDS = float(os.getenv('KNOWLEDGE_CHECK_SECONDS', 5))
+ALTERNATIVES_BLOCK_SIZE = int(os.getenv('ALTERNATIVES_BLOCK_SIZE', 8192))
+ALTERNATIVES_IVF_LISTS = int(os.getenv('ALTERNATIVES_IVF_LISTS', 0))
+ALTERNATIVES_IVF_PROBE = int(os.getenv('ALTERNATIVES_IVF_PROBE', 8))
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+GEMINI_CONTEXT_CACHE = os.getenv('GEMINI_CONTEXT_CACHE', 'true').lower() == 'true'
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL', 3600))
+GEMINI_JSON_MODE = os.getenv('GEMINI_JSON_MODE', 'true').lower() == 'true'
+CHAT_CACHE_SIZE = int(os.getenv('CHAT_CACHE_SIZE', 1024))
+CHAT_CACHE_TTL = float(os.getenv('CHAT_CACHE_TTL', 1800))
+CHAT_MEMORY_TURNS = int(os.getenv('CHAT_MEMORY_TURNS', 6))
+CHAT_SESSIONS_MAX = int(os.getenv('CHAT_SESSIONS_MAX', 5000))
+CHAT_SESSION_IDLE_TTL = float(os.getenv('CHAT_SESSION_IDLE_TTL', 1800))
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv('CHAT_PROMPT_TOKEN_BUDGET', 1000))
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv('IMAGE_MAX_UPLOAD_BYTES', 10_000_000))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', 1024))
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 300_000))
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'JPEG')
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 85))
+IMAGE_CACHE_SIZE = int(os.getenv('IMAGE_CACHE_SIZE', 512))
+IMAGE_CACHE_TTL = float(os.getenv('IMAGE_CACHE_TTL', 3600))
+IMAGE_CACHE_MAX_DISTANCE = int(os.getenv('IMAGE_CACHE_MAX_DISTANCE', 4))
+IMAGE_JOBS = os.getenv('IMAGE_JOBS', 'true').lower() == 'true'
+IMAGE_JOB_WORKERS = int(os.getenv('IMAGE_JOB_WORKERS', 2))
+IMAGE_JOB_MAX_DEPTH = int(os.getenv('IMAGE_JOB_MAX_DEPTH', 32))
+IMAGE_JOB_TTL = float(os.getenv('IMAGE_JOB_TTL', 600))
+IMAGE_JOB_MAX_RUNTIME = float(os.getenv('IMAGE_JOB_MAX_RUNTIME', 120))
+IMAGE_JOB_STORE = os.getenv('IMAGE_JOB_STORE', 'data/image_jobs.db')
+SCORE_FLUSH_ROWS = int(os.getenv('SCORE_FLUSH_ROWS', 200))
+SCORE_FLUSH_MS = float(os.getenv('SCORE_FLUSH_MS', 1000))
+SCORE_BUFFER_MAX = int(os.getenv('SCORE_BUFFER_MAX', 20000))
+SCORE_SPILL_PATH = os.getenv('SCORE_SPILL_PATH', 'data/game_scores.spill.jsonl')
+SCORE_RETRY_ATTEMPTS = int(os.getenv('SCORE_RETRY_ATTEMPTS', 3))
+SCORE_RETRY_BACKOFF_MS = float(os.getenv('SCORE_RETRY_BACKOFF_MS', 500))
+SCORE_MAX = int(os.getenv('SCORE_MAX', 1_000_000))
+LEADERBOARD_RECONCILE_SECONDS = float(os.getenv('LEADERBOARD_RECONCILE_SECONDS', 300))
+LEADERBOARD_GRACE_SECONDS = float(os.getenv('LEADERBOARD_GRACE_SECONDS', 120))
+LEADERBOARD_MAX_LIMIT = int(os.getenv('LEADERBOARD_MAX_LIMIT', 100))
+REVIEWS_PAGE_SIZE = int(os.getenv('REVIEWS_PAGE_SIZE', 20))
+REVIEWS_MAX_PAGE_SIZE = int(os.getenv('REVIEWS_MAX_PAGE_SIZE', 100))
+REVIEW_SUMMARY_RECONCILE_SECONDS = float(os.getenv('REVIEW_SUMMARY_RECONCILE_SECONDS', 3600))
+LLM_MAX_WORKERS = int(os.getenv('LLM_MAX_WORKERS', 4))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', 16))
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', 20))
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', 30))
+
+# Largest body any route accepts: an allergy photo as base64 plus its form fields.
+# Werkzeug enforces this while reading, so a chunked upload with no Content-Length is cut off too.
+app.config['MAX_CONTENT_LENGTH'] = IMAGE_MAX_UPLOAD_BYTES * 4 // 3 + 65536
 
-# Initialize Supabase
+# Initialize storage (Supabase, or a local SQLite file with STORAGE_BACKEND=sqlite)
 try:
-    from supabase import create_client, Client
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    SUPABASE_CONNECTED = True
-    print("✅ Supabase connected successfully")
+    if STORAGE_BACKEND == 'sqlite':
+        storage = SQLiteStorage(SQLITE_PATH)
+        print(f"✅ SQLite storage ready at {SQLITE_PATH}")
+    else:
+        from supabase import create_client
+        storage = SupabaseStorage(create_client(SUPABASE_URL, SUPABASE_KEY))
+        print("✅ Supabase connected successfully")
+    DATABASE_CONNECTED = True
 except Exception as e:
-    print(f"⚠️ Warning: Could not connect to Supabase - {e}")
-    supabase = None
-    SUPABASE_CONNECTED = False
+    print(f"⚠️ Warning: Could not connect to {STORAGE_BACKEND} storage - {e}")
+    storage = None
+    DATABASE_CONNECTED = False
 
 # Load ML models
-try:
-    risk_classifier = joblib.load('models/risk_classifier.pkl')
-    risk_encoder = joblib.load('models/risk_encoder.pkl')
-    risk_scaler = joblib.load('models/risk_scaler.pkl')
-    MODELS_LOADED = True
-    print("✅ ML Models loaded successfully")
-except Exception as e:
-    print(f"⚠️ Warning: Could not load models - {e}")
-    risk_classifier = None
-    risk_encoder = None
-    risk_scaler = None
-    MODELS_LOADED = False
+RISK_MODEL_PATHS = {
+    'classifier': 'models/risk_classifier.pkl',
+    'encoder': 'models/risk_encoder.pkl',
+    'scaler': 'models/risk_scaler.pkl',
+}
+
+def model_artifacts_stamp():
+    # (mtime, size) of every artifact; changes whenever a model is retrained
+    stamp = []
+    for path in RISK_MODEL_PATHS.values():
+        try:
+            st = os.stat(path)
+            stamp.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stamp.append((path, None, None))
+    return tuple(stamp)
+
+# Everything one prediction needs, swapped in as a unit so a reload never mixes old and new
+RiskModels = namedtuple('RiskModels', ['classifier', 'encoder', 'scaler', 'compiled'])
+
+def load_risk_models():
+    global risk_models, MODELS_LOADED, RISK_MODEL_STAMP
+    
+    RISK_MODEL_STAMP = model_artifacts_stamp()
+    try:
+        classifier = joblib.load(RISK_MODEL_PATHS['classifier'])
+        encoder = joblib.load(RISK_MODEL_PATHS['encoder'])
+        scaler = joblib.load(RISK_MODEL_PATHS['scaler'])
+        loaded = True
+        print("✅ ML Models loaded successfully")
+    except Exception as e:
+        print(f"⚠️ Warning: Could not load models - {e}")
+        classifier = encoder = scaler = None
+        loaded = False
+    
+    # Flatten the tree ensemble into NumPy arrays (falls back to sklearn if unsupported)
+    compiled = None
+    if loaded and COMPILE_RISK_MODEL:
+        try:
+            compiled = compile_risk_model(classifier, scaler)
+            print("✅ Risk model compiled for fast inference")
+        except Exception as e:
+            print(f"⚠️ Warning: Could not compile risk model, using sklearn - {e}")
+    
+    risk_models = RiskModels(classifier, encoder, scaler, compiled) if loaded else None
+    MODELS_LOADED = loaded
+
+load_risk_models()
 
 # Knowledge Base
 INGREDIENT_DATA = {
@@ -98,6 +238,9 @@ HARMFUL_INGREDIENTS = {
     'irritants': ['menthol', 'camphor', 'eucalyptus']
 }
 
+# Compiled once so each ingredient is scanned a single time for all categories
+HARMFUL_MATCHER = TermMatcher(HARMFUL_INGREDIENTS)
+
 SKIN_TYPE_CONCERNS = {
     'sensitive': ['fragrance', 'parfum', 'alcohol', 'sulfates', 'retinol', 'alcohol denat'],
     'dry': ['alcohol', 'sulfates', 'alcohol denat', 'sls'],
@@ -149,6 +292,26 @@ PRODUCT_DATABASE = {
     }
 }
 
+# Name search over the built-in products and the full master catalog
+LOCAL_CATALOG = ProductCatalog([dict(info, key=key, source='dermamon') for key, info in PRODUCT_DATABASE.items()])
+PRODUCT_CATALOG = load_product_catalog(PRODUCT_CATALOG_PATH, PRODUCT_CATALOG_STORE, PRODUCT_CATALOG_VERIFY)
+
+def search_products(query, limit=10, min_score=0.3):
+    # Merge both indexes; built-in products win ties since their data is richer
+    results = [(score, 1, None, product)
+               for _, product, score in LOCAL_CATALOG.search(query, limit, min_score)]
+    results += [(score, 0, doc_id, product)
+                for doc_id, product, score in PRODUCT_CATALOG.search(query, limit, min_score)]
+    results.sort(key=lambda r: (r[0], r[1]), reverse=True)
+    return [(doc_id, product, score) for score, _, doc_id, product in results[:limit]]
+
+def match_product(query):
+    # Best candidate that has an ingredient list and clears the similarity threshold
+    for doc_id, product, score in search_products(query, 5, PRODUCT_MATCH_THRESHOLD):
+        if product.get('ingredients'):
+            return product, score
+    return None, 0.0
+
 # Allergy Analysis Knowledge Base
 ALLERGY_SYMPTOMS = {
     'redness': ['fragrance', 'alcohol', 'essential oils', 'sulfates'],
@@ -167,6 +330,149 @@ REMEDIES = {
     'retinol': 'Reduce retinol concentration or frequency. Always use sunscreen.',
 }
 
+# INCI names and common aliases that refer to the same ingredient
+INGREDIENT_SYNONYMS = {
+    'water': ['aqua', 'eau'],
+    'fragrance': ['parfum', 'fragrances', 'perfume'],
+    'sodium lauryl sulfate': ['sls'],
+    'alcohol denat': ['alcohol denat.', 'denatured alcohol', 'sd alcohol'],
+    'ascorbic acid': ['vitamin c', 'l-ascorbic acid'],
+    'parabens': ['paraben'],
+    'sulfates': ['sulfate', 'sulphates'],
+    'preservatives': ['preservative'],
+    'essential oils': ['essential oil'],
+    'tocopherol': ['vitamin e'],
+}
+
+def build_ingredient_index():
+    # Canonical IDs for every ingredient the knowledge base mentions, plus
+    # precomputed bitsets so membership checks are a single mask intersection
+    global INGREDIENTS, SKIN_TYPE_MASKS, SYMPTOM_MASKS, REMEDY_BY_ID
+    
+    registry = IngredientRegistry(INGREDIENT_SYNONYMS)
+    registry.add_all(INGREDIENT_DATA)
+    for terms in HARMFUL_INGREDIENTS.values():
+        registry.add_all(terms)
+    for concerns in SKIN_TYPE_CONCERNS.values():
+        registry.add_all(concerns)
+    for culprits in ALLERGY_SYMPTOMS.values():
+        registry.add_all(culprits)
+    registry.add_all(REMEDIES)
+    for product in PRODUCT_DATABASE.values():
+        registry.add_all(i for i in product['ingredients'].split(',') if i.strip())
+    
+    SKIN_TYPE_MASKS = {st: registry.mask(concerns) for st, concerns in SKIN_TYPE_CONCERNS.items()}
+    SYMPTOM_MASKS = {symptom: registry.mask(culprits) for symptom, culprits in ALLERGY_SYMPTOMS.items()}
+    REMEDY_BY_ID = {registry.id_of(name): remedy for name, remedy in REMEDIES.items()}
+    INGREDIENTS = registry
+
+build_ingredient_index()
+
+def build_chat_matcher():
+    # Every knowledge-base term a chat message can mention, matched on whole words
+    matcher = PhraseMatcher()
+    for key, product in PRODUCT_DATABASE.items():
+        matcher.add(key, ('product', key))
+        matcher.add(product['name'], ('product', key))
+        matcher.add(product['brand'], ('product', key))
+    
+    # Synonyms (aqua/water, vitamin c/ascorbic acid) report one ingredient
+    data_keys = {}
+    for ingredient in INGREDIENT_DATA:
+        data_keys.setdefault(INGREDIENTS.id_of(ingredient), ingredient)
+    for ingredient in INGREDIENT_DATA:
+        matcher.add(ingredient, ('ingredient', data_keys[INGREDIENTS.id_of(ingredient)]))
+    for canonical, aliases in INGREDIENT_SYNONYMS.items():
+        data_key = data_keys.get(INGREDIENTS.id_of(canonical))
+        if data_key:
+            for alias in [canonical] + aliases:
+                matcher.add(alias, ('ingredient', data_key))
+    
+    for skin_type in SKIN_TYPE_CONCERNS:
+        matcher.add(skin_type, ('skin_type', skin_type))
+    for symptom in ALLERGY_SYMPTOMS:
+        matcher.add(symptom, ('symptom', symptom))
+    return matcher
+
+CHAT_MATCHER = build_chat_matcher()
+
+# Two layers: whole responses keyed by the query as sent, in front of features and model
+# output keyed by the parsed ingredients, which don't depend on their order or spacing
+predict_cache = LRUTTLCache(PREDICT_CACHE_SIZE, PREDICT_CACHE_TTL)
+risk_cache = LRUTTLCache(PREDICT_CACHE_SIZE, PREDICT_CACHE_TTL)
+
+def knowledge_base_fingerprint():
+    kb = json.dumps([INGREDIENT_DATA, HARMFUL_INGREDIENTS, SKIN_TYPE_CONCERNS, PRODUCT_DATABASE,
+                     ALLERGY_SYMPTOMS, REMEDIES, INGREDIENT_SYNONYMS], sort_keys=True)
+    return hashlib.sha1(kb.encode('utf-8')).hexdigest()
+
+KNOWLEDGE_VERSION = knowledge_base_fingerprint()
+_knowledge_checked_at = time.monotonic()
+_knowledge_lock = threading.Lock()
+
+def refresh_knowledge_version():
+    # Throttled check: reload retrained models / recompile edited terms, then drop cached results
+    global KNOWLEDGE_VERSION, HARMFUL_MATCHER, CHAT_MATCHER, _knowledge_checked_at
+    
+    if time.monotonic() - _knowledge_checked_at < KNOWLEDGE_CHECK_SECONDS:
+        return
+    if not _knowledge_lock.acquire(blocking=False):
+        return
+    try:
+        _knowledge_checked_at = time.monotonic()
+        changed = False
+        
+        if model_artifacts_stamp() != RISK_MODEL_STAMP:
+            print("🔄 Model artifacts changed, reloading")
+            load_risk_models()
+            changed = True
+        
+        version = knowledge_base_fingerprint()
+        if version != KNOWLEDGE_VERSION:
+            print("🔄 Knowledge base changed, recompiling matchers")
+            HARMFUL_MATCHER = TermMatcher(HARMFUL_INGREDIENTS)
+            build_ingredient_index()
+            CHAT_MATCHER = build_chat_matcher()
+            KNOWLEDGE_VERSION = version
+            # Requests keep the current alternatives index until the rebuilt one is swapped in
+            threading.Thread(target=rebuild_alternatives_index, name='alternatives-rebuild', daemon=True).start()
+            changed = True
+        
+        if changed:
+            predict_cache.clear()
+            risk_cache.clear()
+            allergen_profiles.clear()
+            chat_cache.clear()
+    finally:
+        _knowledge_lock.release()
+
+def normalize_product_query(text):
+    return ' '.join(text.strip().lower().split())
+
+def prediction_cache_key(product_query, skin_type, allergen_profile):
+    # Keyed on the query itself so a hit skips the product lookup too
+    return (product_query, skin_type, allergen_profile.key)
+
+def ingredients_cache_key(ingredients):
+    # Features and the model's answer only depend on the multiset of parsed names.
+    # Synonyms are kept apart: "alcohol denat." and "alcohol denat" don't score the same.
+    return tuple(sorted(ingredients))
+
+# Compiled allergen profiles, keyed by the raw allergy text a user sends
+allergen_profiles = LRUTTLCache(ALLERGEN_CACHE_SIZE, PREDICT_CACHE_TTL)
+
+def get_allergen_profile(allergies):
+    if isinstance(allergies, (list, tuple)):
+        key = tuple(str(a).lower() for a in allergies)
+    else:
+        key = (allergies or '').lower()
+    
+    profile = allergen_profiles.get(key)
+    if profile is None:
+        profile = compile_allergens(INGREDIENTS, key)
+        allergen_profiles.set(key, profile)
+    return profile
+
 # Helper Functions
 def calculate_ingredient_features(ingredients_list):
     features = {
@@ -179,13 +485,14 @@ def calculate_ingredient_features(ingredients_list):
     }
     
     for ing in ingredients_list:
-        if any(harmful in ing for harmful in HARMFUL_INGREDIENTS['high_risk']):
+        hits = HARMFUL_MATCHER.match(ing)
+        if 'high_risk' in hits:
             features['high_risk_count'] += 1
-        if any(harmful in ing for harmful in HARMFUL_INGREDIENTS['moderate_risk']):
+        if 'moderate_risk' in hits:
             features['moderate_risk_count'] += 1
-        if any(harmful in ing for harmful in HARMFUL_INGREDIENTS['comedogenic']):
+        if 'comedogenic' in hits:
             features['comedogenic_count'] += 1
-        if any(harmful in ing for harmful in HARMFUL_INGREDIENTS['irritants']):
+        if 'irritants' in hits:
             features['irritant_count'] += 1
         
         ing_data = INGREDIENT_DATA.get(ing, {})
@@ -207,6 +514,334 @@ def calculate_ingredient_features(ingredients_list):
     
     return features
 
+# Safer alternatives over the master catalog, same features as the notebook's recommender
+ALTERNATIVE_FEATURES = ['ingredient_count', 'risk_score', 'beneficial_score',
+                        'high_risk_count', 'moderate_risk_count', 'comedogenic_count']
+_alternatives_lock = threading.Lock()
+
+def alternative_features(products):
+    # Raw feature rows (ALTERNATIVE_FEATURES + price) and risk scores, NaN where there is nothing to score
+    n = len(products)
+    features = np.zeros((n, len(ALTERNATIVE_FEATURES) + 1))
+    risk_scores = np.full(n, np.nan)
+    
+    for doc_id in range(n):
+        product = products[doc_id]
+        ingredients = [i.strip() for i in re.split(r'[,;]', product['ingredients'].lower()) if len(i.strip()) > 2]
+        features[doc_id, -1] = np.nan if product.get('price') is None else product['price']
+        if not ingredients:
+            continue
+        ing_features = calculate_ingredient_features(ingredients)
+        features[doc_id, :-1] = [ing_features[f] for f in ALTERNATIVE_FEATURES]
+        risk_scores[doc_id] = ing_features['risk_score']
+    
+    prices = features[:, -1]
+    prices[np.isnan(prices)] = np.nanmedian(prices) if np.isfinite(prices).any() else 0.0
+    return features, risk_scores
+
+def alternative_columns(products):
+    # Precomputed by `python product_search.py build` into the catalog store
+    features, risk_scores = alternative_features(products)
+    arrays = {'alt_vectors': feature_vectors(features), 'alt_risk_scores': risk_scores.astype(np.float32)}
+    return arrays, {'alternatives_knowledge': KNOWLEDGE_VERSION}
+
+def build_alternatives_index(catalog):
+    features, risk_scores = alternative_features(catalog.products)
+    return AlternativesIndex.from_features(features, risk_scores, block_size=ALTERNATIVES_BLOCK_SIZE,
+                                           n_lists=ALTERNATIVES_IVF_LISTS, n_probe=ALTERNATIVES_IVF_PROBE)
+
+def stored_alternatives_index(catalog):
+    # Wraps the store's mapped vectors, shared between workers; None if missing or built from another knowledge base
+    store = catalog.store
+    if store is None or not store.has_column('alt_vectors'):
+        return None
+    if store.meta.get('alternatives_knowledge') != KNOWLEDGE_VERSION:
+        print("⚠️ Warning: stored alternative vectors predate the current knowledge base, rebuilding them")
+        return None
+    return AlternativesIndex(store.array('alt_vectors'), store.array('alt_risk_scores'), ALTERNATIVES_BLOCK_SIZE,
+                             ALTERNATIVES_IVF_LISTS, ALTERNATIVES_IVF_PROBE)
+
+def rebuild_alternatives_index():
+    # Runs in a background thread; builds run one at a time, so the last one to finish has seen the latest knowledge base
+    global ALTERNATIVES_INDEX
+    with _alternatives_lock:
+        try:
+            start = time.perf_counter()
+            ALTERNATIVES_INDEX = build_alternatives_index(PRODUCT_CATALOG)
+            print(f"✅ Alternatives index built: {len(PRODUCT_CATALOG)} products in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            print(f"⚠️ Warning: Could not build alternatives index - {e}")
+
+# Mapped from the prebuilt catalog when it has the vectors; otherwise built off
+# the import path while /alternatives answers 503
+ALTERNATIVES_INDEX = stored_alternatives_index(PRODUCT_CATALOG)
+if ALTERNATIVES_INDEX is None:
+    threading.Thread(target=rebuild_alternatives_index, name='alternatives-rebuild', daemon=True).start()
+
+def resolve_product(product_text):
+    # Check if it's a product name in database
+    product_info = PRODUCT_DATABASE.get(product_text, None)
+    match_score = None
+    
+    # Otherwise try a fuzzy name lookup, unless it is clearly an ingredient list
+    if not product_info and ',' not in product_text:
+        product_info, match_score = match_product(product_text)
+    
+    if product_info:
+        # Use product from database
+        ingredients = [i.strip().lower() for i in product_info['ingredients'].split(',')]
+        product_name = product_info['name']
+        product_details = {
+            'name': product_info['name'],
+            'brand': product_info['brand'],
+            'category': product_info['category'],
+            'suitable_for': product_info.get('suitable_skin_types', []),
+            'concerns_addressed': product_info.get('concerns', [])
+        }
+        if match_score is not None:
+            product_details['match_score'] = round(match_score, 3)
+    else:
+        # Treat as ingredient list
+        ingredients = [i.strip().lower() for i in product_text.split(',')]
+        product_name = "Custom Product"
+        product_details = None
+    
+    return ingredients, product_name, product_details
+
+def build_feature_vector(features):
+    # Brand, category and price are unknown at request time
+    return [
+        features['ingredient_count'],
+        features['high_risk_count'],
+        features['moderate_risk_count'],
+        features['comedogenic_count'],
+        features['irritant_count'],
+        features['beneficial_count'],
+        features['beneficial_score'],
+        0, 0, 0
+    ]
+
+def predict_risk_batch(feature_matrix):
+    # One (label, confidence) pair per row; (None, None) means rule-based only
+    results = [(None, None)] * len(feature_matrix)
+    
+    models = risk_models  # one snapshot for the whole batch
+    if models is None or len(feature_matrix) == 0:
+        return results
+    
+    try:
+        if models.compiled is not None:
+            probas = models.compiled.predict_proba(feature_matrix)
+        elif hasattr(models.classifier, 'predict_proba'):
+            probas = models.classifier.predict_proba(models.scaler.transform(feature_matrix))
+        else:
+            probas = None
+        
+        # Single inference pass: the label is the argmax of the probabilities
+        if probas is not None:
+            predictions_encoded = models.classifier.classes_[probas.argmax(axis=1)]
+            confidences = probas.max(axis=1) * 100
+        else:
+            predictions_encoded = models.classifier.predict(models.scaler.transform(feature_matrix))
+            confidences = [95.0] * len(feature_matrix)
+        
+        labels = models.encoder.inverse_transform(predictions_encoded)
+        results = [(label, float(conf)) for label, conf in zip(labels, confidences)]
+    except Exception as e:
+        print(f"ML prediction error: {e}")
+    
+    return results
+
+# Concurrent /api/predict calls share one batched model call
+risk_batcher = MicroBatcher(predict_risk_batch, MICRO_BATCH_MAX_ROWS, MICRO_BATCH_WAIT_MS)
+
+def predict_risk(feature_vector):
+    if not MODELS_LOADED:
+        return None, None
+    if MICRO_BATCHING:
+        return risk_batcher.submit(feature_vector)
+    return predict_risk_batch(np.array([feature_vector], dtype=float))[0]
+
+def build_prediction_result(ingredients, product_name, product_details, features,
+                            skin_type, allergies, ml_prediction, ml_confidence):
+    # Risk calculation
+    risk_score = features['risk_score']
+    if risk_score < 20:
+        risk_category = "Low"
+        safe = True
+    elif risk_score < 40:
+        risk_category = "Moderate"
+        safe = True
+    else:
+        risk_category = "High"
+        safe = False
+    
+    if ml_prediction:
+        risk_category = ml_prediction
+        safe = risk_category in ['Low', 'Moderate']
+    
+    # Analyze ingredients
+    high_risk = []
+    moderate_risk = []
+    beneficial = []
+    allergy_warnings = []
+    skin_warnings = []
+    # One AND between the product's bitset and the skin type's concerns; only hits are looked up below
+    skin_hits = INGREDIENTS.mask(ingredients) & SKIN_TYPE_MASKS.get(skin_type, 0)
+    
+    for ingredient in ingredients:
+        ing_data = INGREDIENT_DATA.get(ingredient, {'risk': 30, 'beneficial': False})
+        risk = ing_data['risk']
+        
+        if risk >= 50:
+            high_risk.append(ingredient)
+        elif risk >= 25:
+            moderate_risk.append(ingredient)
+        
+        if ing_data['beneficial']:
+            beneficial.append(ingredient)
+        
+        if allergies and allergies.matches(ingredient):
+            allergy_warnings.append(f"⚠️ Contains {ingredient} (you're allergic)")
+        
+        if skin_hits and INGREDIENTS.contains(skin_hits, ingredient):
+            skin_warnings.append(f"⚠️ {ingredient} may not be suitable for {skin_type} skin")
+    
+    # Recommendations
+    recommendations = []
+    if high_risk:
+        recommendations.append(f"⚠️ Consider avoiding: {', '.join(high_risk[:3])}")
+    if allergy_warnings:
+        recommendations.append("🚫 Choose alternatives without your allergens")
+    if len(beneficial) < len(ingredients) * 0.3:
+        recommendations.append("💡 Look for products with more beneficial ingredients")
+    
+    recommendations.append("🧪 Always patch test new products")
+    
+    response_data = {
+        'success': True,
+        'product_name': product_name,
+        'prediction': {
+            'safe': safe,
+            'risk_score': round(risk_score, 1),
+            'risk_category': risk_category,
+            'confidence': ml_confidence if ml_confidence else 87.5,
+            'model_used': 'ML' if MODELS_LOADED and ml_prediction else 'Rule-based'
+        },
+        'analysis': {
+            'total_ingredients': len(ingredients),
+            'high_risk_count': len(high_risk),
+            'moderate_risk_count': len(moderate_risk),
+            'beneficial_count': len(beneficial),
+            'high_risk_ingredients': high_risk,
+            'beneficial_ingredients': beneficial,
+            'all_ingredients': ingredients
+        },
+        'allergy_warnings': allergy_warnings,
+        'skin_type_warnings': skin_warnings,
+        'recommendations': recommendations,
+        'skin_type_compatibility': '✅ Suitable' if not skin_warnings else '⚠️ Use with caution'
+    }
+    
+    if product_details:
+        response_data['product_details'] = product_details
+    
+    return response_data
+
+# Gemini: one long-lived model per use case, static prompts sent as system instructions
+CHAT_SYSTEM_PROMPT = """You are Dermamon 🧴, a friendly skincare expert AI assistant.
+
+YOUR CORE KNOWLEDGE:
+
+**PRODUCTS YOU KNOW:**
+1. CeraVe Moisturizing Cream - For dry/sensitive skin, contains ceramides & hyaluronic acid
+2. CeraVe Hydrating Cleanser - Gentle cleanser for dry/normal/sensitive skin
+3. Neutrogena Hydro Boost Water Gel - Lightweight hydration for all skin types
+4. La Roche-Posay Toleriane - For sensitive skin with niacinamide & ceramides
+5. The Ordinary Niacinamide 10% + Zinc 1% - For oily/acne-prone skin
+6. Cetaphil Oil Control - For oily skin
+7. Paula's Choice BHA - Salicylic acid exfoliant for acne
+8. Vanicream Gentle Cleanser - Ultra-gentle for sensitive skin
+9. Aveeno Ultra-Calming - Soothes sensitive/irritated skin
+
+**KEY INGREDIENTS:**
+- Niacinamide: Brightening, oil control, pore minimizing (safe, risk 10/100)
+- Hyaluronic Acid: Holds 1000x its weight in water (very safe, risk 5/100)
+- Ceramides: Repair skin barrier, essential for dry/damaged skin (safe, risk 10/100)
+- Salicylic Acid: Unclogs pores, treats acne (moderate risk 30/100)
+- Retinol: Anti-aging but can irritate (higher risk 40/100)
+- Vitamin C: Brightening, antioxidant (low risk 15/100)
+- Glycerin: Humectant, draws moisture (very safe, risk 5/100)
+
+**HARMFUL TO AVOID:**
+- Parabens (risk 70/100): Hormone disruptors
+- Sulfates/SLS (risk 65/100): Harsh, strip natural oils
+- Fragrance/Parfum (risk 60/100): Common allergen
+- Alcohol Denat (risk 50/100): Very drying
+
+**SKIN TYPE RECOMMENDATIONS:**
+- Dry Skin: Hyaluronic acid, ceramides, glycerin, shea butter. Avoid alcohol & sulfates.
+  Best: CeraVe Moisturizing Cream, La Roche-Posay Toleriane, Neutrogena Hydro Boost
+  
+- Oily Skin: Niacinamide, salicylic acid, lightweight gels. Avoid heavy oils.
+  Best: The Ordinary Niacinamide, Neutrogena Hydro Boost, Cetaphil Oil Control, Paula's Choice BHA
+  
+- Sensitive Skin: Fragrance-free, minimal ingredients, soothing. Avoid fragrance, alcohol, sulfates.
+  Best: La Roche-Posay Toleriane, CeraVe Hydrating Cleanser, Vanicream, Aveeno Ultra-Calming
+  
+- Acne-Prone: Salicylic acid, niacinamide, benzoyl peroxide. Avoid coconut oil.
+  Best: The Ordinary Niacinamide, Paula's Choice BHA, CeraVe SA Cleanser
+
+**PRODUCT-SPECIFIC INFO:**
+- Vaseline (Petrolatum): EXCELLENT for dry skin as an occlusive (locks in moisture). NOT recommended for oily/acne-prone skin as it's very heavy and can clog pores.
+
+**YOUR PERSONALITY:**
+- Friendly and enthusiastic about skincare
+- Use 1-2 emojis per response
+- Keep responses concise (3-5 sentences)
+- Be specific with product names when asked
+- Always back up recommendations with reasoning
+- Encourage trying the "Product Analysis" feature for detailed checks
+
+**RESPONSE RULES:**
+- If asked for "options" or "more" products, give 3-5 specific product names
+- If asked about a product, explain its benefits and suitability
+- If asked about skin type, recommend specific products for that type
+- Be conversational but informative
+- Don't just repeat the same response - expand with new information
+"""
+
+ALLERGY_IMAGE_INSTRUCTION = """You analyze photos of skin conditions for a skincare app.
+
+Provide a detailed dermatological analysis in this exact JSON format:
+{
+    "severity": "mild/moderate/severe",
+    "type": "condition name (e.g., contact dermatitis, eczema, allergic reaction)",
+    "confidence": 85,
+    "observations": ["observation 1", "observation 2", "observation 3"],
+    "recommendations": ["recommendation 1", "recommendation 2", "recommendation 3"]
+}
+
+Be specific about visible symptoms like redness, swelling, texture changes, distribution pattern, etc.
+Provide practical, actionable recommendations.
+ONLY return valid JSON, no other text.
+"""
+
+# Every Gemini call runs on its own bounded pool with a deadline, behind a circuit breaker
+llm_executor = GuardedExecutor(LLM_MAX_WORKERS, LLM_MAX_QUEUE, LLM_TIMEOUT_SECONDS,
+                               CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS))
+
+# Validates (and where possible repairs) every image analysis; in JSON mode it also constrains the model
+image_analysis_output = StructuredOutput(IMAGE_ANALYSIS_SCHEMA, ranges={'confidence': (0, 100)})
+
+if GEMINI_API_KEY:
+    chat_llm = GeminiClient(genai, GEMINI_MODEL, CHAT_SYSTEM_PROMPT, GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_TTL)
+    allergy_llm = GeminiClient(genai, GEMINI_MODEL, ALLERGY_IMAGE_INSTRUCTION, GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_TTL,
+                               image_analysis_output.generation_config() if GEMINI_JSON_MODE else None)
+else:
+    chat_llm = None
+    allergy_llm = None
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -235,7 +870,7 @@ def health_check():
         'status': 'healthy',
         'message': 'Dermamon API is running! 🚀',
         'models_loaded': MODELS_LOADED,
-        'database_connected': SUPABASE_CONNECTED,
+        'database_connected': DATABASE_CONNECTED,
         'timestamp': datetime.now().isoformat()
     })
 
@@ -244,7 +879,7 @@ def signup():
     if request.method == 'OPTIONS':
         return '', 204
         
-    if not SUPABASE_CONNECTED:
+    if not DATABASE_CONNECTED:
         return jsonify({'error': 'Database not connected'}), 503
         
     try:
@@ -256,16 +891,16 @@ def signup():
         if not email or not password:
             return jsonify({'error': 'Email and password required'}), 400
         
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        hashed_password = password_hasher.hash(password)
         
-        response = supabase.table('users').insert({
+        user = storage.create_user({
             'email': email,
-            'password': hashed_password.decode('utf-8'),
+            'password': hashed_password,
             'name': name,
             'created_at': datetime.now().isoformat()
-        }).execute()
+        })
         
-        user_id = response.data[0]['id']
+        user_id = user['id']
         
         token = jwt.encode({
             'user_id': user_id,
@@ -282,6 +917,10 @@ def signup():
             }
         })
     
+    except AuthOverloaded:
+        response = jsonify({'error': 'Too many sign-in attempts right now, please retry shortly'})
+        response.headers['Retry-After'] = '1'
+        return response, 429
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -290,7 +929,7 @@ def login():
     if request.method == 'OPTIONS':
         return '', 204
         
-    if not SUPABASE_CONNECTED:
+    if not DATABASE_CONNECTED:
         return jsonify({'error': 'Database not connected'}), 503
         
     try:
@@ -301,14 +940,12 @@ def login():
         if not email or not password:
             return jsonify({'error': 'Email and password required'}), 400
         
-        response = supabase.table('users').select('*').eq('email', email).execute()
+        user = storage.get_user_by_email(email)
         
-        if not response.data:
+        if not user:
             return jsonify({'error': 'Invalid credentials'}), 401
         
-        user = response.data[0]
-        
-        if not bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
+        if not password_hasher.check(password, user['password']):
             return jsonify({'error': 'Invalid credentials'}), 401
         
         token = jwt.encode({
@@ -326,28 +963,34 @@ def login():
             }
         })
     
+    except AuthOverloaded:
+        response = jsonify({'error': 'Too many sign-in attempts right now, please retry shortly'})
+        response.headers['Retry-After'] = '1'
+        return response, 429
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+PROFILE_COLUMNS = ('id', 'email', 'name', 'profile_picture')
+
 @app.route('/api/user/profile', methods=['GET', 'PUT', 'OPTIONS'])
 @token_required
 def user_profile(current_user):
     if request.method == 'OPTIONS':
         return '', 204
         
-    if not SUPABASE_CONNECTED:
+    if not DATABASE_CONNECTED:
         return jsonify({'error': 'Database not connected'}), 503
         
     try:
         if request.method == 'GET':
-            response = supabase.table('users').select('id, email, name, profile_picture').eq('id', current_user).execute()
+            user = storage.get_user(current_user, PROFILE_COLUMNS)
             
-            if not response.data:
+            if not user:
                 return jsonify({'error': 'User not found'}), 404
             
             return jsonify({
                 'success': True,
-                'user': response.data[0]
+                'user': user
             })
         
         elif request.method == 'PUT':
@@ -359,11 +1002,14 @@ def user_profile(current_user):
             if 'profile_picture' in data:
                 update_data['profile_picture'] = data['profile_picture']
             
-            response = supabase.table('users').update(update_data).eq('id', current_user).execute()
+            user = storage.update_user(current_user, update_data, PROFILE_COLUMNS)
+            
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
             
             return jsonify({
                 'success': True,
-                'user': response.data[0]
+                'user': user
             })
     
     except Exception as e:
@@ -376,150 +1022,216 @@ def predict():
         
     try:
         data = request.get_json()
-        product_text = data.get('product', '').strip().lower()
+        product_text = normalize_product_query(data.get('product', ''))
         skin_type = data.get('skin_type', 'normal').lower()
-        allergies = data.get('allergies', '').lower()
+        allergies = data.get('allergies', '')
         
         if not product_text:
             return jsonify({'error': 'Product information required'}), 400
         
-        # Check if it's a product name in database
-        product_info = PRODUCT_DATABASE.get(product_text, None)
-        
-        if product_info:
-            # Use product from database
-            ingredients = [i.strip().lower() for i in product_info['ingredients'].split(',')]
-            product_name = product_info['name']
-            product_details = {
-                'name': product_info['name'],
-                'brand': product_info['brand'],
-                'category': product_info['category'],
-                'suitable_for': product_info['suitable_skin_types'],
-                'concerns_addressed': product_info['concerns']
-            }
-        else:
-            # Treat as ingredient list
-            ingredients = [i.strip().lower() for i in product_text.split(',')]
-            product_name = "Custom Product"
-            product_details = None
-        
-        # Calculate features
-        features = calculate_ingredient_features(ingredients)
-        
-        # ML Prediction
-        feature_vector = [
-            features['ingredient_count'],
-            features['high_risk_count'],
-            features['moderate_risk_count'],
-            features['comedogenic_count'],
-            features['irritant_count'],
-            features['beneficial_count'],
-            features['beneficial_score'],
-            0, 0, 0
-        ]
-        
-        ml_prediction = None
-        ml_confidence = None
-        
-        if MODELS_LOADED:
+        refresh_knowledge_version()
+        allergies = get_allergen_profile(allergies)
+        
+        cache_key = prediction_cache_key(product_text, skin_type, allergies)
+        cached = predict_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+        
+        ingredients, product_name, product_details = resolve_product(product_text)
+        
+        risk_key = ingredients_cache_key(ingredients)
+        scored = risk_cache.get(risk_key)
+        if scored is None:
+            # Calculate features
+            features = calculate_ingredient_features(ingredients)
+            
+            # ML Prediction
+            scored = (features, *predict_risk(build_feature_vector(features)))
+            risk_cache.set(risk_key, scored)
+        features, ml_prediction, ml_confidence = scored
+        
+        response_data = build_prediction_result(
+            ingredients, product_name, product_details, features,
+            skin_type, allergies, ml_prediction, ml_confidence
+        )
+        predict_cache.set(cache_key, response_data)
+        
+        return jsonify(response_data)
+    
+    except Exception as e:
+        print(f"Error in predict: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/predict/batch', methods=['POST', 'OPTIONS'])
+def predict_batch():
+    if request.method == 'OPTIONS':
+        return '', 204
+        
+    try:
+        data = request.get_json()
+        items = data.get('products', [])
+        default_skin_type = data.get('skin_type', 'normal')
+        default_allergies = data.get('allergies', '')
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'A non-empty products list is required'}), 400
+        if len(items) > PREDICT_BATCH_MAX:
+            return jsonify({'error': f'At most {PREDICT_BATCH_MAX} products per batch'}), 413
+        
+        refresh_knowledge_version()
+        
+        # Parse every item on its own so one bad entry only fails itself
+        results = [None] * len(items)
+        parsed = []
+        scored = {}  # risk_key -> (features, ml_prediction, ml_confidence)
+        unscored = []  # (risk_key, features) still to go through the model
+        for idx, item in enumerate(items):
             try:
-                feature_scaled = risk_scaler.transform([feature_vector])
-                prediction_encoded = risk_classifier.predict(feature_scaled)[0]
-                ml_prediction = risk_encoder.inverse_transform([prediction_encoded])[0]
+                if isinstance(item, str):
+                    item = {'product': item}
+                if not isinstance(item, dict):
+                    raise ValueError('Each item must be a product name, ingredient list or object')
+                product_text = normalize_product_query(item.get('product', ''))
+                skin_type = item.get('skin_type', default_skin_type).lower()
+                allergies = get_allergen_profile(item.get('allergies', default_allergies))
+                
+                if not product_text:
+                    raise ValueError('Product information required')
+                
+                cache_key = prediction_cache_key(product_text, skin_type, allergies)
+                cached = predict_cache.get(cache_key)
+                if cached is not None:
+                    results[idx] = dict(cached, index=idx)
+                    continue
                 
-                if hasattr(risk_classifier, 'predict_proba'):
-                    probas = risk_classifier.predict_proba(feature_scaled)[0]
-                    ml_confidence = float(max(probas) * 100)
-                else:
-                    ml_confidence = 95.0
+                ingredients, product_name, product_details = resolve_product(product_text)
+                risk_key = ingredients_cache_key(ingredients)
+                if risk_key not in scored:
+                    scored[risk_key] = risk_cache.get(risk_key)
+                    if scored[risk_key] is None:
+                        unscored.append((risk_key, calculate_ingredient_features(ingredients)))
+                parsed.append((idx, cache_key, risk_key, ingredients, product_name, product_details, skin_type, allergies))
             except Exception as e:
-                print(f"ML prediction error: {e}")
-        
-        # Risk calculation
-        risk_score = features['risk_score']
-        if risk_score < 20:
-            risk_category = "Low"
-            safe = True
-        elif risk_score < 40:
-            risk_category = "Moderate"
-            safe = True
-        else:
-            risk_category = "High"
-            safe = False
-        
-        if ml_prediction:
-            risk_category = ml_prediction
-            safe = risk_category in ['Low', 'Moderate']
-        
-        # Analyze ingredients
-        high_risk = []
-        moderate_risk = []
-        beneficial = []
-        allergy_warnings = []
-        skin_warnings = []
-        
-        for ingredient in ingredients:
-            ing_data = INGREDIENT_DATA.get(ingredient, {'risk': 30, 'beneficial': False})
-            risk = ing_data['risk']
-            
-            if risk >= 50:
-                high_risk.append(ingredient)
-            elif risk >= 25:
-                moderate_risk.append(ingredient)
-            
-            if ing_data['beneficial']:
-                beneficial.append(ingredient)
-            
-            if allergies and ingredient in allergies:
-                allergy_warnings.append(f"⚠️ Contains {ingredient} (you're allergic)")
-            
-            if skin_type in SKIN_TYPE_CONCERNS:
-                if ingredient in SKIN_TYPE_CONCERNS[skin_type]:
-                    skin_warnings.append(f"⚠️ {ingredient} may not be suitable for {skin_type} skin")
-        
-        # Recommendations
-        recommendations = []
-        if high_risk:
-            recommendations.append(f"⚠️ Consider avoiding: {', '.join(high_risk[:3])}")
-        if allergy_warnings:
-            recommendations.append("🚫 Choose alternatives without your allergens")
-        if len(beneficial) < len(ingredients) * 0.3:
-            recommendations.append("💡 Look for products with more beneficial ingredients")
-        
-        recommendations.append("🧪 Always patch test new products")
-        
-        response_data = {
+                results[idx] = {'success': False, 'index': idx, 'error': str(e)}
+        
+        # One N x 10 matrix, one scaler/classifier pass for every ingredient list not already scored
+        if unscored:
+            feature_matrix = np.array([build_feature_vector(features) for _, features in unscored], dtype=float)
+            for (risk_key, features), ml_result in zip(unscored, predict_risk_batch(feature_matrix)):
+                scored[risk_key] = (features, *ml_result)
+                risk_cache.set(risk_key, scored[risk_key])
+        
+        for idx, cache_key, risk_key, ingredients, product_name, product_details, skin_type, allergies in parsed:
+            try:
+                features, ml_prediction, ml_confidence = scored[risk_key]
+                result = build_prediction_result(
+                    ingredients, product_name, product_details, features,
+                    skin_type, allergies, ml_prediction, ml_confidence
+                )
+                predict_cache.set(cache_key, result)
+                results[idx] = dict(result, index=idx)
+            except Exception as e:
+                results[idx] = {'success': False, 'index': idx, 'error': str(e)}
+        
+        failed = sum(1 for r in results if not r['success'])
+        
+        return jsonify({
             'success': True,
-            'product_name': product_name,
-            'prediction': {
-                'safe': safe,
-                'risk_score': round(risk_score, 1),
-                'risk_category': risk_category,
-                'confidence': ml_confidence if ml_confidence else 87.5,
-                'model_used': 'ML' if MODELS_LOADED and ml_prediction else 'Rule-based'
-            },
-            'analysis': {
-                'total_ingredients': len(ingredients),
-                'high_risk_count': len(high_risk),
-                'moderate_risk_count': len(moderate_risk),
-                'beneficial_count': len(beneficial),
-                'high_risk_ingredients': high_risk,
-                'beneficial_ingredients': beneficial,
-                'all_ingredients': ingredients
-            },
-            'allergy_warnings': allergy_warnings,
-            'skin_type_warnings': skin_warnings,
-            'recommendations': recommendations,
-            'skin_type_compatibility': '✅ Suitable' if not skin_warnings else '⚠️ Use with caution'
-        }
+            'count': len(results),
+            'failed': failed,
+            'results': results
+        })
+    
+    except Exception as e:
+        print(f"Error in predict_batch: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/search', methods=['GET'])
+def product_search():
+    try:
+        query = request.args.get('q', '').strip()
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+        
+        if not query:
+            return jsonify({'error': 'Query parameter q is required'}), 400
+        
+        results = []
+        for doc_id, product, score in search_products(query, limit):
+            results.append({
+                'id': doc_id,
+                'name': product['name'],
+                'brand': product.get('brand', ''),
+                'category': product.get('category', ''),
+                'has_ingredients': bool(product.get('ingredients')),
+                'source': product.get('source', ''),
+                'score': round(score, 3)
+            })
         
-        if product_details:
-            response_data['product_details'] = product_details
+        return jsonify({
+            'success': True,
+            'query': query,
+            'results': results,
+            'count': len(results)
+        })
+    
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/products/<int:product_id>/alternatives', methods=['GET'])
+def product_alternatives(product_id):
+    try:
+        k = min(max(int(request.args.get('k', 5)), 1), 50)
+        
+        if not 0 <= product_id < len(PRODUCT_CATALOG):
+            return jsonify({'error': 'Product not found'}), 404
+        
+        product = PRODUCT_CATALOG.products[product_id]
+        if not product.get('ingredients'):
+            return jsonify({'error': 'Product has no ingredient list to compare'}), 422
+        
+        index = ALTERNATIVES_INDEX
+        if index is None:
+            return jsonify({'error': 'Alternatives index is still being built, please retry shortly'}), 503, {'Retry-After': '5'}
+        
+        product_risk = index.risk_score(product_id)
+        if np.isnan(product_risk):
+            # Nothing in the ingredient text could be scored (e.g. only 1-2 character tokens)
+            return jsonify({'error': 'Product has no ingredient list to compare'}), 422
+        
+        alternatives = []
+        for doc_id, similarity, rec_score in index.query(product_id, k):
+            alternative = PRODUCT_CATALOG.products[doc_id]
+            alt_risk = index.risk_score(doc_id)
+            alternatives.append({
+                'id': doc_id,
+                'name': alternative['name'],
+                'brand': alternative.get('brand', ''),
+                'category': alternative.get('category', ''),
+                'risk_score': alt_risk,
+                'risk_category': risk_category(alt_risk),
+                'similarity': round(similarity, 4),
+                'recommendation_score': round(rec_score, 4),
+                'risk_reduction': product_risk - alt_risk
+            })
         
-        return jsonify(response_data)
+        return jsonify({
+            'success': True,
+            'product': {
+                'id': product_id,
+                'name': product['name'],
+                'brand': product.get('brand', ''),
+                'risk_score': product_risk,
+                'risk_category': risk_category(product_risk)
+            },
+            'alternatives': alternatives,
+            'count': len(alternatives)
+        })
     
+    except ValueError:
+        return jsonify({'error': 'k must be an integer'}), 400
     except Exception as e:
-        print(f"Error in predict: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/recommend', methods=['POST', 'OPTIONS'])
@@ -578,16 +1290,113 @@ def recommend():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+image_preprocessor = ImagePreprocessor(
+    max_edge=IMAGE_MAX_EDGE,
+    max_bytes=IMAGE_MAX_BYTES,
+    max_pixels=IMAGE_MAX_PIXELS,
+    max_upload_bytes=IMAGE_MAX_UPLOAD_BYTES,
+    fmt=IMAGE_FORMAT,
+    quality=IMAGE_QUALITY
+)
+
+# Re-uploads of the same photo with the same symptoms reuse the earlier Gemini analysis
+image_analysis_cache = ImageAnalysisCache(IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL, IMAGE_CACHE_MAX_DISTANCE)
+
+# Vision calls run here instead of on the request thread; clients poll or stream the result.
+# Job state goes to a SQLite file so any worker process on this host can answer for a job.
+def create_image_jobs():
+    store = None
+    if IMAGE_JOB_STORE:
+        try:
+            store = JobStore(IMAGE_JOB_STORE)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not open job store {IMAGE_JOB_STORE}, jobs are only visible to this process - {e}")
+    return JobQueue(IMAGE_JOB_WORKERS, IMAGE_JOB_MAX_DEPTH, IMAGE_JOB_TTL, IMAGE_JOB_MAX_RUNTIME, store, name='image')
+
+image_jobs = create_image_jobs() if IMAGE_JOBS else None
+
+def read_allergy_request():
+    """(symptoms, suspected, image bytes) from a multipart upload or a JSON body with base64"""
+    try:
+        if request.mimetype == 'multipart/form-data':
+            # Werkzeug spools the file part to disk as it arrives instead of buffering one huge string
+            upload = request.files.get('image')
+            image_bytes = upload.stream.read(IMAGE_MAX_UPLOAD_BYTES + 1) if upload else None
+            fields = request.form
+        elif request.is_json:
+            fields = request.get_json(silent=True)
+            if not isinstance(fields, dict):
+                raise ImageRejected("Request body must be a JSON object")
+            image_bytes = None
+            if fields.get('image'):
+                try:
+                    image_bytes = base64.b64decode(fields['image'])
+                except ValueError:
+                    raise ImageRejected("Image is not valid base64")
+        else:
+            raise UploadUnsupported("Send multipart/form-data or application/json")
+    except RequestEntityTooLarge:
+        # Raised by Werkzeug past MAX_CONTENT_LENGTH (base64 inflates the image by 4/3)
+        raise ImageTooLarge(f"Request body is larger than {IMAGE_MAX_UPLOAD_BYTES // 1_000_000} MB")
+    
+    return (fields.get('symptoms', '').lower(),
+            fields.get('suspected_ingredients', '').lower(),
+            image_bytes or None)
+
+def analyze_image(prepared_image, symptoms, suspected, text_key, hashes):
+    """Gemini vision analysis; failures come back as a canned image_analysis, never an exception"""
+    try:
+        # Only the per-request context goes with the image; instructions are in the model
+        symptom_context = f"User reported symptoms: {symptoms}" if symptoms else "No symptoms described"
+        suspected_context = f"Suspected ingredients: {suspected}" if suspected else ""
+        prompt = f"Analyze this skin condition image carefully.\n{symptom_context}\n{suspected_context}"
+        
+        # Get AI analysis
+        response_text = llm_executor.call(allergy_llm.generate, [prompt, prepared_image.as_part()])
+        
+        try:
+            image_analysis = image_analysis_output.parse(response_text)
+        except OutputInvalid as e:
+            # Ask for the JSON again as a text-only call rather than paying for the image twice
+            print(f"⚠️ Image analysis not usable ({e}), asking Gemini to repair it")
+            response_text = llm_executor.call(allergy_llm.generate, image_analysis_output.repair_prompt(response_text, e))
+            image_analysis = image_analysis_output.parse(response_text, reprompted=True)
+        
+        print(f"✅ Gemini analysis successful: {image_analysis['type']}")
+        image_analysis_cache.set(text_key, hashes, image_analysis)
+        
+    except OutputInvalid as e:
+        print(f"JSON parsing error: {e}")
+        print(f"Response was: {response_text}")
+        image_analysis = {
+            'severity': 'moderate',
+            'type': 'analysis incomplete',
+            'confidence': 50,
+            'observations': ['Image received but could not be fully analyzed', 'Please consult a dermatologist'],
+            'recommendations': ['Seek professional medical advice', 'Avoid scratching affected area']
+        }
+    except Exception as e:
+        print(f"Gemini API error: {e}")
+        image_analysis = {
+            'severity': 'unknown',
+            'type': 'analysis failed',
+            'confidence': 0,
+            'observations': ['Could not analyze image - API error'],
+            'recommendations': ['Please try again', 'Consult a dermatologist for accurate diagnosis']
+        }
+
+    return image_analysis
+
 @app.route('/api/allergy/analyze', methods=['POST', 'OPTIONS'])
 def analyze_allergy():
     if request.method == 'OPTIONS':
         return '', 204
         
     try:
-        data = request.get_json()
-        symptoms = data.get('symptoms', '').lower()
-        suspected = data.get('suspected_ingredients', '').lower()
-        image_data = data.get('image', None)
+        symptoms, suspected, image_data = read_allergy_request()
+        
+        # Downscaled and re-encoded before anything else touches it
+        prepared_image = image_preprocessor.prepare(image_data) if image_data and allergy_llm else None
         
         # Validate: either symptoms or image must be provided
         if not symptoms and not image_data:
@@ -596,91 +1405,48 @@ def analyze_allergy():
         # Analyze symptoms
         likely_culprits = []
         if symptoms:
-            for symptom, ingredients in ALLERGY_SYMPTOMS.items():
+            culprit_mask = 0
+            for symptom, mask in SYMPTOM_MASKS.items():
                 if symptom in symptoms:
-                    likely_culprits.extend(ingredients)
-            likely_culprits = list(set(likely_culprits))
+                    culprit_mask |= mask
+            likely_culprits = INGREDIENTS.decode(culprit_mask)
         
         # Get remedies
         remedies_list = []
         for culprit in likely_culprits:
-            if culprit in REMEDIES:
+            remedy = REMEDY_BY_ID.get(INGREDIENTS.id_of(culprit))
+            if remedy:
                 remedies_list.append({
                     'ingredient': culprit,
-                    'remedy': REMEDIES[culprit]
+                    'remedy': remedy
                 })
         
         # Real AI image analysis using Gemini
         image_analysis = None
-        if image_data and GEMINI_API_KEY:
-            try:
-                # Decode Base64 to image
-                image_bytes = base64.b64decode(image_data)
-                image = Image.open(io.BytesIO(image_bytes))
-                
-                # Initialize Gemini model
-                model = genai.GenerativeModel('gemini-2.5-flash')
-                
-                # Create analysis prompt
-                symptom_context = f"User reported symptoms: {symptoms}" if symptoms else "No symptoms described"
-                suspected_context = f"Suspected ingredients: {suspected}" if suspected else ""
-                
-                prompt = f"""
-                Analyze this skin condition image carefully.
-                {symptom_context}
-                {suspected_context}
-                
-                Provide a detailed dermatological analysis in this exact JSON format:
-                {{
-                    "severity": "mild/moderate/severe",
-                    "type": "condition name (e.g., contact dermatitis, eczema, allergic reaction)",
-                    "confidence": 85,
-                    "observations": ["observation 1", "observation 2", "observation 3"],
-                    "recommendations": ["recommendation 1", "recommendation 2", "recommendation 3"]
-                }}
-                
-                Be specific about visible symptoms like redness, swelling, texture changes, distribution pattern, etc.
-                Provide practical, actionable recommendations.
-                ONLY return valid JSON, no other text.
-                """
-                
-                # Get AI analysis
-                response = model.generate_content([prompt, image])
-                
-                # Parse response
-                response_text = response.text.strip()
-                
-                # Clean up markdown code blocks if present
-                if '```json' in response_text:
-                    response_text = response_text.split('```json')[1].split('```')[0].strip()
-                elif '```' in response_text:
-                    response_text = response_text.split('```')[1].split('```')[0].strip()
-                
-                # Parse JSON
-                image_analysis = json.loads(response_text)
-                
-                print(f"✅ Gemini analysis successful: {image_analysis['type']}")
-                
-            except json.JSONDecodeError as e:
-                print(f"JSON parsing error: {e}")
-                print(f"Response was: {response_text}")
-                image_analysis = {
-                    'severity': 'moderate',
-                    'type': 'analysis incomplete',
-                    'confidence': 50,
-                    'observations': ['Image received but could not be fully analyzed', 'Please consult a dermatologist'],
-                    'recommendations': ['Seek professional medical advice', 'Avoid scratching affected area']
-                }
-            except Exception as e:
-                print(f"Gemini API error: {e}")
-                image_analysis = {
-                    'severity': 'unknown',
-                    'type': 'analysis failed',
-                    'confidence': 0,
-                    'observations': ['Could not analyze image - API error'],
-                    'recommendations': ['Please try again', 'Consult a dermatologist for accurate diagnosis']
+        image_job = None
+        if prepared_image is not None:
+            text_key = (normalize_text(symptoms), normalize_text(suspected))
+            hashes = image_hashes(prepared_image.image)
+            image_analysis = image_analysis_cache.get(text_key, hashes)
+            if image_analysis is not None:
+                print("✅ Image analysis reused from cache")
+        
+        if prepared_image is not None and image_analysis is None:
+            if image_jobs is not None:
+                try:
+                    job = image_jobs.submit(analyze_image, prepared_image, symptoms, suspected, text_key, hashes)
+                except QueueFull:
+                    # Backpressure: tell the client to come back rather than queue without bound
+                    return jsonify({'error': 'Image analysis is busy, please retry shortly'}), 503, {'Retry-After': '5'}
+                image_job = {
+                    'id': job.id,
+                    'status': job.status,
+                    'status_url': f"/api/allergy/jobs/{job.id}",
+                    'stream_url': f"/api/allergy/jobs/{job.id}/stream"
                 }
-        elif image_data and not GEMINI_API_KEY:
+            else:
+                image_analysis = analyze_image(prepared_image, symptoms, suspected, text_key, hashes)
+        elif image_data and not allergy_llm:
             image_analysis = {
                 'severity': 'unknown',
                 'type': 'API key missing',
@@ -701,7 +1467,7 @@ def analyze_allergy():
                 'remedy': 'Apply cool compress and use gentle, fragrance-free products'
             }]
         
-        return jsonify({
+        result = {
             'success': True,
             'symptoms_detected': symptoms.split(',') if symptoms else ['analyzed from image'],
             'likely_culprits': likely_culprits if likely_culprits else ['See image analysis for details'],
@@ -713,37 +1479,112 @@ def analyze_allergy():
                 '💧 Use gentle, fragrance-free products',
                 '👨‍⚕️ Consult a dermatologist if symptoms persist or worsen'
             ]
-        })
+        }
+        if image_job:
+            # Symptom results now, image analysis later from the job
+            result['image_job'] = image_job
+            return jsonify(result), 202
+        return jsonify(result)
     
+    except ImageRejected as e:
+        print(f"⚠️ Image rejected: {e}")
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         print(f"Error in analyze_allergy: {e}")
         return jsonify({'error': str(e)}), 500
     
     
+def image_job_payload(job):
+    payload = {'success': True, 'job_id': job.id, 'status': job.status, 'image_analysis': job.result}
+    if job.status == 'failed':
+        payload['error'] = job.error
+    return payload
+
+def image_job_events(job):
+    yield ": stream open\n\n"
+    yield sse_event('status', {'job_id': job.id, 'status': job.status})
+    while not image_jobs.wait(job, 15):
+        yield ": keep-alive\n\n"  # stops proxies from closing an idle stream
+    yield sse_event('done', image_job_payload(job))
+
+@app.route('/api/allergy/jobs/<job_id>', methods=['GET'])
+def get_image_job(job_id):
+    job = image_jobs.get(job_id) if image_jobs is not None else None
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(image_job_payload(job))
+
+@app.route('/api/allergy/jobs/<job_id>/stream', methods=['GET'])
+def stream_image_job(job_id):
+    job = image_jobs.get(job_id) if image_jobs is not None else None
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return Response(image_job_events(job), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Per-product rating summaries, updated by add_review; rebuilt from the table in the background
+review_summaries = ReviewSummaries()
+
+REVIEW_FIELDS = ('id', 'user_id', 'product_name', 'rating', 'review_text', 'skin_type', 'created_at')
+
+def reconcile_review_summaries():
+    while True:
+        try:
+            review_summaries.rebuild(storage.iter_review_ratings())
+            print(f"✅ Review summaries rebuilt from {review_summaries.last_rebuild_rows} reviews")
+        except Exception as e:
+            print(f"⚠️ Warning: Could not rebuild review summaries - {e}")
+        time.sleep(REVIEW_SUMMARY_RECONCILE_SECONDS)
+
+if DATABASE_CONNECTED:
+    threading.Thread(target=reconcile_review_summaries, name='review-summary-reconcile', daemon=True).start()
+
+def encode_review_cursor(review):
+    raw = json.dumps([review['created_at'], review['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_review_cursor(cursor):
+    # Both values end up in a query filter, so only a real timestamp and integer id get through
+    try:
+        created_at, review_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at).isoformat(), int(review_id)
+    except Exception:
+        raise ValueError('invalid cursor')
+
+def parse_review_fields(fields):
+    if not fields:
+        return list(REVIEW_FIELDS)
+    selected = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in selected if field not in REVIEW_FIELDS]
+    if unknown or not selected:
+        raise ValueError(f"fields must be a comma-separated subset of {', '.join(REVIEW_FIELDS)}")
+    return selected
+
 @app.route('/api/reviews', methods=['POST', 'OPTIONS'])
 @token_required
 def add_review(current_user):
     if request.method == 'OPTIONS':
         return '', 204
         
-    if not SUPABASE_CONNECTED:
+    if not DATABASE_CONNECTED:
         return jsonify({'error': 'Database not connected'}), 503
         
     try:
         data = request.get_json()
         
-        response = supabase.table('reviews').insert({
+        review = storage.add_review({
             'user_id': current_user,
             'product_name': data.get('product_name'),
             'rating': data.get('rating'),
             'review_text': data.get('review_text'),
             'skin_type': data.get('skin_type'),
             'created_at': datetime.now().isoformat()
-        }).execute()
+        })
+        review_summaries.add(review)
         
         return jsonify({
             'success': True,
-            'review': response.data[0]
+            'review': review
         })
     
     except Exception as e:
@@ -751,21 +1592,51 @@ def add_review(current_user):
 
 @app.route('/api/reviews/<product_name>', methods=['GET'])
 def get_reviews(product_name):
-    if not SUPABASE_CONNECTED:
-        return jsonify({'success': True, 'reviews': [], 'count': 0})
+    """Newest first, one page at a time; pass next_cursor back as ?cursor= for the next page"""
+    try:
+        limit = min(max(int(request.args.get('limit', REVIEWS_PAGE_SIZE)), 1), REVIEWS_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    try:
+        fields = parse_review_fields(request.args.get('fields'))
+        cursor = request.args.get('cursor')
+        after = decode_review_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not DATABASE_CONNECTED:
+        return jsonify({'success': True, 'reviews': [], 'count': 0, 'next_cursor': None,
+                        'summary': review_summaries.get(product_name)})
         
     try:
-        response = supabase.table('reviews').select('*').eq('product_name', product_name).execute()
+        # The cursor needs created_at and id even when the caller didn't ask for them
+        columns = fields + [field for field in ('created_at', 'id') if field not in fields]
+        # One extra row tells us whether there is a next page
+        rows = storage.list_reviews(product_name, columns, limit + 1, after)
+        
+        page = rows[:limit]
+        next_cursor = encode_review_cursor(page[-1]) if len(rows) > limit else None
+        reviews = [{field: row.get(field) for field in fields} for row in page]
         
         return jsonify({
             'success': True,
-            'reviews': response.data,
-            'count': len(response.data)
+            'reviews': reviews,
+            'count': len(reviews),
+            'next_cursor': next_cursor,
+            'summary': review_summaries.get(product_name)
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/reviews/<product_name>/summary', methods=['GET'])
+def get_review_summary(product_name):
+    return jsonify({
+        'success': True,
+        'product_name': product_name,
+        'summary': review_summaries.get(product_name)
+    })
+
 # @app.route('/api/chat', methods=['POST', 'OPTIONS'])
 # def chat():
     if request.method == 'OPTIONS':
@@ -803,6 +1674,38 @@ def get_reviews(product_name):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Scores are written in bulk by a background flusher instead of one round-trip per game
+if DATABASE_CONNECTED:
+    score_writer = WriteBehindBuffer(
+        storage.add_game_scores,
+        max_rows=SCORE_FLUSH_ROWS,
+        interval_ms=SCORE_FLUSH_MS,
+        max_buffer=SCORE_BUFFER_MAX,
+        spill_path=SCORE_SPILL_PATH,
+        max_attempts=SCORE_RETRY_ATTEMPTS,
+        backoff_ms=SCORE_RETRY_BACKOFF_MS,
+        is_rejection=storage.is_rejection,
+        name='game-scores'
+    )
+    atexit.register(score_writer.close)
+else:
+    score_writer = None
+
+# Best score per user and game_type, served from memory; rebuilt from the table in the background
+leaderboards = Leaderboards(LEADERBOARD_GRACE_SECONDS)
+
+def reconcile_leaderboards():
+    while True:
+        try:
+            leaderboards.rebuild(storage.iter_game_scores())
+            print(f"✅ Leaderboards rebuilt from {leaderboards.last_rebuild_rows} scores")
+        except Exception as e:
+            print(f"⚠️ Warning: Could not rebuild leaderboards - {e}")
+        time.sleep(LEADERBOARD_RECONCILE_SECONDS)
+
+if DATABASE_CONNECTED:
+    threading.Thread(target=reconcile_leaderboards, name='leaderboard-reconcile', daemon=True).start()
+
 @app.route('/api/game/score', methods=['POST', 'OPTIONS'])
 def save_game_score():
     if request.method == 'OPTIONS':
@@ -814,20 +1717,32 @@ def save_game_score():
         score = data.get('score', 0)
         game_type = data.get('game_type', 'balloon_hit')
         
-        if SUPABASE_CONNECTED:
-            try:
-                supabase.table('game_scores').insert({
-                    'user_id': user_id,
-                    'score': score,
-                    'game_type': game_type,
-                    'created_at': datetime.now().isoformat()
-                }).execute()
-            except:
-                pass
+        # Checked here, since one bad row would otherwise fail a whole bulk insert later
+        if isinstance(score, float) and score.is_integer():
+            score = int(score)
+        if not isinstance(score, int) or isinstance(score, bool) or not 0 <= score <= SCORE_MAX:
+            return jsonify({'error': f'score must be a whole number between 0 and {SCORE_MAX}'}), 400
+        if not isinstance(game_type, str) or not 0 < len(game_type) <= 50:
+            return jsonify({'error': 'game_type must be a string of 1 to 50 characters'}), 400
+        if not isinstance(user_id, (str, int)) or isinstance(user_id, bool) or len(str(user_id)) > 100:
+            return jsonify({'error': 'user_id must be a string of at most 100 characters'}), 400
+        
+        created_at = datetime.now().isoformat()
+        
+        if score_writer is not None:
+            score_writer.add({
+                'user_id': user_id,
+                'score': score,
+                'game_type': game_type,
+                'created_at': created_at
+            })
+        
+        new_best = leaderboards.record(game_type, user_id, score, created_at)
         
         return jsonify({
             'success': True,
-            'score': score
+            'score': score,
+            'new_best': new_best
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -835,17 +1750,25 @@ def save_game_score():
 @app.route('/api/game/leaderboard', methods=['GET'])
 def get_leaderboard():
     try:
-        if SUPABASE_CONNECTED:
-            response = supabase.table('game_scores')\
-                .select('*')\
-                .order('score', desc=True)\
-                .limit(10)\
-                .execute()
-            
-            return jsonify({
+        game_type = request.args.get('game_type', 'balloon_hit')
+        limit = min(max(int(request.args.get('limit', 10)), 1), LEADERBOARD_MAX_LIMIT)
+        user_id = request.args.get('user_id')
+        
+        top, me, version = leaderboards.view(game_type, limit, user_id)
+        if top or DATABASE_CONNECTED:
+            result = {
                 'success': True,
-                'leaderboard': response.data
-            })
+                'game_type': game_type,
+                'leaderboard': top
+            }
+            if user_id is not None:
+                result['me'] = me
+            
+            # Unchanged boards cost the client a 304 and no body
+            response = jsonify(result)
+            response.set_etag(hashlib.md5(f"{game_type}|{limit}|{user_id}|{version}".encode()).hexdigest())
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
         else:
             # Return mock data if database not connected
             return jsonify({
@@ -856,190 +1779,124 @@ def get_leaderboard():
                     {'user_id': 'Demo Player 3', 'score': 210}
                 ]
             })
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
     
-@app.route('/api/chat', methods=['POST', 'OPTIONS'])
-def chat():
-    if request.method == 'OPTIONS':
-        return '', 204
-        
-    try:
-        data = request.get_json()
-        message = data.get('message', '').lower()
-        original_message = data.get('message', '')  # Keep original case
-        user_id = data.get('user_id', 'guest')
-        
-        print(f"📨 Chat request: {message}")
-        print(f"🔑 Gemini available: {bool(GEMINI_API_KEY)}")
-        
-        # Build context from our knowledge base
-        context_data = {
-            'matched_products': [],
-            'matched_ingredients': [],
-            'skin_type_info': None,
-            'symptoms_info': []
-        }
-        
-        # Check products
-        for product_key, product_info in PRODUCT_DATABASE.items():
-            if product_key in message or any(word in message for word in product_key.split()):
-                context_data['matched_products'].append(product_info)
-        
-        # Check ingredients
-        for ingredient, ing_data in INGREDIENT_DATA.items():
-            if ingredient in message:
-                context_data['matched_ingredients'].append({
-                    'name': ingredient,
-                    'data': ing_data
-                })
-        
-        # Check skin types
-        for skin_type, concerns in SKIN_TYPE_CONCERNS.items():
-            if skin_type in message:
+def build_chat_context(message):
+    # Knowledge-base matches, in the order the message mentions them
+    context_data = {
+        'matched_products': [],
+        'matched_ingredients': [],
+        'skin_type_info': None,
+        'symptoms_info': [],
+        'terms': tuple(CHAT_MATCHER.find(message)),
+        'memory': ''
+    }
+    
+    for kind, key in context_data['terms']:
+        if kind == 'product':
+            context_data['matched_products'].append(PRODUCT_DATABASE[key])
+        elif kind == 'ingredient':
+            context_data['matched_ingredients'].append({
+                'name': INGREDIENTS.canonical(key),
+                'data': INGREDIENT_DATA[key]
+            })
+        elif kind == 'skin_type':
+            if context_data['skin_type_info'] is None:
                 context_data['skin_type_info'] = {
-                    'type': skin_type,
-                    'avoid': concerns
+                    'type': key,
+                    'avoid': INGREDIENTS.decode(SKIN_TYPE_MASKS[key])
                 }
-        
-        # Check symptoms
-        for symptom, culprits in ALLERGY_SYMPTOMS.items():
-            if symptom in message:
-                context_data['symptoms_info'].append({
-                    'symptom': symptom,
-                    'culprits': culprits
-                })
-        
-        # Try Gemini AI first
-        if GEMINI_API_KEY:
-            try:
-                print("🤖 Attempting Gemini response...")
-                model = genai.GenerativeModel('gemini-2.5-flash')
-                
-                # Build comprehensive system prompt
-                system_prompt = """You are Dermamon 🧴, a friendly skincare expert AI assistant.
+        elif kind == 'symptom':
+            context_data['symptoms_info'].append({
+                'symptom': key,
+                'culprits': ALLERGY_SYMPTOMS[key]
+            })
+    
+    return context_data
 
-YOUR CORE KNOWLEDGE:
+# Gemini chat answers, keyed by normalized message + matched knowledge-base terms
+chat_cache = LRUTTLCache(CHAT_CACHE_SIZE, CHAT_CACHE_TTL)
+chat_flights = SingleFlight()
 
-**PRODUCTS YOU KNOW:**
-1. CeraVe Moisturizing Cream - For dry/sensitive skin, contains ceramides & hyaluronic acid
-2. CeraVe Hydrating Cleanser - Gentle cleanser for dry/normal/sensitive skin
-3. Neutrogena Hydro Boost Water Gel - Lightweight hydration for all skin types
-4. La Roche-Posay Toleriane - For sensitive skin with niacinamide & ceramides
-5. The Ordinary Niacinamide 10% + Zinc 1% - For oily/acne-prone skin
-6. Cetaphil Oil Control - For oily skin
-7. Paula's Choice BHA - Salicylic acid exfoliant for acne
-8. Vanicream Gentle Cleanser - Ultra-gentle for sensitive skin
-9. Aveeno Ultra-Calming - Soothes sensitive/irritated skin
+def chat_cache_key(message, context_data):
+    return (' '.join(message.lower().split()), context_data['terms'], context_data['memory'])
 
-**KEY INGREDIENTS:**
-- Niacinamide: Brightening, oil control, pore minimizing (safe, risk 10/100)
-- Hyaluronic Acid: Holds 1000x its weight in water (very safe, risk 5/100)
-- Ceramides: Repair skin barrier, essential for dry/damaged skin (safe, risk 10/100)
-- Salicylic Acid: Unclogs pores, treats acne (moderate risk 30/100)
-- Retinol: Anti-aging but can irritate (higher risk 40/100)
-- Vitamin C: Brightening, antioxidant (low risk 15/100)
-- Glycerin: Humectant, draws moisture (very safe, risk 5/100)
+# Conversation memory per (user, browser session); re-set every turn so the TTL is an idle timeout
+chat_sessions = LRUTTLCache(CHAT_SESSIONS_MAX, CHAT_SESSION_IDLE_TTL)
 
-**HARMFUL TO AVOID:**
-- Parabens (risk 70/100): Hormone disruptors
-- Sulfates/SLS (risk 65/100): Harsh, strip natural oils
-- Fragrance/Parfum (risk 60/100): Common allergen
-- Alcohol Denat (risk 50/100): Very drying
+def get_chat_session(user_id, session_id):
+    if not session_id:
+        return None, None
+    key = (str(user_id), str(session_id)[:64])
+    session = chat_sessions.get(key)
+    if session is None:
+        session = ChatSession(CHAT_MEMORY_TURNS)
+    return key, session
 
-**SKIN TYPE RECOMMENDATIONS:**
-- Dry Skin: Hyaluronic acid, ceramides, glycerin, shea butter. Avoid alcohol & sulfates.
-  Best: CeraVe Moisturizing Cream, La Roche-Posay Toleriane, Neutrogena Hydro Boost
-  
-- Oily Skin: Niacinamide, salicylic acid, lightweight gels. Avoid heavy oils.
-  Best: The Ordinary Niacinamide, Neutrogena Hydro Boost, Cetaphil Oil Control, Paula's Choice BHA
-  
-- Sensitive Skin: Fragrance-free, minimal ingredients, soothing. Avoid fragrance, alcohol, sulfates.
-  Best: La Roche-Posay Toleriane, CeraVe Hydrating Cleanser, Vanicream, Aveeno Ultra-Calming
-  
-- Acne-Prone: Salicylic acid, niacinamide, benzoyl peroxide. Avoid coconut oil.
-  Best: The Ordinary Niacinamide, Paula's Choice BHA, CeraVe SA Cleanser
+def remember_chat_turn(session_key, session, original_message, context_data, bot_response):
+    if session is None:
+        return
+    
+    allergies = []
+    for text in extract_allergy_text(original_message.lower()):
+        allergies += [name for name in get_allergen_profile(text).names() if len(name.split()) <= 3]
+    skin_type = context_data['skin_type_info']['type'] if context_data['skin_type_info'] else None
+    
+    session.update_profile(skin_type, allergies, [p['name'] for p in context_data['matched_products']])
+    session.add_turn(original_message, bot_response)
+    chat_sessions.set(session_key, session)
 
-**PRODUCT-SPECIFIC INFO:**
-- Vaseline (Petrolatum): EXCELLENT for dry skin as an occlusive (locks in moisture). NOT recommended for oily/acne-prone skin as it's very heavy and can clog pores.
+def generate_chat_answer(message, original_message, context_data):
+    bot_response = llm_executor.call(chat_llm.generate, build_chat_prompt(original_message, context_data))
+    bot_response += chat_feature_hint(message, bot_response)
+    return bot_response
 
-**YOUR PERSONALITY:**
-- Friendly and enthusiastic about skincare
-- Use 1-2 emojis per response
-- Keep responses concise (3-5 sentences)
-- Be specific with product names when asked
-- Always back up recommendations with reasoning
-- Encourage trying the "Product Analysis" feature for detailed checks
+def build_chat_prompt(original_message, context_data):
+    # The system prompt lives in the model; only per-message context is sent
+    context_addon = ""
+    if context_data['matched_products']:
+        context_addon += "\n**RELEVANT PRODUCTS USER MIGHT BE ASKING ABOUT:**\n"
+        for prod in context_data['matched_products'][:2]:
+            context_addon += f"- {prod['name']}: {', '.join(prod['suitable_skin_types'])} skin\n"
+    
+    if context_data['skin_type_info']:
+        st = context_data['skin_type_info']
+        context_addon += f"\n**USER ASKED ABOUT {st['type'].upper()} SKIN**\n"
+        context_addon += f"Should avoid: {', '.join(st['avoid'][:3])}\n"
+    
+    # Memory is capped when rendered; the message gets whatever is left of the budget
+    turn = "\n\nUser: {}\n\nDermamon (respond naturally and specifically):"
+    remaining = CHAT_PROMPT_TOKEN_BUDGET - estimate_tokens(context_data['memory'] + context_addon + turn)
+    return context_data['memory'] + context_addon + turn.format(clip_to_tokens(original_message, remaining))
 
-**RESPONSE RULES:**
-- If asked for "options" or "more" products, give 3-5 specific product names
-- If asked about a product, explain its benefits and suitability
-- If asked about skin type, recommend specific products for that type
-- Be conversational but informative
-- Don't just repeat the same response - expand with new information
-"""
+def chat_feature_hint(message, bot_response):
+    # Add feature suggestion if relevant
+    if any(word in message for word in ['analyze', 'check', 'ingredients', 'safe']):
+        if 'Product Analysis' not in bot_response:
+            return "\n\n💡 Want a detailed safety check? Click 'Product Analysis'!"
+    return ""
 
-                # Add context from our database if relevant
-                context_addon = ""
-                if context_data['matched_products']:
-                    context_addon += "\n**RELEVANT PRODUCTS USER MIGHT BE ASKING ABOUT:**\n"
-                    for prod in context_data['matched_products'][:2]:
-                        context_addon += f"- {prod['name']}: {', '.join(prod['suitable_skin_types'])} skin\n"
-                
-                if context_data['skin_type_info']:
-                    st = context_data['skin_type_info']
-                    context_addon += f"\n**USER ASKED ABOUT {st['type'].upper()} SKIN**\n"
-                    context_addon += f"Should avoid: {', '.join(st['avoid'][:3])}\n"
-                
-                full_prompt = f"{system_prompt}\n{context_addon}\n\nUser: {original_message}\n\nDermamon (respond naturally and specifically):"
-                
-                response = model.generate_content(full_prompt)
-                bot_response = response.text.strip()
-                
-                # Add feature suggestion if relevant
-                if any(word in message for word in ['analyze', 'check', 'ingredients', 'safe']):
-                    if 'Product Analysis' not in bot_response:
-                        bot_response += "\n\n💡 Want a detailed safety check? Click 'Product Analysis'!"
-                
-                print(f"✅ Gemini response generated successfully")
-                
-                return jsonify({
-                    'success': True,
-                    'response': bot_response,
-                    'powered_by': 'Gemini AI'
-                })
-                
-            except Exception as e:
-                print(f"❌ Gemini error: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                # Continue to fallback
-        else:
-            print("⚠️ Gemini API key not available, using fallback")
-        
-        # Fallback responses
-        print("📝 Using fallback responses")
-        
-        # Check for product match first
-        if context_data['matched_products']:
-            prod = context_data['matched_products'][0]
-            bot_response = f"**{prod['name']}** is great! 🧴\n\n"
-            bot_response += f"✨ Perfect for {', '.join(prod['suitable_skin_types'])} skin\n"
-            bot_response += f"🔑 Key ingredients: {', '.join(prod['ingredients'].split(',')[:3])}\n"
-            bot_response += f"🎯 Addresses: {', '.join(prod['concerns'][:2])}\n\n"
-            bot_response += "Want a full ingredient analysis? Click 'Product Analysis'!"
-            
-            return jsonify({
-                'success': True,
-                'response': bot_response,
-                'powered_by': 'Dermamon Database'
-            })
-        
-        # Specific product recommendations
-        if any(word in message for word in ['option', 'more', 'recommend', 'suggest', 'product name']):
-            if 'oily' in message or 'acne' in message:
-                bot_response = """For oily/acne-prone skin, try these: 🎯
+def chat_fallback(message, context_data):
+    # Rule-based answers: (response, powered_by)
+    # Check for product match first
+    if context_data['matched_products']:
+        prod = context_data['matched_products'][0]
+        bot_response = f"**{prod['name']}** is great! 🧴\n\n"
+        bot_response += f"✨ Perfect for {', '.join(prod['suitable_skin_types'])} skin\n"
+        bot_response += f"🔑 Key ingredients: {', '.join(prod['ingredients'].split(',')[:3])}\n"
+        bot_response += f"🎯 Addresses: {', '.join(prod['concerns'][:2])}\n\n"
+        bot_response += "Want a full ingredient analysis? Click 'Product Analysis'!"
+        
+        return bot_response, 'Dermamon Database'
+    
+    # Specific product recommendations
+    if any(word in message for word in ['option', 'more', 'recommend', 'suggest', 'product name']):
+        if 'oily' in message or 'acne' in message:
+            bot_response = """For oily/acne-prone skin, try these: 🎯
 
 1. **The Ordinary Niacinamide 10% + Zinc 1%** - Controls oil, minimizes pores
 2. **Neutrogena Hydro Boost Water Gel** - Lightweight, oil-free hydration
@@ -1048,9 +1905,9 @@ YOUR CORE KNOWLEDGE:
 5. **La Roche-Posay Effaclar** - Oil control & acne treatment
 
 Want to check if any of these are safe for you? Use 'Product Analysis'! 💡"""
-            
-            elif 'dry' in message:
-                bot_response = """For dry skin, these are perfect: 💧
+        
+        elif 'dry' in message:
+            bot_response = """For dry skin, these are perfect: 💧
 
 1. **CeraVe Moisturizing Cream** - Rich, with ceramides & hyaluronic acid
 2. **La Roche-Posay Toleriane** - Gentle, repairs barrier
@@ -1059,9 +1916,9 @@ Want to check if any of these are safe for you? Use 'Product Analysis'! 💡"""
 5. **Aveeno Eczema Therapy** - Soothes very dry skin
 
 All of these are dermatologist-recommended! Want detailed analysis? 🔍"""
-            
-            elif 'sensitive' in message:
-                bot_response = """For sensitive skin, use these gentle options: 🛡️
+        
+        elif 'sensitive' in message:
+            bot_response = """For sensitive skin, use these gentle options: 🛡️
 
 1. **La Roche-Posay Toleriane** - Minimal ingredients, very gentle
 2. **Vanicream Gentle Cleanser** - Fragrance-free, hypoallergenic
@@ -1070,9 +1927,9 @@ All of these are dermatologist-recommended! Want detailed analysis? 🔍"""
 5. **Cetaphil Gentle Cleanser** - Dermatologist favorite
 
 All fragrance-free and clinically tested! Need ingredient breakdown? 📊"""
-            
-            else:
-                bot_response = """Here are some top-rated options: ✨
+        
+        else:
+            bot_response = """Here are some top-rated options: ✨
 
 **For Hydration:**
 - Neutrogena Hydro Boost
@@ -1087,51 +1944,187 @@ All fragrance-free and clinically tested! Need ingredient breakdown? 📊"""
 - Vanicream Gentle Cleanser
 
 What's your skin type? I can narrow it down! 🎯"""
-            
-            return jsonify({
-                'success': True,
-                'response': bot_response,
-                'powered_by': 'Dermamon Database'
-            })
         
-        # Vaseline specific
-        if 'vaseline' in message:
-            if 'dry' in message:
-                bot_response = "Yes! Vaseline (petrolatum) is EXCELLENT for dry skin! 💧 It works as an occlusive - meaning it locks moisture into your skin. Apply it over a moisturizer for best results. It's very safe and effective for very dry, chapped skin. Not recommended for face if you have oily/acne-prone skin though!"
-            elif 'oily' in message or 'acne' in message:
-                bot_response = "Not ideal for oily/acne-prone skin! ⚠️ Vaseline is very occlusive and heavy, which can clog pores and worsen breakouts. For oily skin, try lightweight gel moisturizers like Neutrogena Hydro Boost or The Ordinary Niacinamide instead! 🎯"
-            else:
-                bot_response = "Vaseline (petrolatum) is great for dry skin as it locks in moisture! 💧 However, it's too heavy for oily or acne-prone skin. What's your skin type? I can recommend better alternatives! 🧴"
+        return bot_response, 'Dermamon Database'
+    
+    # Vaseline specific
+    if 'vaseline' in message:
+        if 'dry' in message:
+            bot_response = "Yes! Vaseline (petrolatum) is EXCELLENT for dry skin! 💧 It works as an occlusive - meaning it locks moisture into your skin. Apply it over a moisturizer for best results. It's very safe and effective for very dry, chapped skin. Not recommended for face if you have oily/acne-prone skin though!"
+        elif 'oily' in message or 'acne' in message:
+            bot_response = "Not ideal for oily/acne-prone skin! ⚠️ Vaseline is very occlusive and heavy, which can clog pores and worsen breakouts. For oily skin, try lightweight gel moisturizers like Neutrogena Hydro Boost or The Ordinary Niacinamide instead! 🎯"
+        else:
+            bot_response = "Vaseline (petrolatum) is great for dry skin as it locks in moisture! 💧 However, it's too heavy for oily or acne-prone skin. What's your skin type? I can recommend better alternatives! 🧴"
+        
+        return bot_response, 'Dermamon Database'
+    
+    # General responses
+    responses = {
+        'hello': 'Hi! 👋 I\'m Dermamon, your skincare expert. What would you like to know?',
+        'hi': 'Hello! 😊 Ask me about products, ingredients, or your skin concerns!',
+        'help': 'I can help with:\n• Product recommendations\n• Ingredient analysis\n• Skin type advice\n• Allergy detection\n\nWhat interests you? 💡',
+        'thank': 'You\'re welcome! 😊 Always happy to help with skincare!',
+    }
+    
+    for key, value in responses.items():
+        if key in message:
+            return value, 'Dermamon'
+    
+    # Default
+    bot_response = "I\'m here to help with skincare! 🧴 Ask me about specific products, ingredients, or your skin concerns. What would you like to know?"
+    
+    return bot_response, 'Dermamon'
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_chat(message, original_message, context_data, on_answer=None):
+    # "token" events as text arrives, then one "done" event with the full answer
+    yield ": stream open\n\n"  # flush headers before the model is called
+    text = ""
+    if chat_llm:
+        key = chat_cache_key(message, context_data)
+        answer = chat_cache.get(key)
+        call, leader = (None, False) if answer is not None else chat_flights.begin(key)
+        
+        # Someone is already asking Gemini the same question; wait for their answer
+        if call is not None and not leader:
+            try:
+                answer = call.wait()
+            except Exception as e:
+                print(f"❌ Gemini error: {str(e)}")
+        
+        if answer is not None:
+            if on_answer:
+                on_answer(answer)
+            yield sse_event('token', {'text': answer})
+            yield sse_event('done', {'success': True, 'response': answer, 'powered_by': 'Gemini AI'})
+            return
+        
+        if leader:
+            error = RuntimeError("Chat stream closed before the answer finished")
+            try:
+                print("🤖 Streaming Gemini response...")
+                for chunk in llm_executor.stream(chat_llm.generate_stream,
+                                                 build_chat_prompt(original_message, context_data)):
+                    text += chunk
+                    yield sse_event('token', {'text': chunk})
+                
+                hint = chat_feature_hint(message, text)
+                if hint:
+                    text += hint
+                    yield sse_event('token', {'text': hint})
+                
+                answer = text.strip()
+                chat_cache.set(key, answer)
+                chat_flights.finish(key, call, answer)
+                if on_answer:
+                    on_answer(answer)
+                print(f"✅ Gemini response streamed successfully")
+                yield sse_event('done', {'success': True, 'response': answer, 'powered_by': 'Gemini AI'})
+                return
             
-            return jsonify({
-                'success': True,
-                'response': bot_response,
-                'powered_by': 'Dermamon Database'
-            })
+            except Exception as e:
+                error = e
+                print(f"❌ Gemini error: {str(e)}")
+                if text:
+                    # Part of the answer is already on screen, so end it rather than switch answers
+                    if on_answer:
+                        on_answer(text.strip())
+                    yield sse_event('done', {'success': True, 'response': text.strip(),
+                                             'powered_by': 'Gemini AI', 'truncated': True})
+                    return
+            finally:
+                # Waiters must never hang, even if the client disconnected mid-stream
+                chat_flights.finish(key, call, error=error)
+    
+    print("📝 Using fallback responses")
+    bot_response, powered_by = chat_fallback(message, context_data)
+    if on_answer:
+        on_answer(bot_response)
+    yield sse_event('token', {'text': bot_response})
+    yield sse_event('done', {'success': True, 'response': bot_response, 'powered_by': powered_by})
+
+@app.route('/api/chat', methods=['POST', 'OPTIONS'])
+def chat():
+    if request.method == 'OPTIONS':
+        return '', 204
+    return handle_chat(stream='text/event-stream' in request.headers.get('Accept', ''))
+
+@app.route('/api/chat/stream', methods=['POST', 'OPTIONS'])
+def chat_stream():
+    if request.method == 'OPTIONS':
+        return '', 204
+    return handle_chat(stream=True)
+
+def handle_chat(stream=False):
+    try:
+        data = request.get_json()
+        message = data.get('message', '').lower()
+        original_message = data.get('message', '')  # Keep original case
+        user_id = data.get('user_id', 'guest')
+        session_key, session = get_chat_session(user_id, data.get('session_id'))
         
-        # General responses
-        responses = {
-            'hello': 'Hi! 👋 I\'m Dermamon, your skincare expert. What would you like to know?',
-            'hi': 'Hello! 😊 Ask me about products, ingredients, or your skin concerns!',
-            'help': 'I can help with:\n• Product recommendations\n• Ingredient analysis\n• Skin type advice\n• Allergy detection\n\nWhat interests you? 💡',
-            'thank': 'You\'re welcome! 😊 Always happy to help with skincare!',
-        }
+        print(f"📨 Chat request: {message}")
+        print(f"🔑 Gemini available: {bool(GEMINI_API_KEY)}")
         
-        for key, value in responses.items():
-            if key in message:
+        refresh_knowledge_version()
+        context_data = build_chat_context(message)
+        if session is not None:
+            context_data['memory'] = session.render(CHAT_PROMPT_TOKEN_BUDGET // 2)
+        
+        def on_answer(bot_response):
+            remember_chat_turn(session_key, session, original_message, context_data, bot_response)
+        
+        if stream:
+            events = stream_with_context(stream_chat(message, original_message, context_data, on_answer))
+            return Response(events, mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        
+        # Try Gemini AI first
+        if chat_llm:
+            try:
+                key = chat_cache_key(message, context_data)
+                bot_response = chat_cache.get(key)
+                
+                if bot_response is None:
+                    print("🤖 Attempting Gemini response...")
+                    
+                    def ask_gemini():
+                        answer = generate_chat_answer(message, original_message, context_data)
+                        chat_cache.set(key, answer)
+                        return answer
+                    
+                    # Identical questions already in flight share that one Gemini call
+                    bot_response, shared = chat_flights.do(key, ask_gemini)
+                    print(f"✅ Gemini response {'shared' if shared else 'generated successfully'}")
+                
+                on_answer(bot_response)
                 return jsonify({
                     'success': True,
-                    'response': value,
-                    'powered_by': 'Dermamon'
+                    'response': bot_response,
+                    'powered_by': 'Gemini AI'
                 })
+                
+            except LLMUnavailable as e:
+                print(f"⚠️ Gemini unavailable, using fallback - {e}")
+            except Exception as e:
+                print(f"❌ Gemini error: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                # Continue to fallback
+        else:
+            print("⚠️ Gemini API key not available, using fallback")
         
-        # Default
-        bot_response = "I\'m here to help with skincare! 🧴 Ask me about specific products, ingredients, or your skin concerns. What would you like to know?"
+        # Fallback responses
+        print("📝 Using fallback responses")
+        bot_response, powered_by = chat_fallback(message, context_data)
+        on_answer(bot_response)
         
         return jsonify({
             'success': True,
             'response': bot_response,
-            'powered_by': 'Dermamon'
+            'powered_by': powered_by
         })
     
     except Exception as e:
@@ -1141,13 +2134,37 @@ What's your skin type? I can narrow it down! 🎯"""
         return jsonify({'error': str(e)}), 500
     
     
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    flights = chat_flights.stats()
+    return jsonify({
+        'predict_micro_batching': dict(risk_batcher.stats(), enabled=MICRO_BATCHING),
+        'predict_cache': dict(predict_cache.stats(), knowledge_version=KNOWLEDGE_VERSION[:12]),
+        'risk_cache': risk_cache.stats(),
+        'allergen_profiles': allergen_profiles.stats(),
+        'image_preprocessing': image_preprocessor.stats(),
+        'image_analysis_cache': image_analysis_cache.stats(),
+        'image_jobs': image_jobs.stats() if image_jobs is not None else None,
+        'storage': storage.stats() if storage is not None else None,
+        'leaderboards': leaderboards.stats(),
+        'review_summaries': review_summaries.stats(),
+        'game_score_writer': score_writer.stats() if score_writer is not None else None,
+        'image_analysis_output': dict(image_analysis_output.stats(), json_mode=GEMINI_JSON_MODE),
+        'chat_sessions': dict(chat_sessions.stats(), prompt_token_budget=CHAT_PROMPT_TOKEN_BUDGET),
+        'chat_cache': dict(chat_cache.stats(), single_flight=flights,
+                           llm_calls_saved=chat_cache.hits + flights['shared_calls']),
+        'password_hasher': password_hasher.stats(),
+        'llm_executor': llm_executor.stats(),
+        'gemini': {name: client.stats() for name, client in [('chat', chat_llm), ('allergy', allergy_llm)] if client}
+    })
+
 @app.route('/api/debug/status', methods=['GET'])
 def debug_status():
     return jsonify({
         'gemini_key_loaded': bool(GEMINI_API_KEY),
         'gemini_key_length': len(GEMINI_API_KEY) if GEMINI_API_KEY else 0,
         'models_loaded': MODELS_LOADED,
-        'database_connected': SUPABASE_CONNECTED
+        'database_connected': DATABASE_CONNECTED
     })
     
 if __name__ == '__main__':
@@ -1155,7 +2172,7 @@ if __name__ == '__main__':
     print("🚀 Starting Dermamon API...")
     print("="*50)
     print(f"📊 Models: {'✅' if MODELS_LOADED else '⚠️ No'}")
-    print(f"🔗 Database: {'✅' if SUPABASE_CONNECTED else '⚠️ No'}")
+    print(f"🔗 Database: {'✅' if DATABASE_CONNECTED else '⚠️ No'}")
     print(f"🌍 Server: http://localhost:5000")
     print("="*50 + "\n")
     
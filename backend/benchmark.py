@@ -0,0 +1,387 @@
+"""
+Dermamon backend micro-benchmarks
+Usage: python benchmark.py [name ...]   (runs everything when no name is given)
+"""
+
+import base64
+import io
+import json
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+from sklearn.datasets import load_sample_image
+
+import app
+from image_cache import ImageAnalysisCache, hash_distance, image_hashes
+from image_prep import ImageTooLarge
+from storage import SQLiteStorage
+from structured_output import IMAGE_ANALYSIS_SCHEMA, StructuredOutput
+from write_behind import WriteBehindBuffer
+from llm_guard import CircuitBreaker, CircuitOpenError, GuardedExecutor, LLMDeadlineExceeded, LLMOverloaded
+
+
+def _timeit(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def _report(label, baseline, candidate):
+    print(f"   {label:<28} before {baseline * 1e6:10.1f} µs   after {candidate * 1e6:10.1f} µs   "
+          f"speedup {baseline / candidate:5.1f}x")
+
+
+def legacy_harmful_counts(ingredients_list, harmful_ingredients):
+    """Original nested any() scan, kept as the reference implementation"""
+    counts = [0, 0, 0, 0]
+    for ing in ingredients_list:
+        if any(harmful in ing for harmful in harmful_ingredients['high_risk']):
+            counts[0] += 1
+        if any(harmful in ing for harmful in harmful_ingredients['moderate_risk']):
+            counts[1] += 1
+        if any(harmful in ing for harmful in harmful_ingredients['comedogenic']):
+            counts[2] += 1
+        if any(harmful in ing for harmful in harmful_ingredients['irritants']):
+            counts[3] += 1
+    return counts
+
+
+def matcher_harmful_counts(ingredients_list, matcher):
+    counts = [0, 0, 0, 0]
+    for ing in ingredients_list:
+        hits = matcher.match(ing)
+        counts[0] += 'high_risk' in hits
+        counts[1] += 'moderate_risk' in hits
+        counts[2] += 'comedogenic' in hits
+        counts[3] += 'irritants' in hits
+    return counts
+
+
+def _synthetic_terms(n, rng):
+    alphabet = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choices(alphabet, k=rng.randint(6, 16))) for _ in range(n)]
+
+
+def bench_ingredient_features():
+    """Harmful-category scan: nested any() vs compiled TermMatcher"""
+    print("\n🧪 Ingredient feature extraction")
+    rng = random.Random(42)
+
+    cerave = [i.strip() for i in app.PRODUCT_DATABASE['cerave moisturizing cream']['ingredients'].split(',')]
+    vocabulary = list(app.INGREDIENT_DATA) + sum(app.HARMFUL_INGREDIENTS.values(), []) + cerave
+    long_list = [rng.choice(vocabulary) for _ in range(60)]
+
+    # Current knowledge base
+    for label, ingredients in [('14 ingredients', cerave), ('60 ingredients', long_list)]:
+        _report(label,
+                _timeit(lambda: legacy_harmful_counts(ingredients, app.HARMFUL_INGREDIENTS), 2000),
+                _timeit(lambda: matcher_harmful_counts(ingredients, app.HARMFUL_MATCHER), 2000))
+
+    # Knowledge base grown to thousands of terms per category
+    big_kb = {category: terms + _synthetic_terms(2500, rng)
+              for category, terms in app.HARMFUL_INGREDIENTS.items()}
+    big_matcher = app.TermMatcher(big_kb)
+    _report('60 ingredients, 10k terms',
+            _timeit(lambda: legacy_harmful_counts(long_list, big_kb), 20),
+            _timeit(lambda: matcher_harmful_counts(long_list, big_matcher), 20))
+
+
+def bench_risk_model():
+    """Risk model: predict + predict_proba vs single pass vs compiled trees"""
+    print("\n🤖 Risk model inference")
+    if not app.MODELS_LOADED:
+        print("   ⚠️ models/*.pkl not found - run from backend/ after training")
+        return
+    if app.risk_models.compiled is None:
+        print("   ⚠️ Risk model could not be compiled - see startup log")
+        return
+
+    clf, scaler, compiled = app.risk_models.classifier, app.risk_models.scaler, app.risk_models.compiled
+    rng = np.random.default_rng(0)
+    rows = np.abs(np.round(scaler.mean_ + rng.normal(0, 2, size=(1000, scaler.n_features_in_)) * scaler.scale_))
+
+    # Equivalence against the pickled models
+    expected = clf.predict_proba(scaler.transform(rows))
+    actual = compiled.predict_proba(rows)
+    assert np.allclose(actual, expected, atol=1e-6), "compiled probabilities differ"
+    assert (clf.classes_[actual.argmax(axis=1)] == clf.predict(scaler.transform(rows))).all(), "labels differ"
+    print(f"   ✅ {type(clf).__name__}: compiled output matches on {len(rows)} rows")
+
+    row = rows[:1]
+
+    def two_passes():
+        scaled = scaler.transform(row)
+        clf.predict(scaled)
+        clf.predict_proba(scaled)
+
+    def one_pass():
+        clf.predict_proba(scaler.transform(row))
+
+    baseline = _timeit(two_passes, 200)
+    _report('1 row, single pass', baseline, _timeit(one_pass, 200))
+    _report('1 row, compiled', baseline, _timeit(lambda: compiled.predict_proba(row), 200))
+    _report('1000 rows, compiled',
+            _timeit(lambda: clf.predict_proba(scaler.transform(rows)), 20),
+            _timeit(lambda: compiled.predict_proba(rows), 20))
+
+
+def legacy_safer_alternatives(vectors, risk_scores, product_idx, n):
+    """Notebook recommend_safer_alternatives over a dense cosine-similarity matrix"""
+    similarities = (vectors @ vectors.T)[product_idx]
+    rec_scores = []
+    for i, sim in enumerate(similarities):
+        if i != product_idx and risk_scores[i] < risk_scores[product_idx]:
+            rec_scores.append((i, sim * (1 - risk_scores[i] / 100)))
+    rec_scores.sort(key=lambda x: x[1], reverse=True)
+    return [i for i, _ in rec_scores[:n]]
+
+
+def _synthetic_catalog_features(n, rng):
+    counts = rng.poisson([20, 1, 1, 0.5, 0.5], size=(n, 5)).astype(float)
+    risk = np.minimum((counts[:, 1] * 3 + counts[:, 2] * 2 + counts[:, 3] * 1.5 + counts[:, 4]) * 10, 100)
+    beneficial = rng.uniform(0, 30, n)
+    price = rng.lognormal(3, 0.5, n)
+    features = np.column_stack([counts[:, 0], risk, beneficial, counts[:, 1], counts[:, 2], counts[:, 3], price])
+    return features, risk
+
+
+def bench_alternatives():
+    """Safer alternatives: dense N x N similarity vs blocked top-k (exact and IVF)"""
+    print("\n🔁 Safer alternatives")
+    rng = np.random.default_rng(1)
+
+    features, risk = _synthetic_catalog_features(3000, rng)
+    index = app.AlternativesIndex.from_features(features, risk)
+    queries = rng.choice(len(features), 50, replace=False)
+    _report('3k products, 1 query',
+            _timeit(lambda: legacy_safer_alternatives(index.vectors, index.risk_scores, queries[0], 5), 3),
+            _timeit(lambda: index.query(queries[0], 5), 50))
+
+    features, risk = _synthetic_catalog_features(100000, rng)
+    exact = app.AlternativesIndex.from_features(features, risk)
+    ivf = app.AlternativesIndex.from_features(features, risk, n_lists=256, n_probe=16)
+    queries = rng.choice(len(features), 100, replace=False)
+    recall = np.mean([len({d for d, _, _ in ivf.query(q, 10)} & {d for d, _, _ in exact.query(q, 10)}) / 10
+                      for q in queries])
+    print(f"   100k products: index {exact.nbytes() / 1e6:.1f} MB "
+          f"(dense matrix would be {100000 ** 2 * 8 / 1e9:.0f} GB)")
+    _report('100k products, exact vs IVF',
+            _timeit(lambda: [exact.query(q, 10) for q in queries], 1) / len(queries),
+            _timeit(lambda: [ivf.query(q, 10) for q in queries], 1) / len(queries))
+    print(f"   IVF recall@10: {recall:.3f}")
+
+
+def slow_model(prompt, delay):
+    """Stand-in for a Gemini call that takes delay seconds"""
+    time.sleep(delay)
+    return f"answer to {prompt}"
+
+
+def _raises(error, fn, *args):
+    try:
+        fn(*args)
+    except error:
+        return True
+    return False
+
+
+def bench_llm_guard():
+    """LLM guard: what a hung upstream and an open breaker cost the caller"""
+    print("\n🛡️ LLM deadlines and circuit breaker")
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    executor = GuardedExecutor(max_workers=2, max_queue=1, timeout_seconds=0.1, breaker=breaker)
+
+    start = time.perf_counter()
+    _raises(LLMDeadlineExceeded, executor.call, slow_model, 'slow', 1.0)
+    print(f"   call to a 1 s stub returned after {time.perf_counter() - start:.2f} s "
+          f"({executor.timeout * 1e3:.0f} ms deadline)")
+
+    for _ in range(3):
+        _raises((LLMDeadlineExceeded, CircuitOpenError, LLMOverloaded), executor.call, slow_model, 'slow', 0.3)
+    fail_fast = _timeit(lambda: _raises(CircuitOpenError, executor.call, slow_model, 'x', 0), 1000)
+    print(f"   open breaker rejects in {fail_fast * 1e6:.1f} µs")
+    print(f"   {executor.stats()}")
+
+
+def _synthetic_photo(width, height):
+    """Gradients plus mild sensor-like noise; compresses roughly like a phone photo"""
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.dstack([x * 255 // width, y * 255 // height, (x + y) // 40 % 256]).astype(np.int16)
+    pixels += np.random.default_rng(2).integers(-12, 12, pixels.shape, dtype=np.int16)
+    pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(pixels).save(out, 'JPEG', quality=92)
+    return out.getvalue()
+
+
+def legacy_image_payload(image_b64):
+    """What the route used to hand the SDK: the full-resolution decoded image, re-encoded by the SDK"""
+    image = Image.open(io.BytesIO(base64.b64decode(image_b64)))
+    out = io.BytesIO()
+    image.save(out, 'JPEG')
+    return out.getvalue()
+
+
+def bench_image_prep():
+    """Allergy uploads: full-resolution base64 image vs preprocessed multipart upload"""
+    print("\n📸 Image preprocessing")
+    preprocessor = app.image_preprocessor
+    photo = _synthetic_photo(4000, 3000)
+    photo_b64 = base64.b64encode(photo).decode()
+
+    legacy = legacy_image_payload(photo_b64)
+    prepared = preprocessor.prepare(photo)
+    print(f"   12 MP photo: request body {len(photo_b64) / 1e6:.1f} MB as base64 vs {len(photo) / 1e6:.1f} MB "
+          f"multipart; sent to Gemini {len(legacy) / 1e6:.2f} MB vs {len(prepared.data) / 1e6:.2f} MB")
+    _report('12 MP photo', _timeit(lambda: legacy_image_payload(photo_b64), 5),
+            _timeit(lambda: preprocessor.prepare(photo), 5))
+
+    bomb = io.BytesIO()
+    Image.new('L', (10000, 10000)).save(bomb, 'PNG')
+    start = time.perf_counter()
+    try:
+        preprocessor.prepare(bomb.getvalue())
+    except ImageTooLarge:
+        pass
+    print(f"   {len(bomb.getvalue()) / 1e3:.0f} kB file declaring 100 MP rejected in "
+          f"{(time.perf_counter() - start) * 1e3:.1f} ms without decoding")
+
+
+def bench_image_cache():
+    """Image analysis cache: perceptual hashing and near-duplicate lookup"""
+    print("\n🖼️ Image analysis cache")
+    # A real photo; the synthetic gradient has almost no low-frequency structure to hash
+    out = io.BytesIO()
+    Image.fromarray(load_sample_image('flower.jpg')).save(out, 'JPEG', quality=92)
+    prepared = app.image_preprocessor.prepare(out.getvalue())
+    hashes = image_hashes(prepared.image)
+
+    # The same photo re-encoded at lower quality and half size is still a near duplicate
+    out = io.BytesIO()
+    prepared.image.resize((prepared.image.width // 2, prepared.image.height // 2)).save(out, 'JPEG', quality=60)
+    reupload = app.image_preprocessor.prepare(out.getvalue())
+    distance = hash_distance(hashes, image_hashes(reupload.image))
+    print(f"   re-encoded, half-size copy is {distance} bits away (threshold {app.IMAGE_CACHE_MAX_DISTANCE})")
+
+    rng = random.Random(3)
+    cache = ImageAnalysisCache(max_size=512)
+    for _ in range(511):
+        cache.set(('',), (rng.getrandbits(64), rng.getrandbits(64)), {'type': 'other'})
+    cache.set(('',), hashes, {'type': 'contact dermatitis'})
+    hash_time = _timeit(lambda: image_hashes(prepared.image), 20)
+    lookup_time = _timeit(lambda: cache.get(('',), hashes), 200)
+    print(f"   hash {hash_time * 1e3:.1f} ms + lookup among 512 entries {lookup_time * 1e6:.0f} µs per upload")
+    print(f"   {cache.stats()}")
+
+
+def bench_structured_output():
+    """Image analysis JSON: local validation and repair of near-miss model output"""
+    print("\n🧾 Structured image analysis output")
+    output = StructuredOutput(IMAGE_ANALYSIS_SCHEMA, ranges={'confidence': (0, 100)})
+    expected = {'severity': 'mild', 'type': 'eczema', 'confidence': 85,
+                'observations': ['redness'], 'recommendations': ['moisturize']}
+    near_miss = ('Analysis: {"severity": "Mild", "type": "eczema", "confidence": "85%", '
+                 '"observations": "redness", "recommendations": ["moisturize",],}')
+    repair = _timeit(lambda: output.parse(near_miss), 2000)
+    print(f"   near miss repaired locally in {repair * 1e6:.1f} µs instead of a re-prompt")
+
+    valid = json.dumps(expected)
+    overhead = _timeit(lambda: output.parse(valid), 2000) - _timeit(lambda: json.loads(valid), 2000)
+    print(f"   schema check adds {overhead * 1e6:.1f} µs to json.loads per response")
+    print(f"   {output.stats()}")
+
+
+def bench_score_writer(round_trip=0.002, rows=2000):
+    """Game scores: one insert per request vs write-behind bulk inserts"""
+    print("\n🎈 Game score writes")
+    stored = []
+
+    def insert(batch):
+        time.sleep(round_trip)  # stand-in for the HTTP round-trip to the database
+        stored.extend(batch)
+
+    scores = [{'user_id': f"user{i % 300}", 'score': i % 500, 'game_type': 'balloon_hit'} for i in range(rows)]
+    per_request = _timeit(lambda: [insert([row]) for row in scores], 1)
+
+    stored.clear()
+    writer = WriteBehindBuffer(insert, max_rows=200, interval_ms=50)
+    start = time.perf_counter()
+    for row in scores:
+        writer.add(row)
+    enqueue = time.perf_counter() - start
+    writer.close()
+    assert sorted(stored, key=lambda r: (r['user_id'], r['score'])) == sorted(scores, key=lambda r: (r['user_id'], r['score']))
+    print(f"   ✅ {rows} scores written in {writer.batches} bulk inserts")
+    print(f"   request threads: {per_request / rows * 1e6:.0f} µs per score inline vs "
+          f"{enqueue / rows * 1e6:.1f} µs to enqueue ({round_trip * 1e3:.0f} ms simulated round-trip)")
+
+
+def bench_storage(users=5000, reviews=20000, scores=20000):
+    """Local SQLite storage: indexed lookups, keyset pages and bulk score inserts"""
+    print("\n🗄️ SQLite storage")
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SQLiteStorage(f"{directory}/bench.db")
+        conn = storage._connect()
+        with conn:
+            conn.executemany("INSERT INTO users (email, password, name) VALUES (?, ?, ?)",
+                             [(f"user{i}@example.com", 'x', f"User {i}") for i in range(users)])
+            conn.executemany(
+                "INSERT INTO reviews (user_id, product_name, rating, skin_type, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(str(rng.randrange(users)), f"product{rng.randrange(200)}", rng.randint(1, 5),
+                  rng.choice(['oily', 'dry', 'normal']), f"2025-01-{rng.randint(1, 28):02d}T00:00:00")
+                 for _ in range(reviews)])
+
+        lookup = _timeit(lambda: storage.get_user_by_email(f"user{rng.randrange(users)}@example.com"), 2000)
+        print(f"   user by email: {lookup * 1e6:.0f} µs")
+
+        # Walking the cursor must visit every review of the product exactly once, newest first
+        expected = storage._query("SELECT id FROM reviews WHERE product_name = 'product7' "
+                                  "ORDER BY created_at DESC, id DESC")
+        walked, after = [], None
+        while True:
+            page = storage.list_reviews('product7', ('id', 'created_at'), 20, after)
+            walked += [{'id': row['id']} for row in page]
+            if len(page) < 20:
+                break
+            after = (page[-1]['created_at'], page[-1]['id'])
+        assert walked == expected, "keyset pagination skipped or repeated reviews"
+        page = _timeit(lambda: storage.list_reviews(f"product{rng.randrange(200)}", ('rating', 'review_text'), 20), 2000)
+        print(f"   ✅ {len(walked)} reviews paged without gaps; one page of 20: {page * 1e6:.0f} µs")
+
+        rows = [{'user_id': f"user{i % 300}", 'score': i % 500, 'game_type': 'balloon_hit', 'created_at': None}
+                for i in range(scores)]
+        single = _timeit(lambda: [storage.add_game_scores([row]) for row in rows[:1000]], 1) / 1000
+        bulk = _timeit(lambda: [storage.add_game_scores(rows[i:i + 200]) for i in range(0, scores, 200)], 1) / scores
+        print(f"   game scores: {single * 1e6:.0f} µs per row one at a time vs {bulk * 1e6:.1f} µs in batches of 200")
+
+
+BENCHMARKS = {
+    'ingredients': bench_ingredient_features,
+    'model': bench_risk_model,
+    'alternatives': bench_alternatives,
+    'llm_guard': bench_llm_guard,
+    'image_prep': bench_image_prep,
+    'image_cache': bench_image_cache,
+    'structured_output': bench_structured_output,
+    'score_writer': bench_score_writer,
+    'storage': bench_storage,
+}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"❌ Unknown benchmark '{name}'. Available: {', '.join(BENCHMARKS)}")
+            continue
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Memory-mapped columnar store for the product catalog
+Layout: magic | format version | header length | JSON header | body.
+The body holds fixed-width NumPy arrays and string columns stored as
+offsets + a UTF-8 byte heap, each aligned to 64 bytes. Workers mmap the file
+read-only, so they share its pages through the OS page cache.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'DMCATLG\x00'
+FORMAT_VERSION = 1
+ALIGN = 64
+PREAMBLE = struct.Struct('<8sII')
+
+
+def _pad(n):
+    return (-n) % ALIGN
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def write_store(path, n_rows, strings=None, arrays=None, meta=None):
+    """Write string columns ({name: [str]}) and arrays ({name: ndarray}) to path"""
+    parts = []
+    columns = {}
+    offset = 0
+
+    def add(buffer):
+        nonlocal offset
+        start = offset
+        parts.append(buffer)
+        offset += len(buffer)
+        padding = _pad(offset)
+        if padding:
+            parts.append(b'\x00' * padding)
+            offset += padding
+        return start
+
+    for name, values in (strings or {}).items():
+        encoded = [str(v).encode('utf-8') for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype='<u8')
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        columns[name] = {
+            'kind': 'string',
+            'length': len(encoded),
+            'offsets': add(offsets.tobytes()),
+            'heap': add(b''.join(encoded)),
+            'heap_nbytes': int(offsets[-1]),
+        }
+
+    for name, values in (arrays or {}).items():
+        values = np.ascontiguousarray(values)
+        columns[name] = {
+            'kind': 'array',
+            'dtype': values.dtype.str,
+            'shape': list(values.shape),
+            'offset': add(values.tobytes()),
+        }
+
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part)
+
+    header = json.dumps({
+        'n_rows': n_rows,
+        'columns': columns,
+        'meta': meta or {},
+        'body_sha256': digest.hexdigest(),
+    }).encode('utf-8')
+    header += b' ' * _pad(PREAMBLE.size + len(header))
+
+    # Write to a temp file and rename so running workers keep their old mapping
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for part in parts:
+            f.write(part)
+    os.replace(tmp_path, path)
+
+
+class StringColumn:
+    def __init__(self, buffer, body, spec):
+        self._buffer = buffer
+        self._offsets = np.frombuffer(buffer, dtype='<u8', count=spec['length'] + 1,
+                                      offset=body + spec['offsets'])
+        self._heap = body + spec['heap']
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        start = self._heap + int(self._offsets[i])
+        end = self._heap + int(self._offsets[i + 1])
+        return self._buffer[start:end].decode('utf-8')
+
+
+class ColumnStore:
+    def __init__(self, path, verify=False):
+        """Map path read-only; verify=True also checks the body checksum"""
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_len = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a Dermamon catalog file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+
+        self.header = json.loads(self._mmap[PREAMBLE.size:PREAMBLE.size + header_len])
+        self._body = PREAMBLE.size + header_len
+        self.n_rows = self.header['n_rows']
+        self.meta = self.header['meta']
+
+        if verify and not self.verify():
+            raise ValueError(f"{path} failed its checksum")
+
+    def verify(self):
+        digest = hashlib.sha256()
+        view = memoryview(self._mmap)[self._body:]
+        for start in range(0, len(view), 1 << 24):
+            digest.update(view[start:start + (1 << 24)])
+        view.release()
+        return digest.hexdigest() == self.header['body_sha256']
+
+    def array(self, name):
+        spec = self.header['columns'][name]
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        values = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=self._body + spec['offset'])
+        return values.reshape(spec['shape'])
+
+    def strings(self, name):
+        return StringColumn(self._mmap, self._body, self.header['columns'][name])
+
+    def has_column(self, name):
+        return name in self.header['columns']
@@ -0,0 +1,95 @@
+"""
+Per-user chat memory
+Each session keeps the last few turns and a compact profile (skin type,
+allergies, products mentioned) and renders them into a prompt section that
+never exceeds a fixed token budget, so prompt size stays constant per request.
+"""
+
+import re
+import threading
+from collections import deque
+
+ALLERGY_MENTION = re.compile(r"\ballerg(?:ic|y|ies) to ([^.!?\n]+)")
+MAX_PROFILE_ITEMS = 8
+MAX_TURN_TOKENS = 100
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; no tokenizer needed for budgeting
+    return (len(text) + 3) // 4
+
+
+def clip_to_tokens(text, max_tokens):
+    max_chars = max(0, max_tokens * 4)
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 3)].rstrip() + '...'
+
+
+def _remember(items, values):
+    # Most recent last, no duplicates, bounded
+    for value in values:
+        if value in items:
+            items.remove(value)
+        items.append(value)
+    del items[:-MAX_PROFILE_ITEMS]
+
+
+class ChatSession:
+    def __init__(self, max_turns=6):
+        self.turns = deque(maxlen=max_turns)
+        self.skin_type = None
+        self.allergies = []
+        self.products = []
+        self._lock = threading.Lock()
+
+    def update_profile(self, skin_type=None, allergies=(), products=()):
+        with self._lock:
+            if skin_type:
+                self.skin_type = skin_type
+            _remember(self.allergies, allergies)
+            _remember(self.products, products)
+
+    def add_turn(self, user_text, bot_text):
+        with self._lock:
+            self.turns.append((clip_to_tokens(user_text, MAX_TURN_TOKENS), clip_to_tokens(bot_text, MAX_TURN_TOKENS)))
+
+    def render(self, max_tokens):
+        """Profile plus as many of the newest turns as fit in max_tokens"""
+        with self._lock:
+            profile = []
+            if self.skin_type:
+                profile.append(f"- Skin type: {self.skin_type}")
+            if self.allergies:
+                profile.append(f"- Allergies: {', '.join(self.allergies)}")
+            if self.products:
+                profile.append(f"- Products discussed: {', '.join(self.products)}")
+            turns = list(self.turns)
+
+        sections = []
+        budget = max_tokens
+        if profile:
+            block = "\n**WHAT YOU KNOW ABOUT THIS USER:**\n" + "\n".join(profile) + "\n"
+            if estimate_tokens(block) <= budget:
+                sections.append(block)
+                budget -= estimate_tokens(block)
+
+        header = "\n**RECENT CONVERSATION:**\n"
+        budget -= estimate_tokens(header)
+        recent = []
+        for user_text, bot_text in reversed(turns):
+            line = f"User: {user_text}\nDermamon: {bot_text}\n"
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            recent.append(line)
+            budget -= cost
+        if recent:
+            sections.append(header + "".join(reversed(recent)))
+
+        return "".join(sections)
+
+
+def extract_allergy_text(message):
+    """Free text after 'allergic to ...' / 'allergy to ...', if the user states one"""
+    return [m.group(1) for m in ALLERGY_MENTION.finditer(message)]
@@ -0,0 +1,144 @@
+"""
+Near-duplicate cache for image analyses
+Images are keyed by two 64-bit perceptual hashes (dHash and pHash) of the
+preprocessed image, so a re-upload of the same photo - re-encoded, resized or
+lightly edited - still finds the earlier analysis. Entries are grouped by the
+normalized symptom text, which has to match exactly.
+"""
+
+import itertools
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+
+# Rows of the DCT-II basis; only the lowest HASH_SIZE frequencies are kept
+_DCT = np.cos(np.pi / DCT_SIZE * np.arange(HASH_SIZE)[:, None] * (np.arange(DCT_SIZE)[None, :] + 0.5))
+
+
+def _bits_to_int(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+
+def image_hashes(image):
+    """(dHash, pHash) of a PIL image, each a 64-bit int"""
+    gray = image.convert('L')
+
+    # dHash: is each pixel brighter than its right-hand neighbour
+    small = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS, reducing_gap=2.0),
+                       dtype=np.int16)
+    dhash = _bits_to_int(small[:, 1:] > small[:, :-1])
+
+    # pHash: low-frequency DCT coefficients against their median (DC term excluded)
+    pixels = np.asarray(gray.resize((DCT_SIZE, DCT_SIZE), Image.Resampling.LANCZOS, reducing_gap=2.0),
+                        dtype=np.float64)
+    coeffs = (_DCT @ pixels @ _DCT.T).ravel()
+    phash = _bits_to_int(coeffs > np.median(coeffs[1:]))
+    return dhash, phash
+
+
+def normalize_text(text):
+    """Case, punctuation and spacing don't change the analysis"""
+    return ' '.join(re.findall(r'[a-z0-9]+', (text or '').lower()))
+
+
+def hash_distance(a, b):
+    # Both hashes have to be close; a single 64-bit hash alone confuses similar-looking skin photos
+    return max((a[0] ^ b[0]).bit_count(), (a[1] ^ b[1]).bit_count())
+
+
+class ImageAnalysisCache:
+    def __init__(self, max_size=512, ttl_seconds=3600, max_distance=4):
+        """LRU over all entries; a lookup only scans entries with the same text key"""
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # entry id -> (text_key, hashes, value, expires_at)
+        self._buckets = {}  # text_key -> {entry id: hashes}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, entry_id):
+        text_key = self._entries.pop(entry_id)[0]
+        bucket = self._buckets[text_key]
+        del bucket[entry_id]
+        if not bucket:
+            del self._buckets[text_key]
+
+    def _closest(self, text_key, hashes, now):
+        best_id, best_distance = None, None
+        for entry_id, entry_hashes in list(self._buckets.get(text_key, {}).items()):
+            if self._entries[entry_id][3] <= now:
+                self._remove(entry_id)
+                self.expirations += 1
+                continue
+            distance = hash_distance(hashes, entry_hashes)
+            if distance <= self.max_distance and (best_distance is None or distance < best_distance):
+                best_id, best_distance = entry_id, distance
+        return best_id, best_distance
+
+    def get(self, text_key, hashes):
+        now = time.monotonic()
+        with self._lock:
+            entry_id, distance = self._closest(text_key, hashes, now)
+            if entry_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            if distance:
+                self.near_hits += 1
+            return self._entries[entry_id][2]
+
+    def set(self, text_key, hashes, value):
+        if self.max_size <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            # An identical image replaces its old entry instead of piling up
+            entry_id, distance = self._closest(text_key, hashes, now)
+            if entry_id is not None and distance == 0:
+                self._remove(entry_id)
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (text_key, hashes, value, now + self.ttl)
+            self._buckets.setdefault(text_key, {})[entry_id] = hashes
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl,
+                'max_distance': self.max_distance,
+                'hits': self.hits,
+                'near_duplicate_hits': self.near_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
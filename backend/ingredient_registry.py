@@ -0,0 +1,124 @@
+"""
+Canonical ingredient registry
+Maps every INCI name and synonym to a small integer ID so ingredient lists can
+be stored as int bitsets and membership checks become mask intersections.
+"""
+
+import re
+import threading
+
+
+class IngredientRegistry:
+    def __init__(self, synonyms=None):
+        """synonyms: {canonical name: [aliases]}"""
+        self._ids = {}
+        self.names = []
+        self._lock = threading.Lock()
+
+        for canonical, aliases in (synonyms or {}).items():
+            iid = self.add(canonical)
+            for alias in aliases:
+                self._ids.setdefault(self.normalize(alias), iid)
+
+    @staticmethod
+    def normalize(name):
+        return ' '.join(name.strip().lower().split())
+
+    def add(self, name):
+        """Register name (if new) and return its canonical ID"""
+        key = self.normalize(name)
+        iid = self._ids.get(key)
+        if iid is None:
+            with self._lock:
+                iid = self._ids.get(key)
+                if iid is None:
+                    iid = len(self.names)
+                    self.names.append(key)
+                    self._ids[key] = iid
+        return iid
+
+    def add_all(self, names):
+        for name in names:
+            self.add(name)
+
+    def id_of(self, name):
+        """Canonical ID for a name or synonym, None if unknown"""
+        iid = self._ids.get(name)
+        if iid is None:
+            iid = self._ids.get(self.normalize(name))
+        return iid
+
+    def canonical(self, name):
+        iid = self.id_of(name)
+        return self.names[iid] if iid is not None else self.normalize(name)
+
+    def mask(self, names):
+        """Bitset of the known names (unknown ones are ignored)"""
+        bits = 0
+        for name in names:
+            iid = self.id_of(name)
+            if iid is not None:
+                bits |= 1 << iid
+        return bits
+
+    def decode(self, bits):
+        """Canonical names for every ID set in bits, in ID order"""
+        names = []
+        while bits:
+            lowest = bits & -bits
+            names.append(self.names[lowest.bit_length() - 1])
+            bits ^= lowest
+        return names
+
+    def contains(self, bits, name):
+        iid = self.id_of(name)
+        return iid is not None and (bits >> iid) & 1 == 1
+
+    def __len__(self):
+        return len(self.names)
+
+
+class AllergenProfile:
+    def __init__(self, registry, mask, unknown):
+        """Parsed allergies: a bitset of known IDs plus unrecognised names"""
+        self.registry = registry
+        self.mask = mask
+        self.unknown = unknown
+        self.key = (mask, unknown)
+
+    def __bool__(self):
+        return bool(self.mask or self.unknown)
+
+    def matches(self, ingredient):
+        iid = self.registry.id_of(ingredient)
+        if iid is not None:
+            return (self.mask >> iid) & 1 == 1
+        return self.registry.normalize(ingredient) in self.unknown
+
+    def names(self):
+        return self.registry.decode(self.mask) + sorted(self.unknown)
+
+
+ALLERGY_SEPARATORS = re.compile(r'[,;/\n]|\band\b|\bor\b|&')
+
+
+def compile_allergens(registry, text):
+    """Split free-text allergies into whole entries and map them to canonical IDs"""
+    if isinstance(text, (list, tuple, set)):
+        entries = text
+    else:
+        entries = ALLERGY_SEPARATORS.split(text or '')
+
+    mask = 0
+    unknown = set()
+    for entry in entries:
+        name = registry.normalize(entry)
+        if not name:
+            continue
+        iid = registry.id_of(name)
+        if iid is not None:
+            mask |= 1 << iid
+        else:
+            unknown.add(name)
+
+    return AllergenProfile(registry, mask, frozenset(unknown))
@@ -0,0 +1,314 @@
+"""
+Background job queue
+A fixed pool of worker threads runs slow jobs (Gemini image analysis) outside
+the request that submitted them. Depth is bounded so a burst is rejected up
+front instead of piling up, a job that hasn't finished within max_runtime is
+failed, and finished jobs are forgotten after a TTL.
+
+Jobs run in the process that accepted them. With a JobStore their state is
+also written to a SQLite file, so a poll or stream that lands on another
+worker process of the same host still finds the job. Deployments spread over
+several hosts need sticky routing for the job URLs.
+"""
+
+import json
+import os
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+FINISHED = ('done', 'failed')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, fn, args, max_runtime):
+        # Unguessable, since the id is the only thing protecting the result
+        self.id = secrets.token_urlsafe(16)
+        self.fn = fn
+        self.args = args
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.monotonic()
+        self.deadline = self.created_at + max_runtime
+        self.submitted_at = time.time()  # wall clock, comparable across processes
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+
+class StoredJob:
+    def __init__(self, store, row):
+        """Read-only view of a job owned by another process"""
+        self._store = store
+        self.id = row['id']
+        self._update(row)
+
+    def _update(self, row):
+        self.status = row['status']
+        self.result = json.loads(row['result']) if row['result'] is not None else None
+        self.error = row['error']
+
+    def wait(self, timeout=None):
+        deadline = time.monotonic() + (timeout if timeout is not None else float('inf'))
+        while self.status not in FINISHED:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self._store.poll_interval, remaining))
+            row = self._store.load(self.id)
+            if row is None:
+                self.status, self.error = 'failed', 'Job expired'
+            else:
+                self._update(row)
+        return True
+
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    deadline REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_expires_at ON jobs (expires_at);
+"""
+
+
+class JobStore:
+    def __init__(self, path, poll_interval=0.5, busy_timeout_ms=5000):
+        """SQLite file holding the state of every job on this host; all times are wall clock"""
+        self.path = path
+        self.poll_interval = poll_interval
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(JOB_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def save(self, job, deadline, expires_at):
+        result = json.dumps(job.result) if job.result is not None else None
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO jobs (id, status, result, error, deadline, expires_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", (job.id, job.status, result, job.error, deadline, expires_at))
+
+    def load(self, job_id):
+        """The job's row, or None if it is unknown or expired; an unfinished job
+        past its deadline (e.g. its process died) reads as failed"""
+        now = time.time()
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ? AND expires_at > ?", (job_id, now)).fetchone()
+        if row is None:
+            return None
+        row = dict(row)
+        if row['status'] not in FINISHED and row['deadline'] <= now:
+            row['status'], row['error'] = 'failed', 'Job did not finish in time'
+        return row
+
+    def purge(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),))
+
+
+class JobQueue:
+    def __init__(self, workers=2, max_depth=32, ttl_seconds=600, max_runtime=300, store=None, name='job'):
+        """max_depth counts queued plus running jobs; a job not finished max_runtime
+        seconds after submission is failed; results are kept ttl_seconds after finishing"""
+        self.workers = workers
+        self.max_depth = max_depth
+        self.ttl = ttl_seconds
+        self.max_runtime = max_runtime
+        self.store = store
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()  # creation order, so expired jobs collect at the front
+        self._active = OrderedDict()  # queued and running jobs, oldest deadline first
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.expired = 0
+        self.store_errors = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"{name}-worker-{i}", daemon=True).start()
+
+    def _save(self, job):
+        if self.store is None:
+            return
+        # Rows outlive the job by ttl, and an unfinished row by max_runtime + ttl
+        deadline = job.submitted_at + self.max_runtime
+        expires_at = (time.time() if job.status in FINISHED else deadline) + self.ttl
+        try:
+            self.store.save(job, deadline, expires_at)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not save job {job.id} - {e}")
+            with self._lock:
+                self.store_errors += 1
+
+    def _finish(self, job, now):
+        # Caller holds the lock
+        job.finished_at = now
+        job.fn = job.args = None  # drop the image as soon as it's been analyzed
+        self._active.pop(job.id, None)
+        self._pending -= 1
+        self.completed += 1
+        self.failed += job.status == 'failed'
+
+    def _expire(self, now):
+        """Fail jobs past their deadline; returns them so their state can be saved outside the lock"""
+        timed_out = []
+        while self._active:
+            job = next(iter(self._active.values()))
+            if job.deadline > now:
+                break
+            job.status = 'failed'
+            job.error = f"Job did not finish within {self.max_runtime:g} s"
+            self._finish(job, now)
+            self.timed_out += 1
+            job.done.set()
+            timed_out.append(job)
+        return timed_out
+
+    def _purge(self, now):
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if not job.done.is_set() or job.finished_at + self.ttl > now:
+                return
+            self._jobs.popitem(last=False)
+            self.expired += 1
+
+    def _tick(self):
+        with self._lock:
+            now = time.monotonic()
+            timed_out = self._expire(now)
+            self._purge(now)
+        for job in timed_out:
+            self._save(job)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args); raises QueueFull when max_depth jobs are already waiting or running"""
+        self._tick()
+        if self.store is not None:
+            try:
+                self.store.purge()
+            except Exception as e:
+                print(f"⚠️ Warning: Could not purge expired jobs - {e}")
+        with self._lock:
+            if self._pending >= self.max_depth:
+                self.rejected += 1
+                raise QueueFull(f"{self._pending} jobs already queued")
+            self._pending += 1
+            self.submitted += 1
+            job = Job(fn, args, self.max_runtime)
+            self._jobs[job.id] = job
+            self._active[job.id] = job
+        self._save(job)
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        """The job, a StoredJob if another process owns it, or None if it never existed or has expired"""
+        self._tick()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or self.store is None:
+            return job
+        try:
+            row = self.store.load(job_id)
+        except Exception as e:
+            print(f"⚠️ Warning: Could not load job {job_id} - {e}")
+            return None
+        return StoredJob(self.store, row) if row is not None else None
+
+    def wait(self, job, timeout=None):
+        """job.wait(timeout); this process's jobs are failed once they pass their deadline"""
+        if not isinstance(job, Job):
+            return job.wait(timeout)
+        until_deadline = max(job.deadline - time.monotonic(), 0)
+        if job.wait(until_deadline if timeout is None else min(timeout, until_deadline)):
+            return True
+        self._tick()
+        return job.done.is_set()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if job.done.is_set():
+                    continue  # timed out while queued
+                job.started_at = time.monotonic()
+                job.status = 'running'
+                fn, args = job.fn, job.args
+            self._save(job)
+
+            try:
+                result, error = fn(*args), None
+            except Exception as e:
+                result, error = None, str(e)
+
+            fn = args = None
+            with self._lock:
+                if job.done.is_set():
+                    continue  # timed out while running; the result is no longer wanted
+                job.result, job.error = result, error
+                job.status = 'failed' if error is not None else 'done'
+                now = time.monotonic()
+                self._finish(job, now)
+                self.total_wait += job.started_at - job.created_at
+                self.total_run += now - job.started_at
+            self._save(job)
+            job.done.set()
+
+    def stats(self):
+        with self._lock:
+            ran = self.completed - self.timed_out
+            return {
+                'workers': self.workers,
+                'max_depth': self.max_depth,
+                'ttl_seconds': self.ttl,
+                'max_runtime_seconds': self.max_runtime,
+                'shared_store': self.store.path if self.store is not None else None,
+                'pending': self._pending,
+                'retained': len(self._jobs),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'expired': self.expired,
+                'store_errors': self.store_errors,
+                'avg_wait_ms': round(self.total_wait / ran * 1000, 2) if ran else 0.0,
+                'avg_run_ms': round(self.total_run / ran * 1000, 2) if ran else 0.0,
+            }
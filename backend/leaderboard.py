@@ -0,0 +1,131 @@
+"""
+In-memory game leaderboards
+One board per game_type holding each user's best score, kept as a sorted list
+so the top N is a slice and a user's rank is a binary search. Boards are
+updated as scores arrive and periodically rebuilt from the database.
+"""
+
+import bisect
+import threading
+import time
+from collections import deque
+
+
+def _sort_key(user_id, score, created_at):
+    # Higher score first; on a tie whoever got there first
+    return (-score, created_at or '', user_id)
+
+
+class Leaderboard:
+    def __init__(self):
+        self.best = {}  # user_id -> (score, created_at)
+        self.order = []  # sorted _sort_key tuples
+        self.version = 0
+
+    def update(self, user_id, score, created_at):
+        """True when this is the user's new best"""
+        current = self.best.get(user_id)
+        if current is not None:
+            if score <= current[0]:
+                return False
+            del self.order[bisect.bisect_left(self.order, _sort_key(user_id, *current))]
+        self.best[user_id] = (score, created_at)
+        bisect.insort(self.order, _sort_key(user_id, score, created_at))
+        self.version += 1
+        return True
+
+    def entry(self, position):
+        neg_score, created_at, user_id = self.order[position]
+        return {'rank': position + 1, 'user_id': user_id, 'score': -neg_score, 'created_at': created_at or None}
+
+    def top(self, limit):
+        return [self.entry(i) for i in range(min(limit, len(self.order)))]
+
+    def rank(self, user_id):
+        current = self.best.get(user_id)
+        if current is None:
+            return None
+        return self.entry(bisect.bisect_left(self.order, _sort_key(user_id, *current)))
+
+
+class Leaderboards:
+    def __init__(self, grace_seconds=60):
+        """grace_seconds: scores newer than this survive a rebuild even if the database
+        doesn't have them yet (they may still be in the write-behind buffer)"""
+        self.grace = grace_seconds
+        self._boards = {}
+        self._recent = deque()  # (monotonic time, game_type, user_id, score, created_at)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.updates = 0
+        self.improvements = 0
+        self.rebuilds = 0
+        self.last_rebuild_rows = 0
+        self.last_rebuild_ms = 0.0
+
+    def _prune(self, now):
+        while self._recent and self._recent[0][0] < now - self.grace:
+            self._recent.popleft()
+
+    def record(self, game_type, user_id, score, created_at):
+        user_id = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            self._recent.append((now, game_type, user_id, score, created_at))
+            self._prune(now)
+            self.updates += 1
+            board = self._boards.setdefault(game_type, Leaderboard())
+            improved = board.update(user_id, score, created_at)
+            self.improvements += improved
+            return improved
+
+    def rebuild(self, rows):
+        """Replace every board from database rows (dicts with user_id, score, game_type, created_at)"""
+        start = time.perf_counter()
+        boards = {}
+        count = 0
+        for row in rows:
+            count += 1
+            best = boards.setdefault(row.get('game_type') or 'balloon_hit', {})
+            user_id, score = str(row.get('user_id') or 'guest'), row.get('score') or 0
+            current = best.get(user_id)
+            if current is None or score > current[0]:
+                best[user_id] = (score, row.get('created_at'))
+
+        # Sorting once is much cheaper than inserting row by row
+        fresh = {}
+        for game_type, best in boards.items():
+            board = Leaderboard()
+            board.best = best
+            board.order = sorted(_sort_key(user_id, *value) for user_id, value in best.items())
+            fresh[game_type] = board
+
+        with self._lock:
+            self._prune(time.monotonic())
+            for _, game_type, user_id, score, created_at in self._recent:
+                fresh.setdefault(game_type, Leaderboard()).update(user_id, score, created_at)
+            self._boards = fresh
+            self._generation += 1
+            self.rebuilds += 1
+            self.last_rebuild_rows = count
+            self.last_rebuild_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    def view(self, game_type, limit, user_id=None):
+        """(top entries, the user's own entry or None, version tag)"""
+        with self._lock:
+            board = self._boards.get(game_type) or Leaderboard()
+            me = board.rank(str(user_id)) if user_id is not None else None
+            return board.top(limit), me, f"{self._generation}.{board.version}"
+
+    def stats(self):
+        with self._lock:
+            return {
+                'game_types': {game_type: len(board.best) for game_type, board in self._boards.items()},
+                'updates': self.updates,
+                'new_bests': self.improvements,
+                'rebuilds': self.rebuilds,
+                'last_rebuild_rows': self.last_rebuild_rows,
+                'last_rebuild_ms': self.last_rebuild_ms,
+            }
@@ -0,0 +1,148 @@
+"""
+Long-lived Gemini clients
+One GenerativeModel per use case, created at startup with its static prompt as
+the system instruction, so each request only sends the dynamic part. Where the
+SDK and model allow it, the instruction is also kept in a server-side context
+cache so it isn't re-processed on every call.
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+
+def _chunk_text(chunk):
+    # Chunks without text parts (e.g. the final finish_reason chunk) raise on .text
+    try:
+        return chunk.text
+    except ValueError:
+        return ''
+
+
+def _cache_missing(error):
+    """The context cache was evicted or expired server-side (any other failure is the caller's)"""
+    message = str(error).lower()
+    if 'cachedcontent' not in message.replace(' ', '') and 'cached content' not in message:
+        return False
+    # google.api_core errors carry the HTTP status as .code
+    return getattr(error, 'code', None) in (403, 404) or 'not found' in message or 'expired' in message
+
+
+class GeminiClient:
+    def __init__(self, genai, model_name, system_instruction, context_cache=True, cache_ttl_seconds=3600,
+                 generation_config=None):
+        """genai: the google.generativeai module (or a stand-in with the same API);
+        generation_config applies to every call, e.g. a JSON response schema"""
+        self.genai = genai
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.cache_ttl = cache_ttl_seconds
+        self.generation_config = generation_config
+        if generation_config:
+            self.model = genai.GenerativeModel(model_name, system_instruction=system_instruction,
+                                               generation_config=generation_config)
+        else:
+            self.model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+        self._context_cache = context_cache and hasattr(genai, 'caching')
+        self._cached_model = None
+        self._cache_expires_at = 0.0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.calls = 0
+        self.cached_calls = 0
+        self.errors = 0
+
+    def _current_model(self):
+        if not self._context_cache:
+            return self.model
+        if self._cached_model is not None and time.monotonic() < self._cache_expires_at:
+            return self._cached_model
+
+        with self._lock:
+            if self._cached_model is not None and time.monotonic() < self._cache_expires_at:
+                return self._cached_model
+            try:
+                cache = self.genai.caching.CachedContent.create(
+                    model=self.model.model_name,
+                    display_name=f"dermamon-{self.model_name}",
+                    system_instruction=self.system_instruction,
+                    ttl=timedelta(seconds=self.cache_ttl),
+                )
+                self._cached_model = self.genai.GenerativeModel.from_cached_content(
+                    cached_content=cache, generation_config=self.generation_config)
+                # Renew a little before the server drops it
+                self._cache_expires_at = time.monotonic() + self.cache_ttl * 0.9
+                print(f"✅ Gemini context cache created for {self.model_name}")
+            except Exception as e:
+                # Prompts below the model's minimum cacheable size land here too
+                print(f"⚠️ Warning: Gemini context caching unavailable, using system instruction only - {e}")
+                self._context_cache = False
+                self._cached_model = None
+                return self.model
+        return self._cached_model
+
+    def generate(self, contents):
+        """Send only the per-request contents; returns the response text"""
+        model = self._current_model()
+        self.calls += 1
+        try:
+            response = model.generate_content(contents)
+            if model is not self.model:
+                self.cached_calls += 1
+        except Exception as e:
+            # Only a vanished cache is worth retrying; quota and server errors would just fail twice
+            if model is self.model or not _cache_missing(e):
+                self.errors += 1
+                raise
+            with self._lock:
+                self._cached_model = None
+                self._cache_expires_at = 0.0
+            try:
+                response = self.model.generate_content(contents)
+            except Exception:
+                self.errors += 1
+                raise
+        return response.text.strip()
+
+    def generate_stream(self, contents):
+        """Yield response text chunks as the model produces them"""
+        model = self._current_model()
+        self.calls += 1
+        started = False
+        try:
+            for chunk in model.generate_content(contents, stream=True):
+                text = _chunk_text(chunk)
+                if text:
+                    started = True
+                    yield text
+            if model is not self.model:
+                self.cached_calls += 1
+            return
+        except Exception as e:
+            if started or model is self.model or not _cache_missing(e):
+                self.errors += 1
+                raise
+            with self._lock:
+                self._cached_model = None
+                self._cache_expires_at = 0.0
+
+        # Nothing was sent yet, so retrying without the context cache is invisible to the caller
+        try:
+            for chunk in self.model.generate_content(contents, stream=True):
+                text = _chunk_text(chunk)
+                if text:
+                    yield text
+        except Exception:
+            self.errors += 1
+            raise
+
+    def stats(self):
+        return {
+            'model': self.model_name,
+            'context_cache': self._cached_model is not None,
+            'calls': self.calls,
+            'cached_calls': self.cached_calls,
+            'errors': self.errors,
+        }
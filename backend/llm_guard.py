@@ -0,0 +1,223 @@
+"""
+Deadline-bounded LLM calls
+Runs model calls on a small dedicated thread pool so a slow upstream can only
+tie up those threads, never the Flask workers. A circuit breaker stops calling
+the model after repeated failures and lets callers go straight to their
+rule-based fallback until a trial call succeeds again.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+class LLMUnavailable(Exception):
+    """The call was not attempted or did not finish; use the fallback"""
+
+
+class CircuitOpenError(LLMUnavailable):
+    pass
+
+
+class LLMOverloaded(LLMUnavailable):
+    pass
+
+
+class LLMDeadlineExceeded(LLMUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        """Opens after failure_threshold consecutive failures; after reset_seconds
+        one trial call is let through (half-open) to decide whether to close"""
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+        # Metrics
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def allow(self):
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = 'half_open'
+            if self._state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def release_trial(self):
+        """The half-open trial ended without an outcome (e.g. the client went away)"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self.times_opened += 1
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_seconds': self.reset_seconds,
+                'times_opened': self.times_opened,
+                'short_circuited': self.short_circuited,
+            }
+
+
+_DONE = object()
+
+
+class GuardedExecutor:
+    def __init__(self, max_workers=4, max_queue=16, timeout_seconds=20.0, breaker=None):
+        """At most max_workers concurrent calls plus max_queue waiting ones"""
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue
+        self.timeout = timeout_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm')
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # Metrics
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise LLMOverloaded("Too many LLM calls in flight")
+            self._pending += 1
+        if not self.breaker.allow():
+            self._release()
+            raise CircuitOpenError("LLM circuit breaker is open")
+        with self._lock:
+            self.calls += 1
+
+    def _release(self, *_):
+        with self._lock:
+            self._pending -= 1
+
+    def _failed(self, timed_out):
+        with self._lock:
+            self.failures += 1
+            if timed_out:
+                self.timeouts += 1
+        self.breaker.record_failure()
+
+    def _succeeded(self):
+        with self._lock:
+            self.successes += 1
+        self.breaker.record_success()
+
+    def call(self, fn, *args, timeout=None):
+        """fn(*args) on the pool; raises LLMUnavailable subclasses or fn's own error"""
+        self._admit()
+        future = self._pool.submit(fn, *args)
+        # The slot is only freed when the call really ends, even after a timeout
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(timeout=timeout or self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            self._failed(timed_out=True)
+            raise LLMDeadlineExceeded(f"LLM call exceeded {timeout or self.timeout:.1f}s")
+        except Exception:
+            self._failed(timed_out=False)
+            raise
+        self._succeeded()
+        return result
+
+    def stream(self, gen_fn, *args, timeout=None):
+        """Iterate gen_fn(*args) on the pool; every chunk must arrive within the deadline"""
+        self._admit()
+        chunks = queue.Queue()
+        stop = threading.Event()
+
+        def pump():
+            try:
+                for chunk in gen_fn(*args):
+                    if stop.is_set():
+                        return
+                    chunks.put(chunk)
+                chunks.put(_DONE)
+            except BaseException as e:
+                chunks.put(e)
+
+        future = self._pool.submit(pump)
+        future.add_done_callback(self._release)
+        deadline = timeout or self.timeout
+        outcome = False
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=deadline)
+                except queue.Empty:
+                    outcome = True
+                    self._failed(timed_out=True)
+                    raise LLMDeadlineExceeded(f"No LLM output for {deadline:.1f}s")
+                if item is _DONE:
+                    outcome = True
+                    self._succeeded()
+                    return
+                if isinstance(item, BaseException):
+                    outcome = True
+                    self._failed(timed_out=False)
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            if not outcome:
+                # Consumer stopped reading; neither a success nor a model failure
+                future.cancel()
+                self.breaker.release_trial()
+
+    def stats(self):
+        with self._lock:
+            executor = {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'timeout_seconds': self.timeout,
+                'in_flight': self._pending,
+                'calls': self.calls,
+                'successes': self.successes,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+            }
+        executor['circuit_breaker'] = self.breaker.stats()
+        return executor
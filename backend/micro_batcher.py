@@ -0,0 +1,159 @@
+"""
+Micro-batching scheduler
+Collects single rows submitted by concurrent request threads and runs them
+through one batched call, handing every caller back its own result.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, batch_fn, max_batch_size=64, max_wait_ms=2.0, latency_window=2048):
+        """batch_fn takes an (N, d) matrix and returns a list of N results"""
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._inflight = 0
+
+        # Metrics
+        self._batches = 0
+        self._rows = 0
+        self._max_queue_depth = 0
+        self._isolated = 0
+        self._histogram = {}
+        self._latencies = deque(maxlen=latency_window)
+
+    def _ensure_worker(self):
+        # Started lazily (and restarted after fork) so pre-forking servers get one per worker
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._queue = queue.Queue()
+                self._inflight = 0
+                self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def submit(self, row, timeout=None):
+        """Queue one feature row and block until its result is ready"""
+        self._ensure_worker()
+        future = Future()
+        start = time.perf_counter()
+
+        with self._lock:
+            self._inflight += 1
+            depth = self._inflight
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+        try:
+            self._queue.put((row, future))
+            result = future.result(timeout=timeout)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                self._latencies.append(time.perf_counter() - start)
+
+        return result
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Nobody else is waiting to be scored, so don't hold the batch open
+            if len(batch) >= self._inflight:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _call(self, rows):
+        results = self.batch_fn(np.array(rows, dtype=float))
+        if len(results) != len(rows):
+            raise ValueError(f"batch_fn returned {len(results)} results for {len(rows)} rows")
+        return results
+
+    @staticmethod
+    def _resolve(futures, results):
+        for future, result in zip(futures, results):
+            future.set_result(result)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            rows = [row for row, _ in batch]
+            futures = [future for _, future in batch]
+
+            try:
+                self._resolve(futures, self._call(rows))
+            except Exception as e:
+                if len(batch) == 1:
+                    futures[0].set_exception(e)
+                else:
+                    # Rerun the rows one at a time so a bad row only fails its own caller
+                    with self._lock:
+                        self._isolated += 1
+                    for row, future in batch:
+                        try:
+                            self._resolve([future], self._call([row]))
+                        except Exception as row_error:
+                            future.set_exception(row_error)
+
+            with self._lock:
+                self._batches += 1
+                self._rows += len(batch)
+                bucket = 1
+                while bucket < len(batch):
+                    bucket *= 2
+                self._histogram[bucket] = self._histogram.get(bucket, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            histogram = dict(sorted(self._histogram.items()))
+            batches, rows = self._batches, self._rows
+            inflight, max_depth = self._inflight, self._max_queue_depth
+            isolated = self._isolated
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 3)
+
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': inflight,
+            'max_queue_depth': max_depth,
+            'batches': batches,
+            'rows': rows,
+            'avg_batch_size': round(rows / batches, 2) if batches else 0,
+            'failed_batches_rerun_per_row': isolated,
+            'batch_size_histogram': {f'<={k}': v for k, v in histogram.items()},
+            'latency_ms_p50': percentile(0.50),
+            'latency_ms_p99': percentile(0.99),
+        }
@@ -0,0 +1,136 @@
+"""
+Bounded bcrypt pool
+bcrypt is deliberately slow (hundreds of ms of CPU per call), so hashing and
+checking passwords runs in a small dedicated pool of worker processes instead
+of on the request threads. At most workers + max_queue calls are admitted at
+once; beyond that callers get AuthOverloaded straight away rather than
+stalling every other endpoint behind a burst of logins.
+
+Worker processes are forked, so the pool has to be created while its process
+is still single-threaded; app.py does that before any other import. If a
+worker dies (e.g. OOM-killed) the pool is replaced once by a thread pool,
+because forking again from the now multi-threaded server would not be safe.
+"""
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+
+class AuthOverloaded(Exception):
+    pass
+
+
+def _hash(password, rounds):
+    start = time.perf_counter()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    return hashed, time.perf_counter() - start
+
+
+def _check(password, hashed):
+    start = time.perf_counter()
+    matches = bcrypt.checkpw(password, hashed)
+    return matches, time.perf_counter() - start
+
+
+class PasswordHasher:
+    def __init__(self, workers=2, max_queue=32, rounds=12):
+        """Create this before starting other threads: workers are forked once, up front,
+        and only while this is the only thread; otherwise a thread pool is used"""
+        bcrypt.gensalt(rounds)  # fails fast on an out-of-range cost
+        self.workers = workers
+        self.max_pending = workers + max_queue
+        self.rounds = rounds
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # Metrics
+        self.calls = {'hash': 0, 'check': 0}
+        self.rejected = 0
+        self.failures = 0
+        self.max_depth = 0
+        self.rebuilds = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+        if 'fork' in multiprocessing.get_all_start_methods() and threading.active_count() == 1:
+            self.executor = 'process'
+            self._pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+            # Fork every worker now, while this is the only thread, rather than on the first login
+            for future in [self._pool.submit(_hash, b'warm-up', 4) for _ in range(workers)]:
+                future.result()
+        else:
+            self._use_threads()
+
+    def _use_threads(self):
+        # Spawned workers would re-import app.py; bcrypt releases the GIL, so threads still run in parallel
+        self.executor = 'thread'
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='bcrypt')
+
+    def _submit(self, fn, *args):
+        pool = self._pool
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool as e:
+            with self._lock:
+                if self._pool is pool:
+                    print(f"⚠️ Warning: bcrypt worker process died, continuing in threads - {e}")
+                    self.rebuilds += 1
+                    self._use_threads()
+                    pool.shutdown(wait=False)
+            # Hashing and checking have no side effects, so the call is simply run again
+            return self._pool.submit(fn, *args).result()
+
+    def _run(self, op, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise AuthOverloaded(f"{self._pending} password checks already in progress")
+            self._pending += 1
+            self.max_depth = max(self.max_depth, self._pending)
+        start = time.perf_counter()
+        try:
+            result, run = self._submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            with self._lock:
+                self._pending -= 1
+        with self._lock:
+            self.calls[op] += 1
+            self.total_run += run
+            self.total_wait += time.perf_counter() - start - run
+        return result
+
+    def hash(self, password):
+        """bcrypt hash of password (str) at the configured cost, as str"""
+        return self._run('hash', _hash, password.encode('utf-8'), self.rounds).decode('utf-8')
+
+    def check(self, password, hashed):
+        return self._run('check', _check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def stats(self):
+        with self._lock:
+            completed = sum(self.calls.values())
+            return {
+                'executor': self.executor,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'rounds': self.rounds,
+                'pending': self._pending,
+                'queued': max(self._pending - self.workers, 0),
+                'max_depth': self.max_depth,
+                'hashes': self.calls['hash'],
+                'checks': self.calls['check'],
+                'rejected': self.rejected,
+                'failures': self.failures,
+                'rebuilds': self.rebuilds,
+                'avg_wait_ms': round(self.total_wait / completed * 1000, 2) if completed else 0.0,
+                'avg_run_ms': round(self.total_run / completed * 1000, 2) if completed else 0.0,
+            }
@@ -0,0 +1,297 @@
+"""
+Product catalog with a trigram name index
+Loads master_products.csv (from load-datasets.ipynb) and answers typo-tolerant
+name lookups with ranked candidates. The index can be prebuilt offline:
+
+    python product_search.py build skincare_datasets/master_products.csv models/product_catalog.dmcat
+
+The build writes a memory-mapped columnar file (see catalog_store.py) that
+already contains the index and the safer-alternative vectors, so loading it
+is independent of catalog size.
+"""
+
+import csv
+import math
+import os
+import re
+import sys
+
+from datetime import datetime
+
+import numpy as np
+
+from catalog_store import ColumnStore, file_stamp, write_store
+
+NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_name(text):
+    return NON_ALNUM.sub(' ', str(text).lower()).strip()
+
+
+def trigrams(text):
+    """pg_trgm style trigrams: each word padded with two leading and one trailing space"""
+    grams = set()
+    for word in normalize_name(text).split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class TrigramIndex:
+    def __init__(self, grams, offsets, postings, key_docs, key_lengths):
+        """Sorted trigram table with CSR postings: keys containing grams[g] are
+        postings[offsets[g]:offsets[g + 1]]; key_docs maps each key to its document"""
+        self.grams = grams
+        self.offsets = offsets
+        self.postings = postings
+        self.key_docs = key_docs
+        self.key_lengths = key_lengths
+
+    @classmethod
+    def build(cls, keys, key_docs):
+        """keys: searchable strings, key_docs: document id for each key"""
+        gram_ids = {}
+        lists = []
+        key_lengths = np.zeros(len(keys), dtype=np.int32)
+        for key_id, key in enumerate(keys):
+            grams = trigrams(key)
+            key_lengths[key_id] = len(grams)
+            for gram in grams:
+                gid = gram_ids.get(gram)
+                if gid is None:
+                    gid = len(gram_ids)
+                    gram_ids[gram] = gid
+                    lists.append([])
+                lists[gid].append(key_id)
+
+        # Sorted gram table so lookups are a vectorised binary search
+        ordered = sorted(gram_ids)
+        lists = [lists[gram_ids[g]] for g in ordered]
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in lists])
+        postings = np.fromiter((k for p in lists for k in p), dtype=np.int32, count=int(offsets[-1]))
+
+        return cls(np.array([g.encode('ascii') for g in ordered], dtype='S3'), offsets, postings,
+                   np.asarray(key_docs, dtype=np.int32), key_lengths)
+
+    def _gram_ids(self, grams):
+        if len(self.grams) == 0:
+            return []
+        wanted = np.array([g.encode('ascii') for g in grams], dtype='S3')
+        pos = np.minimum(np.searchsorted(self.grams, wanted), len(self.grams) - 1)
+        return pos[self.grams[pos] == wanted].tolist()
+
+    def _posting(self, gid):
+        return self.postings[self.offsets[gid]:self.offsets[gid + 1]]
+
+    def search(self, query, limit=10, min_score=0.3):
+        """[(doc_id, score)] ranked by trigram Dice similarity, one entry per document"""
+        grams = trigrams(query)
+        if not grams or len(self.key_docs) == 0:
+            return []
+
+        # Prefix filtering: a key scoring >= min_score shares at least
+        # min_overlap grams with the query, so it must contain one of the
+        # (q - min_overlap + 1) rarest ones. When those are selective only they
+        # are probed and the common grams are just checked against candidates.
+        q = len(grams)
+        min_overlap = max(1, math.ceil(min_score * q / (2.0 - min_score)))
+        known = sorted(self._gram_ids(grams), key=lambda gid: self.offsets[gid + 1] - self.offsets[gid])
+        n_probe = (q - min_overlap + 1) - (q - len(known))  # unknown grams are the rarest
+        if n_probe <= 0:
+            return []
+
+        # Probing costs roughly one lookup per candidate per remaining gram
+        lengths = [self.offsets[gid + 1] - self.offsets[gid] for gid in known]
+        probe_cost = sum(lengths[:n_probe]) * (1 + len(known) - n_probe)
+        if probe_cost < sum(lengths):
+            hits = np.concatenate([self._posting(gid) for gid in known[:n_probe]])
+            candidates, counts = np.unique(hits, return_counts=True)
+            for gid in known[n_probe:]:
+                posting = self._posting(gid)
+                pos = np.minimum(np.searchsorted(posting, candidates), len(posting) - 1)
+                counts += posting[pos] == candidates
+        else:
+            # Rare grams aren't selective here; one counting pass over everything is cheaper
+            hits = np.concatenate([self._posting(gid) for gid in known])
+            counts = np.bincount(hits, minlength=len(self.key_docs))
+            candidates = np.flatnonzero(counts >= min_overlap)
+            counts = counts[candidates]
+
+        scores = 2.0 * counts / (q + self.key_lengths[candidates])
+        keep = scores >= min_score
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) == 0:
+            return []
+
+        # Over-fetch because a document can be indexed under several keys
+        k = min(len(scores), limit * 3)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((candidates[top], -scores[top]))]
+
+        results = []
+        seen = set()
+        for i in top:
+            doc_id = int(self.key_docs[candidates[i]])
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            results.append((doc_id, float(scores[i])))
+            if len(results) == limit:
+                break
+        return results
+
+
+PRODUCT_TEXT_COLUMNS = ['name', 'brand', 'category', 'ingredients', 'source']
+PRODUCT_NUMERIC_COLUMNS = ['price', 'rating']
+
+
+class StoredProducts:
+    def __init__(self, store):
+        """Read-only product rows backed by a memory-mapped ColumnStore"""
+        self.store = store
+        self._text = {col: store.strings(col) for col in PRODUCT_TEXT_COLUMNS}
+        self._numeric = {col: store.array(col) for col in PRODUCT_NUMERIC_COLUMNS}
+
+    def __len__(self):
+        return self.store.n_rows
+
+    def __getitem__(self, i):
+        product = {col: values[i] for col, values in self._text.items()}
+        for col, values in self._numeric.items():
+            value = float(values[i])
+            product[col] = None if math.isnan(value) else value
+        return product
+
+
+class ProductCatalog:
+    def __init__(self, products, index=None, store=None):
+        """products: sequence of dicts with name, brand, category, ingredients, ...;
+        store: the ColumnStore they were mapped from, if any"""
+        self.products = products
+        self.index = index if index is not None else self._build_index(products)
+        self.store = store
+
+    @staticmethod
+    def _build_index(products):
+        # Every product is findable by its name and by "brand name"
+        keys, key_docs = [], []
+        for doc_id, product in enumerate(products):
+            name = normalize_name(product.get('name', ''))
+            brand = normalize_name(product.get('brand', ''))
+            keys.append(name)
+            key_docs.append(doc_id)
+            if brand and not name.startswith(brand):
+                keys.append(f"{brand} {name}")
+                key_docs.append(doc_id)
+        return TrigramIndex.build(keys, key_docs)
+
+    def __len__(self):
+        return len(self.products)
+
+    def search(self, query, limit=10, min_score=0.3):
+        """[(doc_id, product, score)] best first"""
+        return [(doc_id, self.products[doc_id], score)
+                for doc_id, score in self.index.search(query, limit, min_score)]
+
+    def save(self, path, meta=None, arrays=None):
+        """Write products and index to the columnar format read by from_store;
+        arrays adds extra per-product columns ({name: ndarray})"""
+        index = self.index
+        write_store(
+            path, len(self.products),
+            strings={col: [p.get(col) or '' for p in self.products] for col in PRODUCT_TEXT_COLUMNS},
+            arrays=dict(
+                {col: np.array([np.nan if p.get(col) is None else p[col] for p in self.products],
+                               dtype='<f8')
+                 for col in PRODUCT_NUMERIC_COLUMNS},
+                index_grams=index.grams, index_offsets=index.offsets, index_postings=index.postings,
+                index_key_docs=index.key_docs, index_key_lengths=index.key_lengths,
+                **(arrays or {}),
+            ),
+            meta=meta,
+        )
+
+    @classmethod
+    def from_store(cls, store):
+        index = TrigramIndex(store.array('index_grams'), store.array('index_offsets'),
+                             store.array('index_postings'), store.array('index_key_docs'),
+                             store.array('index_key_lengths'))
+        return cls(StoredProducts(store), index, store)
+
+
+def _to_float(value):
+    try:
+        return float(value) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def read_master_products(csv_path):
+    products = []
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            name = (row.get('product_name') or '').strip()
+            if not name or name.lower() == 'nan':
+                continue
+            ingredients = (row.get('ingredients') or '').strip()
+            price, rating = _to_float(row.get('price')), _to_float(row.get('rating'))
+            products.append({
+                'name': name,
+                'brand': (row.get('brand') or '').strip(),
+                'category': (row.get('category') or '').strip(),
+                'ingredients': '' if ingredients.lower() == 'nan' else ingredients,
+                'source': (row.get('source') or '').strip(),
+                'price': None if price is None or math.isnan(price) else price,
+                'rating': None if rating is None or math.isnan(rating) else rating,
+            })
+    return products
+
+
+def build_catalog_file(csv_path, out_path, derived=None):
+    """derived: optional callable(products) -> (arrays, meta) that precomputes
+    extra per-product columns, stored alongside the index"""
+    catalog = ProductCatalog(read_master_products(csv_path))
+    arrays, meta = derived(catalog.products) if derived else ({}, {})
+    catalog.save(out_path, meta=dict(meta, **{
+        'source_path': os.path.abspath(csv_path),
+        'source': file_stamp(csv_path),
+        'built_at': datetime.now().isoformat(),
+    }), arrays=arrays)
+    return catalog
+
+
+def load_product_catalog(csv_path=None, store_path=None, verify=False):
+    """Memory-map the prebuilt catalog if it is current, else index the CSV in memory"""
+    if store_path and os.path.exists(store_path):
+        try:
+            store = ColumnStore(store_path, verify=verify)
+            if csv_path and os.path.exists(csv_path) and store.meta.get('source') != file_stamp(csv_path):
+                print(f"⚠️ Warning: {store_path} is stale ({csv_path} changed), "
+                      f"rebuild it with: python product_search.py build {csv_path} {store_path}")
+            else:
+                catalog = ProductCatalog.from_store(store)
+                print(f"✅ Product catalog mapped from {store_path}: {len(catalog)} products")
+                return catalog
+        except Exception as e:
+            print(f"⚠️ Warning: Could not open product catalog {store_path} - {e}")
+
+    if csv_path and os.path.exists(csv_path):
+        catalog = ProductCatalog(read_master_products(csv_path))
+        print(f"✅ Product catalog indexed: {len(catalog)} products")
+        return catalog
+
+    print("⚠️ Warning: master product catalog not found, searching built-in products only")
+    return ProductCatalog([])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'build':
+        print("Usage: python product_search.py build <master_products.csv> <output.dmcat>")
+        sys.exit(1)
+    # Safer-alternative vectors use the app's knowledge base, so they come from app.py
+    from app import alternative_columns
+    catalog = build_catalog_file(sys.argv[2], sys.argv[3], alternative_columns)
+    print(f"✅ Wrote {len(catalog)} products to {sys.argv[3]}")
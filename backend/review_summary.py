@@ -0,0 +1,130 @@
+"""
+Per-product review summaries
+Count, mean rating and a 1-5 rating histogram per product, overall and per
+skin_type, kept in memory and updated as reviews are added so a product page
+never has to scan its reviews. Summaries are seeded from the reviews table at
+startup and rebuilt from it periodically to pick up reviews written elsewhere.
+"""
+
+import threading
+import time
+
+RATINGS = (1, 2, 3, 4, 5)
+
+
+def _rating(value):
+    """The review's rating as 1-5, or None when it can't be counted"""
+    if isinstance(value, bool):
+        return None
+    try:
+        rating = int(round(float(value)))
+    except (TypeError, ValueError):
+        return None
+    return rating if rating in RATINGS else None
+
+
+class RatingStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.histogram = [0] * len(RATINGS)
+
+    def add(self, rating):
+        self.count += 1
+        self.total += rating
+        self.histogram[rating - 1] += 1
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'mean_rating': round(self.total / self.count, 2) if self.count else None,
+            'histogram': {str(rating): n for rating, n in zip(RATINGS, self.histogram)},
+        }
+
+
+class ProductSummary:
+    def __init__(self):
+        self.overall = RatingStats()
+        self.by_skin_type = {}
+
+    def add(self, rating, skin_type):
+        self.overall.add(rating)
+        self.by_skin_type.setdefault(skin_type or 'unspecified', RatingStats()).add(rating)
+
+    def as_dict(self):
+        summary = self.overall.as_dict()
+        summary['by_skin_type'] = {skin_type: stats.as_dict() for skin_type, stats in sorted(self.by_skin_type.items())}
+        return summary
+
+
+class ReviewSummaries:
+    def __init__(self):
+        self._products = {}
+        self._rebuilding = None  # reviews added while a rebuild scans the table: {id: review}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.updates = 0
+        self.skipped = 0
+        self.reads = 0
+        self.rebuilds = 0
+        self.last_rebuild_rows = 0
+        self.last_rebuild_ms = 0.0
+
+    def add(self, review):
+        """Fold one new review (a dict with id, product_name, rating, skin_type) into its product"""
+        rating = _rating(review.get('rating'))
+        with self._lock:
+            if rating is None or not review.get('product_name'):
+                self.skipped += 1
+                return False
+            self._products.setdefault(review['product_name'], ProductSummary()).add(rating, review.get('skin_type'))
+            self.updates += 1
+            if self._rebuilding is not None and review.get('id') is not None:
+                self._rebuilding[review['id']] = review
+            return True
+
+    def rebuild(self, rows):
+        """Replace every summary from database rows; reviews added mid-scan that it missed are kept"""
+        start = time.perf_counter()
+        with self._lock:
+            self._rebuilding = {}
+        try:
+            products, seen, count = {}, set(), 0
+            for row in rows:
+                count += 1
+                seen.add(row.get('id'))
+                rating = _rating(row.get('rating'))
+                if rating is not None and row.get('product_name'):
+                    products.setdefault(row['product_name'], ProductSummary()).add(rating, row.get('skin_type'))
+
+            with self._lock:
+                for review_id, review in self._rebuilding.items():
+                    if review_id not in seen:
+                        products.setdefault(review['product_name'], ProductSummary()).add(
+                            _rating(review['rating']), review.get('skin_type'))
+                self._products = products
+                self.rebuilds += 1
+                self.last_rebuild_rows = count
+                self.last_rebuild_ms = round((time.perf_counter() - start) * 1000, 2)
+        finally:
+            with self._lock:
+                self._rebuilding = None
+
+    def get(self, product_name):
+        with self._lock:
+            self.reads += 1
+            summary = self._products.get(product_name) or ProductSummary()
+            return summary.as_dict()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'products': len(self._products),
+                'updates': self.updates,
+                'skipped': self.skipped,
+                'reads': self.reads,
+                'rebuilds': self.rebuilds,
+                'last_rebuild_rows': self.last_rebuild_rows,
+                'last_rebuild_ms': self.last_rebuild_ms,
+            }
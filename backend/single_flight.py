@@ -0,0 +1,75 @@
+"""
+Single-flight call deduplication
+Concurrent requests for the same key share one in-flight computation: the
+first caller runs it, everyone else waits for its result.
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for the in-flight call")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.leaders = 0
+        self.shared = 0
+
+    def begin(self, key):
+        """(call, is_leader); the leader must later call finish(key, call, ...)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.leaders += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        """Publish the leader's outcome to waiters; later calls are ignored"""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            if call.done.is_set():
+                return
+            call.result = result
+            call.error = error
+            call.done.set()
+
+    def do(self, key, fn, timeout=None):
+        """(result, shared): run fn once per key across concurrent callers"""
+        call, leader = self.begin(key)
+        if not leader:
+            return call.wait(timeout), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leader_calls': self.leaders,
+                'shared_calls': self.shared,
+            }
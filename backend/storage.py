@@ -0,0 +1,310 @@
+"""
+Storage backends for users, reviews and game scores
+Routes talk to one of these instead of calling supabase.table(...) directly:
+SupabaseStorage wraps a Supabase client and reuses its HTTP session for every
+call; SQLiteStorage keeps everything in a local WAL-mode database for
+single-node deployments and load tests without a Supabase project.
+"""
+
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import time
+from datetime import datetime
+
+USER_COLUMNS = ('id', 'email', 'password', 'name', 'profile_picture', 'created_at')
+REVIEW_COLUMNS = ('id', 'user_id', 'product_name', 'rating', 'review_text', 'skin_type', 'created_at')
+
+
+def _columns(columns, allowed):
+    # Column names end up in the query text, so only known ones get through
+    unknown = [column for column in columns if column not in allowed]
+    if unknown:
+        raise ValueError(f"unknown columns: {', '.join(unknown)}")
+    return ','.join(columns)
+
+
+class Storage(ABC):
+    """Operations the routes need; every method is safe to call from any thread"""
+    name = 'storage'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.calls = {}
+        self.errors = 0
+        self.total_time = 0.0
+
+    def _timed(self, op, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.calls[op] = self.calls.get(op, 0) + 1
+                self.total_time += time.perf_counter() - start
+
+    # Users
+    @abstractmethod
+    def create_user(self, user):
+        """Insert a user row and return it with its id"""
+
+    @abstractmethod
+    def get_user_by_email(self, email):
+        pass
+
+    @abstractmethod
+    def get_user(self, user_id, columns=USER_COLUMNS):
+        pass
+
+    @abstractmethod
+    def update_user(self, user_id, fields, columns=USER_COLUMNS):
+        """The updated row (only columns), or None when there is no such user"""
+
+    # Reviews
+    @abstractmethod
+    def add_review(self, review):
+        pass
+
+    @abstractmethod
+    def list_reviews(self, product_name, columns, limit, after=None):
+        """Newest first by (created_at, id); after=(created_at, id) starts just past that review"""
+
+    @abstractmethod
+    def iter_review_ratings(self, page_size=1000):
+        """Every review's id, product_name, rating and skin_type"""
+
+    # Game scores
+    @abstractmethod
+    def add_game_scores(self, rows):
+        pass
+
+    @abstractmethod
+    def iter_game_scores(self, page_size=1000):
+        """Every score's user_id, score, game_type and created_at"""
+
+    def is_rejection(self, error):
+        """True when error means the rows themselves were refused, so retrying them can't help"""
+        return isinstance(error, (TypeError, ValueError))
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.calls.values())
+            return {
+                'backend': self.name,
+                'calls': dict(self.calls),
+                'errors': self.errors,
+                'avg_ms': round(self.total_time / total * 1000, 2) if total else 0.0,
+            }
+
+
+class SupabaseStorage(Storage):
+    name = 'supabase'
+
+    def __init__(self, client):
+        super().__init__()
+        # One PostgREST client, and with it one pooled keep-alive HTTP session, for every call
+        self._rest = getattr(client, 'postgrest', None) or client
+
+    def _table(self, name):
+        return self._rest.table(name)
+
+    def _paged(self, table, columns, page_size):
+        # Keyset pages: each one starts from the primary key instead of skipping earlier rows
+        last_id = None
+        while True:
+            query = self._table(table).select(f"id,{columns}")
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = self._timed('scan_' + table, lambda: query.order('id').limit(page_size).execute().data)
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]['id']
+
+    def create_user(self, user):
+        return self._timed('create_user', lambda: self._table('users').insert(user).execute().data[0])
+
+    def get_user_by_email(self, email):
+        rows = self._timed('get_user_by_email', lambda: self._table('users').select('*').eq('email', email).execute().data)
+        return rows[0] if rows else None
+
+    def get_user(self, user_id, columns=USER_COLUMNS):
+        select = _columns(columns, USER_COLUMNS)
+        rows = self._timed('get_user', lambda: self._table('users').select(select).eq('id', user_id).execute().data)
+        return rows[0] if rows else None
+
+    def update_user(self, user_id, fields, columns=USER_COLUMNS):
+        _columns(fields, USER_COLUMNS)
+        rows = self._timed('update_user', lambda: self._table('users').update(fields).eq('id', user_id).execute().data)
+        # PostgREST returns the whole row after an update
+        return {column: rows[0].get(column) for column in columns} if rows else None
+
+    def add_review(self, review):
+        return self._timed('add_review', lambda: self._table('reviews').insert(review).execute().data[0])
+
+    def list_reviews(self, product_name, columns, limit, after=None):
+        query = self._table('reviews').select(_columns(columns, REVIEW_COLUMNS)).eq('product_name', product_name)
+        if after:
+            # Rebuilt from parsed values, never pasted in as given
+            created_at, review_id = datetime.fromisoformat(str(after[0])).isoformat(), int(after[1])
+            query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{review_id})')
+        query = query.order('created_at', desc=True).order('id', desc=True).limit(limit)
+        return self._timed('list_reviews', lambda: query.execute().data)
+
+    def iter_review_ratings(self, page_size=1000):
+        return self._paged('reviews', 'product_name,rating,skin_type', page_size)
+
+    def add_game_scores(self, rows):
+        self._timed('add_game_scores', lambda: self._table('game_scores').insert(rows).execute())
+
+    def iter_game_scores(self, page_size=1000):
+        return self._paged('game_scores', 'user_id,score,game_type,created_at', page_size)
+
+    def is_rejection(self, error):
+        # Postgres data exceptions (22xxx) and constraint violations (23xxx)
+        code = getattr(error, 'code', None)
+        return super().is_rejection(error) or (isinstance(code, str) and code[:2] in ('22', '23'))
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    password TEXT NOT NULL,
+    name TEXT,
+    profile_picture TEXT,
+    created_at TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users (email);
+
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    product_name TEXT,
+    rating INTEGER,
+    review_text TEXT,
+    skin_type TEXT,
+    created_at TEXT
+);
+-- Serves both the product filter and the newest-first keyset pagination
+CREATE INDEX IF NOT EXISTS idx_reviews_product ON reviews (product_name, created_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS game_scores (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    score NUMERIC,
+    game_type TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_game_scores_type_score ON game_scores (game_type, score DESC);
+"""
+
+
+class SQLiteStorage(Storage):
+    name = 'sqlite'
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        super().__init__()
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SQLITE_SCHEMA)
+
+    def _connect(self):
+        # One connection per thread; WAL lets readers run while a writer commits
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql, params=()):
+        return [dict(row) for row in self._connect().execute(sql, params).fetchall()]
+
+    def _insert(self, table, row, allowed):
+        columns = [column for column in row if column != 'id']
+        sql = f"INSERT INTO {table} ({_columns(columns, allowed)}) VALUES ({','.join('?' * len(columns))})"
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(sql, [row[column] for column in columns])
+        return self._query(f"SELECT * FROM {table} WHERE id = ?", (cursor.lastrowid,))[0]
+
+    def _paged(self, table, columns, page_size):
+        last_id = 0
+        while True:
+            rows = self._timed('scan_' + table, self._query,
+                               f"SELECT id,{columns} FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (last_id, page_size))
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]['id']
+
+    def create_user(self, user):
+        return self._timed('create_user', self._insert, 'users', user, USER_COLUMNS)
+
+    def get_user_by_email(self, email):
+        rows = self._timed('get_user_by_email', self._query, "SELECT * FROM users WHERE email = ?", (email,))
+        return rows[0] if rows else None
+
+    def get_user(self, user_id, columns=USER_COLUMNS):
+        rows = self._timed('get_user', self._query,
+                           f"SELECT {_columns(columns, USER_COLUMNS)} FROM users WHERE id = ?", (user_id,))
+        return rows[0] if rows else None
+
+    def update_user(self, user_id, fields, columns=USER_COLUMNS):
+        def update():
+            conn = self._connect()
+            if fields:
+                assignments = ', '.join(f"{column} = ?" for column in _columns(fields, USER_COLUMNS).split(','))
+                with conn:
+                    conn.execute(f"UPDATE users SET {assignments} WHERE id = ?", [*fields.values(), user_id])
+            rows = self._query(f"SELECT {_columns(columns, USER_COLUMNS)} FROM users WHERE id = ?", (user_id,))
+            return rows[0] if rows else None
+        return self._timed('update_user', update)
+
+    def add_review(self, review):
+        return self._timed('add_review', self._insert, 'reviews', review, REVIEW_COLUMNS)
+
+    def list_reviews(self, product_name, columns, limit, after=None):
+        sql = f"SELECT {_columns(columns, REVIEW_COLUMNS)} FROM reviews WHERE product_name = ?"
+        params = [product_name]
+        if after:
+            sql += " AND (created_at, id) < (?, ?)"
+            params += list(after)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        return self._timed('list_reviews', self._query, sql, params + [limit])
+
+    def iter_review_ratings(self, page_size=1000):
+        return self._paged('reviews', 'product_name,rating,skin_type', page_size)
+
+    def add_game_scores(self, rows):
+        def insert():
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO game_scores (user_id, score, game_type, created_at) VALUES (?, ?, ?, ?)",
+                    [(row.get('user_id'), row.get('score'), row.get('game_type'), row.get('created_at')) for row in rows])
+        self._timed('add_game_scores', insert)
+
+    def is_rejection(self, error):
+        if super().is_rejection(error) or isinstance(error, (sqlite3.IntegrityError, sqlite3.DataError)):
+            return True
+        # A value sqlite3 can't bind (e.g. a dict): InterfaceError before Python 3.11, ProgrammingError since
+        return isinstance(error, (sqlite3.InterfaceError, sqlite3.ProgrammingError)) and 'binding parameter' in str(error)
+
+    def iter_game_scores(self, page_size=1000):
+        return self._paged('game_scores', 'user_id,score,game_type,created_at', page_size)
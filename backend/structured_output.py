@@ -0,0 +1,164 @@
+"""
+Schema-checked JSON from the model
+The schema is declared once and used twice: as Gemini's response_schema, so the
+model is constrained to produce it, and here to validate what comes back.
+Near misses (code fences, trailing commas, "85%", a string instead of a list)
+are repaired locally; only output that can't be repaired needs another call.
+"""
+
+import json
+import re
+import threading
+
+IMAGE_ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'severity': {'type': 'string', 'format': 'enum', 'enum': ['mild', 'moderate', 'severe']},
+        'type': {'type': 'string', 'description': 'Condition name, e.g. contact dermatitis, eczema, allergic reaction'},
+        'confidence': {'type': 'integer', 'description': 'Confidence from 0 to 100'},
+        'observations': {'type': 'array', 'items': {'type': 'string'}},
+        'recommendations': {'type': 'array', 'items': {'type': 'string'}},
+    },
+    'required': ['severity', 'type', 'confidence', 'observations', 'recommendations'],
+}
+
+TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+
+class OutputInvalid(ValueError):
+    pass
+
+
+def _loads(text):
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+
+    # Prose or code fences around the object, or a trailing comma inside it
+    start, end = text.find('{'), text.rfind('}')
+    if start == -1 or end < start:
+        raise OutputInvalid("no JSON object in the response")
+    candidate = TRAILING_COMMA.sub(r'\1', text[start:end + 1])
+    try:
+        return json.loads(candidate), True
+    except ValueError as e:
+        raise OutputInvalid(f"malformed JSON: {e}")
+
+
+class StructuredOutput:
+    def __init__(self, schema, ranges=None):
+        """ranges: {property: (low, high)} clamps for numbers (response_schema has no min/max)"""
+        self.schema = schema
+        self.ranges = ranges or {}
+        self._lock = threading.Lock()
+
+        # Metrics (responses counts first attempts; a re-prompt either recovers or discards one)
+        self.responses = 0
+        self.valid = 0
+        self.repaired = 0
+        self.parse_failures = 0
+        self.recovered = 0
+        self.discarded = 0
+
+    def generation_config(self):
+        return {'response_mime_type': 'application/json', 'response_schema': self.schema}
+
+    def _coerce(self, value, schema, name):
+        kind = schema['type']
+        if kind == 'object':
+            if not isinstance(value, dict):
+                raise OutputInvalid(f"{name or 'response'} is not an object")
+            result, changed = {}, False
+            for key, sub in schema['properties'].items():
+                if key not in value:
+                    # An empty list is a safe stand-in; a missing scalar is not
+                    if sub['type'] == 'array':
+                        result[key], changed = [], True
+                    elif key in schema.get('required', ()):
+                        raise OutputInvalid(f"missing '{key}'")
+                    continue
+                result[key], sub_changed = self._coerce(value[key], sub, key)
+                changed |= sub_changed
+            return result, changed or len(value) != len(result)
+
+        if kind == 'array':
+            if isinstance(value, str):
+                value = [value]
+                changed = True
+            elif isinstance(value, list):
+                changed = False
+            else:
+                raise OutputInvalid(f"'{name}' is not a list")
+            items = [self._coerce(item, schema['items'], name) for item in value if item not in (None, '')]
+            return [item for item, _ in items], changed or len(items) != len(value) or any(c for _, c in items)
+
+        if kind == 'integer':
+            if isinstance(value, bool):
+                raise OutputInvalid(f"'{name}' is not a number")
+            try:
+                number = int(round(float(str(value).strip().rstrip('%'))))
+            except (ValueError, OverflowError):  # OverflowError: "inf", "1e400"
+                raise OutputInvalid(f"'{name}' is not a number")
+            low, high = self.ranges.get(name, (number, number))
+            clamped = min(max(number, low), high)
+            return clamped, clamped != value
+
+        # string
+        if not isinstance(value, str):
+            if isinstance(value, (dict, list)):
+                raise OutputInvalid(f"'{name}' is not a string")
+            return str(value), True
+        if 'enum' not in schema:
+            return value, False
+        text = value.strip().lower()
+        if text in schema['enum']:
+            return text, text != value
+        # "mild to moderate" -> first allowed value it mentions
+        for option in schema['enum']:
+            if option in text:
+                return option, True
+        raise OutputInvalid(f"'{name}' must be one of {', '.join(schema['enum'])}")
+
+    def parse(self, text, reprompted=False):
+        """Validated dict; raises OutputInvalid when the text can't be repaired locally"""
+        try:
+            value, repaired_syntax = _loads(text)
+            value, repaired_values = self._coerce(value, self.schema, '')
+        except OutputInvalid:
+            with self._lock:
+                if reprompted:
+                    self.discarded += 1
+                else:
+                    self.responses += 1
+                    self.parse_failures += 1
+            raise
+
+        with self._lock:
+            if reprompted:
+                self.recovered += 1
+                return value
+            self.responses += 1
+            if repaired_syntax or repaired_values:
+                self.repaired += 1
+            else:
+                self.valid += 1
+        return value
+
+    def repair_prompt(self, text, error):
+        """Text-only follow-up asking the model to fix its own output (no image re-sent)"""
+        return (f"Your previous reply could not be used ({error}). Rewrite it as one JSON object with exactly "
+                f"these fields: {', '.join(self.schema['properties'])}. Previous reply:\n{text[:4000]}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'responses': self.responses,
+                'valid': self.valid,
+                'repaired': self.repaired,
+                'parse_failures': self.parse_failures,
+                'recovered_by_reprompt': self.recovered,
+                'discarded': self.discarded,
+                'parse_failure_rate': round(self.parse_failures / self.responses, 4) if self.responses else 0.0,
+                'discard_rate': round(self.discarded / self.responses, 4) if self.responses else 0.0,
+            }
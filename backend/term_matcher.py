@@ -0,0 +1,140 @@
+"""
+Multi-pattern term matchers
+TermMatcher (Aho-Corasick) finds substrings; PhraseMatcher finds whole-word
+phrases. Both are built once at startup and scan each text a single time.
+"""
+
+import re
+from collections import deque
+
+WORD = re.compile(r'[a-z0-9]+')
+
+
+def words(text):
+    return WORD.findall(text.lower())
+
+
+class TermMatcher:
+    def __init__(self, terms_by_label):
+        """Compile {label: [terms]} into a single automaton"""
+        self.labels = list(terms_by_label.keys())
+        self._bits = {label: 1 << i for i, label in enumerate(self.labels)}
+        self.full_mask = (1 << len(self.labels)) - 1
+
+        # Trie: one transition dict and one output mask per state
+        self._goto = [{}]
+        self._out = [0]
+
+        for label, terms in terms_by_label.items():
+            for term in terms:
+                term = term.strip().lower()
+                if not term:
+                    continue
+                state = 0
+                for ch in term:
+                    nxt = self._goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[state][ch] = nxt
+                        self._goto.append({})
+                        self._out.append(0)
+                    state = nxt
+                self._out[state] |= self._bits[label]
+
+        self._build_transitions()
+        self._label_sets = {}
+
+    def _build_transitions(self):
+        """Add failure links and flatten them into a full transition table"""
+        fail = [0] * len(self._goto)
+        root = self._goto[0]
+        delta = [dict(root)] + [None] * (len(self._goto) - 1)
+
+        queue = deque(root.values())
+
+        # BFS order guarantees a state's failure target is finished first
+        while queue:
+            state = queue.popleft()
+            self._out[state] |= self._out[fail[state]]
+
+            # Inherit the failure state's moves, then override with our own
+            moves = dict(delta[fail[state]])
+            for ch, nxt in self._goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0)
+                moves[ch] = nxt
+                queue.append(nxt)
+            delta[state] = moves
+
+        self._delta = delta
+
+    def match_mask(self, text):
+        """Bitmask of every label with at least one term inside text"""
+        delta = self._delta
+        out = self._out
+        full = self.full_mask
+        state = 0
+        mask = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if out[state]:
+                mask |= out[state]
+                if mask == full:
+                    break
+        return mask
+
+    def match(self, text):
+        """Set of labels with at least one term inside text"""
+        mask = self.match_mask(text)
+        labels = self._label_sets.get(mask)
+        if labels is None:
+            labels = frozenset(
+                label for label in self.labels if mask & self._bits[label]
+            )
+            self._label_sets[mask] = labels
+        return labels
+
+    def bit(self, label):
+        return self._bits[label]
+
+
+class PhraseMatcher:
+    def __init__(self):
+        """Whole-word matcher: phrases are stored in a trie keyed by word"""
+        self._root = {}
+        self.max_words = 0
+        self.size = 0
+
+    def add(self, phrase, payload):
+        """Report payload whenever phrase occurs in a text as complete words"""
+        tokens = words(phrase)
+        if not tokens:
+            return
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        payloads = node.setdefault(None, [])
+        if payload not in payloads:
+            payloads.append(payload)
+            self.size += 1
+        self.max_words = max(self.max_words, len(tokens))
+
+    def find(self, text):
+        """Payloads of every phrase in text, by position; longer phrases first"""
+        tokens = words(text)
+        found = []
+        seen = set()
+        for start in range(len(tokens)):
+            node = self._root
+            hits = []
+            for token in tokens[start:start + self.max_words]:
+                node = node.get(token)
+                if node is None:
+                    break
+                if None in node:
+                    hits.append(node[None])
+            for payloads in reversed(hits):
+                for payload in payloads:
+                    if payload not in seen:
+                        seen.add(payload)
+                        found.append(payload)
+        return found
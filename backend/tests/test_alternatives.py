@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from alternatives import AlternativesIndex, feature_vectors
+from catalog_store import ColumnStore
+from product_search import ProductCatalog
+
+
+def _catalog(n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    features = np.column_stack([rng.poisson(20, n), rng.uniform(0, 30, n), rng.poisson(1, (n, 3)),
+                                rng.lognormal(3, 0.5, n)]).astype(float)
+    # Coarse risk levels, so many products share a risk score with the query
+    risk = rng.choice([0, 10, 20, 35, 50, 70, 100], n).astype(float)
+    risk[rng.choice(n, 30, replace=False)] = np.nan
+    return features, risk
+
+
+def _dense_reference(vectors, risk, doc_id, k):
+    # Notebook version: full similarity row, filter, sort
+    scores = (vectors @ vectors[doc_id]) * (1 - risk / 100)
+    eligible = [i for i in range(len(vectors)) if i != doc_id and risk[i] < risk[doc_id]]
+    return sorted(eligible, key=lambda i: (-scores[i], i))[:k]
+
+
+@pytest.mark.parametrize('block_size', [8192, 64])
+def test_exact_top_k_matches_dense_reference(block_size):
+    features, risk = _catalog()
+    index = AlternativesIndex.from_features(features, risk, block_size=block_size)
+    vectors = feature_vectors(features)
+    for doc_id in range(0, len(features), 7):
+        if np.isnan(risk[doc_id]):
+            continue
+        assert [d for d, _, _ in index.query(doc_id, 10)] == _dense_reference(vectors, risk, doc_id, 10)
+
+
+def test_only_strictly_lower_risk_and_never_itself():
+    features, risk = _catalog()
+    index = AlternativesIndex.from_features(features, risk, block_size=64)
+    for doc_id in np.flatnonzero(~np.isnan(risk)):
+        for alt_id, similarity, score in index.query(int(doc_id), 20):
+            assert alt_id != doc_id
+            assert risk[alt_id] < risk[doc_id]
+            assert score == pytest.approx(similarity * (1 - risk[alt_id] / 100), abs=1e-5)
+
+
+def test_nan_risk_rows_are_never_returned_or_queried():
+    features, risk = _catalog()
+    index = AlternativesIndex.from_features(features, risk)
+    unscored = set(np.flatnonzero(np.isnan(risk)).tolist())
+    for doc_id in range(len(features)):
+        results = index.query(doc_id, 50)
+        assert not unscored & {d for d, _, _ in results}
+        if doc_id in unscored:
+            assert results == []
+            assert np.isnan(index.risk_score(doc_id))
+
+
+def test_k_larger_than_eligible_rows():
+    features = np.arange(12, dtype=float).reshape(4, 3) ** 2
+    risk = np.array([50.0, 10.0, 50.0, 0.0])
+    index = AlternativesIndex.from_features(features, risk)
+    assert sorted(d for d, _, _ in index.query(0, 10)) == [1, 3]
+    assert [d for d, _, _ in index.query(3, 10)] == []
+
+
+def test_ivf_probing_every_list_matches_exact_scan():
+    features, risk = _catalog(seed=1)
+    ivf = AlternativesIndex.from_features(features, risk, n_lists=8, n_probe=8)
+    exact = AlternativesIndex.from_features(features, risk)
+    for doc_id in range(0, len(features), 11):
+        expected = exact.query(doc_id, 5)
+        actual = ivf.query(doc_id, 5)
+        assert [d for d, _, _ in actual] == [d for d, _, _ in expected]
+        assert [s for _, _, s in actual] == pytest.approx([s for _, _, s in expected], abs=1e-5)
+
+
+def test_wraps_vectors_mapped_from_the_catalog_store(tmp_path):
+    features, risk = _catalog(n=40)
+    products = [{'name': f'product {i}', 'ingredients': 'water'} for i in range(len(features))]
+    path = str(tmp_path / 'catalog.dmcat')
+    ProductCatalog(products).save(path, arrays={'alt_vectors': feature_vectors(features),
+                                                'alt_risk_scores': risk.astype(np.float32)})
+
+    store = ColumnStore(path)
+    mapped = AlternativesIndex(store.array('alt_vectors'), store.array('alt_risk_scores'))
+    assert not mapped.vectors.flags.owndata  # a view of the mapping, not a private copy
+    in_memory = AlternativesIndex.from_features(features, risk)
+    for doc_id in range(len(features)):
+        assert mapped.query(doc_id, 5) == in_memory.query(doc_id, 5)
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from catalog_store import ALIGN, FORMAT_VERSION, MAGIC, PREAMBLE, ColumnStore, file_stamp, write_store
+from product_search import ProductCatalog, load_product_catalog
+
+PRODUCTS = [
+    {'name': 'Moisturizing Cream', 'brand': 'CeraVe', 'category': 'Moisturizer', 'ingredients': 'water, ceramide np',
+     'source': 'sephora', 'price': 19.99, 'rating': 4.7},
+    {'name': 'Crème Hydratante', 'brand': 'Avène', 'category': '', 'ingredients': '', 'source': 'ulta',
+     'price': None, 'rating': None},
+    {'name': 'Niacinamide 10% + Zinc 1%', 'brand': 'The Ordinary', 'category': 'Treatment',
+     'ingredients': 'aqua, niacinamide, zinc pca', 'source': 'sephora', 'price': 6.5, 'rating': 4.2},
+]
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    path = str(tmp_path / 'catalog.dmcat')
+    write_store(path, 3,
+                strings={'name': ['a', '', 'crème ☀']},
+                arrays={'vectors': np.arange(12, dtype='<f4').reshape(3, 4),
+                        'ids': np.array([7, 8, 9], dtype='<i8'),
+                        'grams': np.array([b'  a', b'ab ', b'xyz'], dtype='S3')},
+                meta={'knowledge': 'v1'})
+    return path
+
+
+def test_round_trip(store_path):
+    store = ColumnStore(store_path, verify=True)
+    assert store.n_rows == 3 and store.meta == {'knowledge': 'v1'}
+
+    names = store.strings('name')
+    assert len(names) == 3 and [names[i] for i in range(3)] == ['a', '', 'crème ☀']
+
+    vectors = store.array('vectors')
+    assert vectors.dtype == np.float32 and vectors.shape == (3, 4)
+    np.testing.assert_array_equal(vectors, np.arange(12, dtype='<f4').reshape(3, 4))
+    np.testing.assert_array_equal(store.array('ids'), [7, 8, 9])
+    assert store.array('grams').tolist() == [b'  a', b'ab ', b'xyz']
+
+    # Mapped, not copied: arrays are read-only views on aligned offsets
+    assert not vectors.flags.writeable
+    assert all(spec.get('offset', spec.get('offsets')) % ALIGN == 0 for spec in store.header['columns'].values())
+    assert store.has_column('ids') and not store.has_column('missing')
+
+
+def test_product_catalog_round_trip_searches_the_same(tmp_path):
+    path = str(tmp_path / 'products.dmcat')
+    catalog = ProductCatalog(PRODUCTS)
+    catalog.save(path, meta={'source': 'test'}, arrays={'extra': np.ones(3, dtype='<f4')})
+
+    mapped = ProductCatalog.from_store(ColumnStore(path, verify=True))
+    assert len(mapped) == 3
+    assert [mapped.products[i] for i in range(3)] == PRODUCTS
+    for query in ['moisturising creme', 'creme hydratante', 'niacinamide', 'zz']:
+        assert mapped.search(query) == catalog.search(query)
+    np.testing.assert_array_equal(mapped.store.array('extra'), np.ones(3))
+
+
+def _rewrite(path, offset, data):
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def test_rejects_a_file_with_the_wrong_magic(store_path):
+    _rewrite(store_path, 0, b'NOTACATL')
+    with pytest.raises(ValueError, match='not a Dermamon catalog'):
+        ColumnStore(store_path)
+
+
+def test_rejects_another_format_version(store_path):
+    with open(store_path, 'rb') as f:
+        _, _, header_len = PREAMBLE.unpack(f.read(PREAMBLE.size))
+    _rewrite(store_path, 0, PREAMBLE.pack(MAGIC, FORMAT_VERSION + 1, header_len))
+    with pytest.raises(ValueError, match='format version'):
+        ColumnStore(store_path)
+
+
+def test_checksum_mismatch_is_caught_when_verifying(store_path):
+    body = ColumnStore(store_path)._body
+    with open(store_path, 'rb') as f:
+        first_byte = f.read()[body]
+    _rewrite(store_path, body, bytes([first_byte ^ 0xFF]))
+
+    assert ColumnStore(store_path).n_rows == 3  # opening without verify stays cheap
+    assert not ColumnStore(store_path).verify()
+    with pytest.raises(ValueError, match='checksum'):
+        ColumnStore(store_path, verify=True)
+
+
+def test_load_falls_back_to_the_csv_when_the_store_is_stale_or_corrupt(tmp_path):
+    csv_path = tmp_path / 'master_products.csv'
+    csv_path.write_text('product_name,brand,category,ingredients,source,price,rating\n'
+                        'Moisturizing Cream,CeraVe,Moisturizer,"water, ceramide np",sephora,19.99,4.7\n')
+    store_path = str(tmp_path / 'products.dmcat')
+    ProductCatalog(PRODUCTS).save(store_path, meta={'source': file_stamp(str(csv_path))})
+
+    current = load_product_catalog(str(csv_path), store_path)
+    assert current.store is not None and len(current) == 3
+
+    csv_path.write_text(csv_path.read_text() + 'Ultra Facial Cream,Kiehl\'s,Moisturizer,,ulta,,\n')
+    stale = load_product_catalog(str(csv_path), store_path)
+    assert stale.store is None and len(stale) == 2
+
+    _rewrite(store_path, 0, b'garbage!')
+    assert load_product_catalog(str(csv_path), store_path).store is None
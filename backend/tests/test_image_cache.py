@@ -0,0 +1,91 @@
+import io
+import time
+
+import pytest
+from PIL import Image, ImageEnhance
+from sklearn.datasets import load_sample_image
+
+from image_cache import ImageAnalysisCache, hash_distance, image_hashes, normalize_text
+from image_prep import ImagePreprocessor
+
+ECZEMA = {'type': 'eczema'}
+ALL_ONES, LOW_HALF = 2 ** 64 - 1, 2 ** 32 - 1  # far from each other and from (1, 1)
+
+
+def _upload(name, quality=92, scale=1.0):
+    """A sample photo as a user would send it, after the usual preprocessing"""
+    image = Image.fromarray(load_sample_image(name))
+    if scale != 1.0:
+        image = image.resize((int(image.width * scale), int(image.height * scale)))
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality)
+    return ImagePreprocessor().prepare(out.getvalue()).image
+
+
+@pytest.fixture(scope='module')
+def flower():
+    return _upload('flower.jpg')
+
+
+def test_reencoded_or_resized_copy_hits(flower):
+    cache = ImageAnalysisCache(max_distance=4)
+    cache.set(('itchy',), image_hashes(flower), ECZEMA)
+
+    copies = [_upload('flower.jpg', quality=60, scale=0.5), ImageEnhance.Brightness(flower).enhance(1.1)]
+    for copy in copies:
+        assert hash_distance(image_hashes(flower), image_hashes(copy)) <= cache.max_distance
+        assert cache.get(('itchy',), image_hashes(copy)) == ECZEMA
+    assert cache.stats()['hits'] == 2
+
+
+def test_different_image_misses(flower):
+    cache = ImageAnalysisCache(max_distance=4)
+    cache.set(('itchy',), image_hashes(flower), ECZEMA)
+    assert cache.get(('itchy',), image_hashes(_upload('china.jpg'))) is None
+    assert cache.get(('itchy',), image_hashes(flower.transpose(Image.Transpose.FLIP_LEFT_RIGHT))) is None
+    assert cache.stats()['misses'] == 2
+
+
+def test_same_image_with_other_symptoms_misses(flower):
+    cache = ImageAnalysisCache()
+    cache.set((normalize_text('Itchy, red!'),), image_hashes(flower), ECZEMA)
+    assert cache.get((normalize_text('itchy red'),), image_hashes(flower)) == ECZEMA
+    assert cache.get((normalize_text('burning'),), image_hashes(flower)) is None
+
+
+def test_hit_up_to_the_threshold_and_miss_past_it():
+    cache = ImageAnalysisCache(max_distance=4)
+    cache.set('', (0, 0), ECZEMA)
+    assert cache.get('', (0b1111, 0b1111)) == ECZEMA
+    assert cache.get('', (0b1111, 0b11111)) is None  # both hashes have to be close
+    assert cache.get('', (0b11111, 0)) is None
+    assert cache.stats()['near_duplicate_hits'] == 1
+
+
+def test_closest_entry_wins():
+    cache = ImageAnalysisCache(max_distance=4)
+    cache.set('', (0b111, 0), 'far')
+    cache.set('', (0b1, 0), 'near')
+    assert cache.get('', (0, 0)) == 'near'
+
+
+def test_identical_image_replaces_its_entry_and_lru_evicts():
+    cache = ImageAnalysisCache(max_size=2)
+    cache.set('', (1, 1), 'old')
+    cache.set('', (1, 1), 'new')
+    assert len(cache) == 1 and cache.get('', (1, 1)) == 'new'
+
+    cache.set('', (ALL_ONES, ALL_ONES), 'second')
+    cache.get('', (1, 1))  # most recently used
+    cache.set('', (LOW_HALF, LOW_HALF), 'third')
+    assert cache.get('', (ALL_ONES, ALL_ONES)) is None
+    assert cache.get('', (1, 1)) == 'new'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_the_ttl():
+    cache = ImageAnalysisCache(ttl_seconds=0.05)
+    cache.set('', (1, 1), ECZEMA)
+    time.sleep(0.1)
+    assert cache.get('', (1, 1)) is None
+    assert cache.stats()['expirations'] == 1 and len(cache) == 0
@@ -0,0 +1,84 @@
+import io
+import time
+
+import pytest
+from PIL import Image
+
+from image_prep import ImagePreprocessor, ImageRejected, ImageTooLarge
+
+
+def _encode(image, fmt='JPEG', **kwargs):
+    out = io.BytesIO()
+    image.save(out, fmt, **kwargs)
+    return out.getvalue()
+
+
+def test_downscales_and_reencodes_under_the_byte_cap():
+    preprocessor = ImagePreprocessor(max_edge=256, max_bytes=20_000)
+    photo = Image.effect_noise((2000, 1500), 60).convert('RGB')
+    prepared = preprocessor.prepare(_encode(photo, quality=95))
+    assert max(prepared.image.size) <= 256
+    assert len(prepared.data) <= 20_000
+    assert prepared.as_part()['mime_type'] == 'image/jpeg'
+    assert Image.open(io.BytesIO(prepared.data)).format == 'JPEG'
+
+
+def test_transparent_png_is_flattened_to_rgb():
+    prepared = ImagePreprocessor().prepare(_encode(Image.new('RGBA', (40, 40), (255, 0, 0, 0)), 'PNG'))
+    assert prepared.image.mode == 'RGB'
+    assert prepared.image.getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_decompression_bomb_is_rejected_from_its_header():
+    preprocessor = ImagePreprocessor(max_pixels=40_000_000)
+    bomb = _encode(Image.new('L', (10000, 10000)), 'PNG')  # ~100 kB declaring 100 MP
+    start = time.perf_counter()
+    with pytest.raises(ImageTooLarge) as excinfo:
+        preprocessor.prepare(bomb)
+    assert time.perf_counter() - start < 0.5  # never decoded
+    assert excinfo.value.status == 413
+    assert preprocessor.stats()['rejected'] == 1
+
+
+def test_oversized_upload_is_rejected_before_opening():
+    preprocessor = ImagePreprocessor(max_upload_bytes=1000)
+    with pytest.raises(ImageTooLarge):
+        preprocessor.prepare(b'\xff' * 1001)
+
+
+@pytest.mark.parametrize('data', [b'not an image', _encode(Image.new('RGB', (8, 8)), 'TIFF')])
+def test_unsupported_files_are_rejected(data):
+    with pytest.raises(ImageRejected) as excinfo:
+        ImagePreprocessor().prepare(data)
+    assert excinfo.value.status == 400
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app = pytest.importorskip('app')
+    monkeypatch.setitem(app.app.config, 'MAX_CONTENT_LENGTH', 4096)
+    return app.app.test_client()
+
+
+def test_body_over_the_limit_is_413(client):
+    response = client.post('/api/allergy/analyze', data={'symptoms': 'redness', 'image': (io.BytesIO(b'x' * 8192), 'a.jpg')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 413
+
+
+def test_chunked_body_without_content_length_is_413(client):
+    # What gunicorn passes on for Transfer-Encoding: chunked
+    response = client.post('/api/allergy/analyze', input_stream=io.BytesIO(b'{"symptoms": "' + b'a' * 8192 + b'"}'),
+                           content_type='application/json',
+                           environ_overrides={'wsgi.input_terminated': True})
+    assert response.status_code == 413
+
+
+def test_body_that_is_neither_json_nor_multipart_is_415(client):
+    response = client.post('/api/allergy/analyze', data='redness', content_type='text/plain')
+    assert response.status_code == 415
+
+
+def test_json_that_is_not_an_object_is_400(client):
+    assert client.post('/api/allergy/analyze', json=['redness']).status_code == 400
+    assert client.post('/api/allergy/analyze', data='{not json', content_type='application/json').status_code == 400
@@ -0,0 +1,32 @@
+from ingredient_registry import IngredientRegistry, compile_allergens
+
+
+def _registry():
+    registry = IngredientRegistry({'water': ['aqua'], 'sodium lauryl sulfate': ['sls']})
+    registry.add_all(['glycerin', 'fragrance', 'alcohol denat'])
+    return registry
+
+
+def test_synonyms_share_an_id():
+    registry = _registry()
+    assert registry.id_of('Aqua') == registry.id_of('water')
+    assert registry.canonical('SLS') == 'sodium lauryl sulfate'
+    assert registry.id_of('unknown thing') is None
+
+
+def test_product_bitset_and_concern_mask():
+    registry = _registry()
+    product = registry.mask(['aqua', 'glycerin', 'sls', 'not in registry'])
+    concerns = registry.mask(['sodium lauryl sulfate', 'alcohol denat'])
+    hits = product & concerns
+    assert registry.decode(hits) == ['sodium lauryl sulfate']
+    assert registry.contains(hits, 'sls') and not registry.contains(hits, 'glycerin')
+
+
+def test_allergen_profile_splits_free_text():
+    registry = _registry()
+    profile = compile_allergens(registry, 'Fragrance, SLS and latex')
+    assert profile.matches('sodium lauryl sulfate')
+    assert profile.matches('latex')
+    assert not profile.matches('glycerin')
+    assert profile.names() == ['sodium lauryl sulfate', 'fragrance', 'latex']
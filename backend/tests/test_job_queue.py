@@ -0,0 +1,149 @@
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from job_queue import JobQueue, JobStore, QueueFull
+
+
+def _blocking(release):
+    def fn(value):
+        release.wait(5)
+        return value
+    return fn
+
+
+def test_runs_jobs_and_reports_failures():
+    jobs = JobQueue(workers=2)
+    ok = jobs.submit(lambda a, b: a + b, 2, 3)
+    bad = jobs.submit(lambda: 1 / 0)
+    assert jobs.wait(ok, 5) and jobs.wait(bad, 5)
+    assert (ok.status, ok.result) == ('done', 5)
+    assert bad.status == 'failed' and 'division' in bad.error
+    assert ok.fn is None and ok.args is None
+    assert jobs.stats()['failed'] == 1
+
+
+def test_rejects_beyond_max_depth_until_a_slot_frees():
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_depth=2)
+    running = jobs.submit(_blocking(release), 'a')
+    queued = jobs.submit(_blocking(release), 'b')
+    with pytest.raises(QueueFull):
+        jobs.submit(_blocking(release), 'c')
+    assert jobs.stats()['rejected'] == 1
+
+    release.set()
+    assert jobs.wait(running, 5) and jobs.wait(queued, 5)
+    assert jobs.wait(jobs.submit(_blocking(release), 'd'), 5)
+
+
+def test_finished_jobs_expire_after_the_ttl():
+    jobs = JobQueue(workers=1, ttl_seconds=0.05)
+    job = jobs.submit(lambda: 'x')
+    assert jobs.wait(job, 5)
+    assert jobs.get(job.id) is job
+    time.sleep(0.1)
+    assert jobs.get(job.id) is None
+    assert jobs.stats()['expired'] == 1
+
+
+def test_jobs_past_max_runtime_fail_and_free_their_slot():
+    release = threading.Event()
+    jobs = JobQueue(workers=1, max_depth=2, max_runtime=0.1)
+    running = jobs.submit(_blocking(release), 'a')
+    queued = jobs.submit(_blocking(release), 'b')
+
+    # wait() returns at the deadline rather than hanging on a stuck call
+    start = time.monotonic()
+    assert jobs.wait(running, 5) and jobs.wait(queued, 5)
+    assert time.monotonic() - start < 1
+    assert running.status == queued.status == 'failed'
+    assert 'did not finish' in running.error
+    assert running.args is None  # the job no longer pins its input
+    assert jobs.stats()['timed_out'] == 2 and jobs.stats()['pending'] == 0
+
+    # A result that arrives late doesn't overwrite the failure
+    release.set()
+    time.sleep(0.05)
+    assert running.status == 'failed' and running.result is None
+    assert jobs.wait(jobs.submit(lambda: 'next'), 5)
+
+
+def test_another_process_finds_the_job_through_the_store(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    release = threading.Event()
+    owner = JobQueue(workers=1, store=JobStore(path))
+    other = JobQueue(workers=1, store=JobStore(path, poll_interval=0.01))
+
+    job = owner.submit(_blocking(release), {'type': 'eczema'})
+    seen = other.get(job.id)
+    assert seen is not None and seen.status in ('queued', 'running')
+    assert not other.wait(seen, 0.05)
+
+    release.set()
+    assert other.wait(seen, 5)
+    assert (seen.status, seen.result) == ('done', {'type': 'eczema'})
+    assert other.get('no-such-job') is None
+
+
+def test_stored_job_whose_owner_died_reads_as_failed(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.db'))
+    release = threading.Event()
+    owner = JobQueue(workers=1, max_runtime=0.05, store=store)
+    job = owner.submit(_blocking(release), 'x')
+    time.sleep(0.1)  # the owner never looks at the job again, as if its process had died
+
+    seen = JobQueue(workers=1, store=store).get(job.id)
+    assert seen.status == 'failed'
+    release.set()
+
+
+@pytest.fixture
+def allergy_client(monkeypatch, tmp_path):
+    app = pytest.importorskip('app')
+    release = threading.Event()
+
+    def analyze_image(prepared_image, symptoms, suspected, text_key, hashes):
+        release.wait(5)
+        return {'severity': 'mild', 'type': 'eczema', 'confidence': 80,
+                'observations': ['redness'], 'recommendations': ['moisturize']}
+
+    monkeypatch.setattr(app, 'allergy_llm', object())
+    monkeypatch.setattr(app, 'analyze_image', analyze_image)
+    monkeypatch.setattr(app, 'image_jobs', JobQueue(workers=1, max_depth=1, store=JobStore(str(tmp_path / 'jobs.db'))))
+    app.image_analysis_cache.clear()
+    client = app.app.test_client()
+    client.release = release
+    yield client
+    release.set()
+
+
+def _upload(client, color):
+    image = io.BytesIO()
+    Image.new('RGB', (64, 64), color).save(image, 'JPEG')
+    return client.post('/api/allergy/analyze', data={'symptoms': 'redness', 'image': (io.BytesIO(image.getvalue()), 'skin.jpg')},
+                       content_type='multipart/form-data')
+
+
+def test_image_analysis_is_accepted_then_polled(allergy_client):
+    response = _upload(allergy_client, (200, 80, 80))
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body['likely_culprits'] and body['image_analysis'] is None
+    job = body['image_job']
+
+    # The queue holds one job, so a second upload is turned away with Retry-After
+    busy = _upload(allergy_client, (10, 200, 10))
+    assert busy.status_code == 503 and busy.headers['Retry-After']
+
+    assert allergy_client.get(job['status_url']).get_json()['status'] in ('queued', 'running')
+    allergy_client.release.set()
+    stream = allergy_client.get(job['stream_url']).get_data(as_text=True)
+    assert 'event: done' in stream and 'eczema' in stream
+
+    polled = allergy_client.get(job['status_url']).get_json()
+    assert polled['status'] == 'done' and polled['image_analysis']['type'] == 'eczema'
+    assert allergy_client.get('/api/allergy/jobs/unknown').status_code == 404
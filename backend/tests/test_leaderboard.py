@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from leaderboard import Leaderboard, Leaderboards
+from storage import SQLiteStorage
+
+
+def test_keeps_each_users_best_score():
+    board = Leaderboard()
+    assert board.update('ann', 50, '2025-01-01T00:00:01')
+    assert not board.update('ann', 40, '2025-01-01T00:00:02')
+    assert not board.update('ann', 50, '2025-01-01T00:00:03')  # a tie doesn't move the timestamp
+    assert board.update('ann', 70, '2025-01-01T00:00:04')
+    assert board.top(10) == [{'rank': 1, 'user_id': 'ann', 'score': 70, 'created_at': '2025-01-01T00:00:04'}]
+
+
+def test_ties_go_to_whoever_got_there_first():
+    board = Leaderboard()
+    board.update('late', 90, '2025-01-02T00:00:00')
+    board.update('early', 90, '2025-01-01T00:00:00')
+    board.update('top', 95, '2025-01-03T00:00:00')
+    board.update('low', 10, '2025-01-01T00:00:00')
+    assert [e['user_id'] for e in board.top(10)] == ['top', 'early', 'late', 'low']
+    assert [e['user_id'] for e in board.top(2)] == ['top', 'early']
+    assert board.rank('late')['rank'] == 3
+    assert board.rank('nobody') is None
+
+
+def test_rank_matches_a_full_sort():
+    rng = random.Random(5)
+    board = Leaderboard()
+    for i in range(2000):
+        board.update(f"user{rng.randrange(300)}", rng.randrange(500), f"2025-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}")
+    expected = sorted(board.best.items(), key=lambda item: (-item[1][0], item[1][1], item[0]))
+    assert [e['user_id'] for e in board.top(len(expected))] == [user_id for user_id, _ in expected]
+    for position, (user_id, (score, _)) in enumerate(expected):
+        assert board.rank(user_id) == dict(board.entry(position), score=score)
+
+
+def test_rebuild_from_storage_keeps_scores_the_database_has_not_seen(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / 'scores.db'))
+    storage.add_game_scores([
+        {'user_id': 'ann', 'score': 30, 'game_type': 'balloon_hit', 'created_at': '2025-01-01T00:00:00'},
+        {'user_id': 'ann', 'score': 80, 'game_type': 'balloon_hit', 'created_at': '2025-01-02T00:00:00'},
+        {'user_id': 'bob', 'score': 60, 'game_type': 'balloon_hit', 'created_at': '2025-01-01T00:00:00'},
+        {'user_id': 'bob', 'score': 99, 'game_type': 'memory', 'created_at': '2025-01-01T00:00:00'},
+    ])
+    leaderboards = Leaderboards(grace_seconds=60)
+    leaderboards.record('balloon_hit', 'cat', 70, '2025-01-03T00:00:00')  # still in the write-behind buffer
+    leaderboards.rebuild(storage.iter_game_scores())
+
+    top, me, _ = leaderboards.view('balloon_hit', 10, 'bob')
+    assert [(e['user_id'], e['score']) for e in top] == [('ann', 80), ('cat', 70), ('bob', 60)]
+    assert me == {'rank': 3, 'user_id': 'bob', 'score': 60, 'created_at': '2025-01-01T00:00:00'}
+    assert leaderboards.view('memory', 10)[0][0]['score'] == 99
+    assert leaderboards.stats()['last_rebuild_rows'] == 4
+
+    # Once the grace period is over the database is the only source
+    leaderboards.grace = 0
+    leaderboards.rebuild(storage.iter_game_scores())
+    assert [e['user_id'] for e in leaderboards.view('balloon_hit', 10)[0]] == ['ann', 'bob']
+
+
+def test_version_changes_only_when_the_board_does():
+    leaderboards = Leaderboards()
+    leaderboards.record('balloon_hit', 'ann', 50, '2025-01-01T00:00:00')
+    version = leaderboards.view('balloon_hit', 10)[2]
+    leaderboards.record('balloon_hit', 'ann', 20, '2025-01-01T00:00:01')
+    leaderboards.record('memory', 'ann', 20, '2025-01-01T00:00:01')
+    assert leaderboards.view('balloon_hit', 10)[2] == version
+    leaderboards.record('balloon_hit', 'bob', 20, '2025-01-01T00:00:02')
+    assert leaderboards.view('balloon_hit', 10)[2] != version
+
+
+def test_leaderboard_route_ranks_and_revalidates(monkeypatch, tmp_path):
+    app = pytest.importorskip('app')
+    monkeypatch.setattr(app, 'leaderboards', Leaderboards())
+    monkeypatch.setattr(app, 'score_writer', None)
+    monkeypatch.setattr(app, 'DATABASE_CONNECTED', True)
+    client = app.app.test_client()
+
+    for user_id, score in [('ann', 120), ('bob', 300), ('ann', 90), ('cat', 120)]:
+        assert client.post('/api/game/score', json={'user_id': user_id, 'score': score}).status_code == 200
+    assert client.post('/api/game/score', json={'user_id': 'ann', 'score': -1}).status_code == 400
+
+    response = client.get('/api/game/leaderboard?user_id=cat')
+    body = response.get_json()
+    assert [(e['user_id'], e['score']) for e in body['leaderboard']] == [('bob', 300), ('ann', 120), ('cat', 120)]
+    assert body['me']['rank'] == 3
+
+    etag = response.headers['ETag']
+    assert client.get('/api/game/leaderboard?user_id=cat', headers={'If-None-Match': etag}).status_code == 304
+    client.post('/api/game/score', json={'user_id': 'cat', 'score': 500})
+    changed = client.get('/api/game/leaderboard?user_id=cat', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.get_json()['me']['rank'] == 1
@@ -0,0 +1,194 @@
+import time
+import types
+
+import pytest
+
+from llm_client import GeminiClient
+
+
+class CacheNotFound(Exception):
+    code = 403  # what google.api_core raises for an evicted or expired CachedContent
+
+    def __init__(self):
+        super().__init__('403 CachedContent not found (or permission denied)')
+
+
+class QuotaExceeded(Exception):
+    code = 429
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError('no text parts')  # like the SDK's final finish_reason chunk
+        return self._text
+
+
+class FakeGenAI:
+    """Just enough of google.generativeai: GenerativeModel, from_cached_content and caching"""
+
+    def __init__(self, caching=True):
+        self.models = []
+        self.caches = []
+        self.cache_error = None
+        fake = self
+
+        class GenerativeModel:
+            def __init__(self, model_name, system_instruction=None, generation_config=None, cached=None):
+                self.model_name = f'models/{model_name}'
+                self.system_instruction = system_instruction
+                self.generation_config = generation_config
+                self.cached = cached
+                self.calls = []
+                self.failures = []  # exceptions to raise on the next calls
+                self.reply = ['ok']
+                fake.models.append(self)
+
+            @classmethod
+            def from_cached_content(cls, cached_content, generation_config=None):
+                return cls(cached_content.model.split('/')[-1], generation_config=generation_config,
+                           cached=cached_content)
+
+            def generate_content(self, contents, stream=False):
+                self.calls.append((contents, stream))
+                if self.failures:
+                    raise self.failures.pop(0)
+                if stream:
+                    return self._stream()
+                return FakeResponse(' ' + ''.join(self.reply) + ' ')
+
+            def _stream(self):
+                for text in self.reply:
+                    if isinstance(text, Exception):
+                        raise text
+                    yield FakeResponse(text)
+
+        def create(model, display_name, system_instruction, ttl):
+            if fake.cache_error:
+                raise fake.cache_error
+            cache = types.SimpleNamespace(model=model, system_instruction=system_instruction, ttl=ttl)
+            fake.caches.append(cache)
+            return cache
+
+        self.GenerativeModel = GenerativeModel
+        if caching:
+            self.caching = types.SimpleNamespace(CachedContent=types.SimpleNamespace(create=create))
+
+
+def test_static_prompt_is_the_system_instruction():
+    genai = FakeGenAI(caching=False)
+    config = {'response_mime_type': 'application/json'}
+    client = GeminiClient(genai, 'gemini-test', 'You are Dermamon.', generation_config=config)
+
+    assert client.generate('What is niacinamide?') == 'ok'
+    model = genai.models[0]
+    assert model.system_instruction == 'You are Dermamon.'
+    assert model.generation_config == config
+    # Only the per-request contents are sent
+    assert model.calls == [('What is niacinamide?', False)]
+    assert client.stats()['context_cache'] is False
+
+
+def test_context_cache_holds_the_instruction():
+    genai = FakeGenAI()
+    client = GeminiClient(genai, 'gemini-test', 'You are Dermamon.', generation_config={'temperature': 0})
+
+    client.generate('hi')
+    client.generate('again')
+    assert len(genai.caches) == 1
+    assert genai.caches[0].system_instruction == 'You are Dermamon.'
+    cached = genai.models[1]
+    assert cached.cached is genai.caches[0] and cached.generation_config == {'temperature': 0}
+    assert [contents for contents, _ in cached.calls] == ['hi', 'again']
+    assert genai.models[0].calls == []
+    assert client.cached_calls == 2
+
+
+def test_cache_creation_failure_falls_back_to_system_instruction():
+    genai = FakeGenAI()
+    genai.cache_error = RuntimeError('content is below the minimum cacheable size')
+    client = GeminiClient(genai, 'gemini-test', 'short')
+
+    assert client.generate('hi') == 'ok'
+    assert genai.models[0].calls == [('hi', False)]
+    client.generate('again')
+    assert len(genai.models) == 1  # no further cache attempts
+
+
+def test_evicted_cache_is_retried_without_it_and_recreated():
+    genai = FakeGenAI()
+    client = GeminiClient(genai, 'gemini-test', 'You are Dermamon.')
+    client.generate('warm up')
+    plain, cached = genai.models
+    cached.failures.append(CacheNotFound())
+
+    assert client.generate('hi') == 'ok'
+    assert plain.calls == [('hi', False)]
+    assert client.errors == 0
+
+    client.generate('next')
+    assert len(genai.caches) == 2 and genai.models[-1].calls == [('next', False)]
+
+
+def test_expired_cache_is_renewed_before_use():
+    genai = FakeGenAI()
+    client = GeminiClient(genai, 'gemini-test', 'You are Dermamon.', cache_ttl_seconds=0.05)
+    client.generate('first')
+    time.sleep(0.06)
+    client.generate('second')
+    assert len(genai.caches) == 2
+    assert genai.models[0].calls == []
+
+
+def test_other_errors_are_not_sent_twice():
+    genai = FakeGenAI()
+    client = GeminiClient(genai, 'gemini-test', 'You are Dermamon.')
+    client.generate('warm up')
+    plain, cached = genai.models
+    cached.failures.append(QuotaExceeded('429 Resource has been exhausted'))
+
+    with pytest.raises(QuotaExceeded):
+        client.generate('hi')
+    assert plain.calls == []
+    assert client.errors == 1
+    assert client.stats()['context_cache'] is True
+
+
+def test_generate_stream_yields_text_chunks():
+    genai = FakeGenAI(caching=False)
+    client = GeminiClient(genai, 'gemini-test', 'You are Dermamon.')
+    genai.models[0].reply = ['Hello', ' there', None]
+
+    assert list(client.generate_stream('hi')) == ['Hello', ' there']
+    assert genai.models[0].calls == [('hi', True)]
+
+
+def test_generate_stream_retries_without_cache_before_first_chunk():
+    genai = FakeGenAI()
+    client = GeminiClient(genai, 'gemini-test', 'You are Dermamon.')
+    client.generate('warm up')
+    plain, cached = genai.models
+    cached.failures.append(CacheNotFound())
+    plain.reply = ['from', ' plain']
+
+    assert list(client.generate_stream('hi')) == ['from', ' plain']
+    assert plain.calls == [('hi', True)]
+
+
+def test_generate_stream_does_not_retry_after_output_started():
+    genai = FakeGenAI()
+    client = GeminiClient(genai, 'gemini-test', 'You are Dermamon.')
+    client.generate('warm up')
+    plain, cached = genai.models
+    cached.reply = ['partial', CacheNotFound()]
+
+    chunks = []
+    with pytest.raises(CacheNotFound):
+        for chunk in client.generate_stream('hi'):
+            chunks.append(chunk)
+    assert chunks == ['partial']
+    assert plain.calls == []
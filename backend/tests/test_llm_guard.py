@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+from llm_guard import CircuitBreaker, CircuitOpenError, GuardedExecutor, LLMDeadlineExceeded, LLMOverloaded
+
+
+def slow_model(prompt, delay):
+    """Stand-in for a Gemini call that takes delay seconds"""
+    time.sleep(delay)
+    return f"answer to {prompt}"
+
+
+def failing_model(prompt):
+    raise RuntimeError('503 upstream unavailable')
+
+
+def slow_stream(delays):
+    for delay in delays:
+        time.sleep(delay)
+        yield 'chunk'
+
+
+def _wait_idle(executor, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while executor.stats()['in_flight'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert executor.stats()['in_flight'] == 0
+
+
+def test_call_returns_within_the_deadline():
+    executor = GuardedExecutor(max_workers=2, max_queue=1, timeout_seconds=0.1)
+    assert executor.call(slow_model, 'fast', 0.01) == 'answer to fast'
+
+    start = time.perf_counter()
+    with pytest.raises(LLMDeadlineExceeded):
+        executor.call(slow_model, 'slow', 0.5)
+    assert time.perf_counter() - start < 0.3
+    assert executor.stats()['timeouts'] == 1
+
+
+def test_pool_full_is_rejected_until_calls_really_finish():
+    executor = GuardedExecutor(max_workers=1, max_queue=0, timeout_seconds=0.05)
+    with pytest.raises(LLMDeadlineExceeded):
+        executor.call(slow_model, 'hung', 0.3)
+
+    # The timed-out call still holds its worker, so nothing else is admitted yet
+    with pytest.raises(LLMOverloaded):
+        executor.call(slow_model, 'rejected', 0.01)
+    _wait_idle(executor)
+    assert executor.call(slow_model, 'admitted', 0.01) == 'answer to admitted'
+    assert executor.stats()['rejected'] == 1
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    executor = GuardedExecutor(max_workers=2, max_queue=4, timeout_seconds=1, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            executor.call(failing_model, 'x')
+    assert breaker.state == 'closed'
+    with pytest.raises(RuntimeError):
+        executor.call(failing_model, 'x')
+    assert breaker.state == 'open'
+
+    # Open: the model isn't called at all
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        executor.call(lambda: calls.append(1))
+    assert calls == [] and breaker.stats()['short_circuited'] == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+    executor = GuardedExecutor(timeout_seconds=1, breaker=breaker)
+    with pytest.raises(RuntimeError):
+        executor.call(failing_model, 'x')
+    executor.call(slow_model, 'ok', 0)
+    with pytest.raises(RuntimeError):
+        executor.call(failing_model, 'x')
+    assert breaker.state == 'closed'
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    executor = GuardedExecutor(max_workers=2, max_queue=2, timeout_seconds=1, breaker=breaker)
+    with pytest.raises(RuntimeError):
+        executor.call(failing_model, 'x')
+    time.sleep(0.06)
+
+    # While the trial runs, other callers still get the fallback
+    trial = threading.Thread(target=executor.call, args=(slow_model, 'trial', 0.1))
+    trial.start()
+    time.sleep(0.02)
+    assert breaker.state == 'half_open'
+    with pytest.raises(CircuitOpenError):
+        executor.call(slow_model, 'other', 0)
+    trial.join()
+    assert breaker.state == 'closed'
+
+
+def test_failed_trial_reopens_and_later_recovers():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    executor = GuardedExecutor(timeout_seconds=1, breaker=breaker)
+    with pytest.raises(RuntimeError):
+        executor.call(failing_model, 'x')
+    time.sleep(0.06)
+    with pytest.raises(RuntimeError):
+        executor.call(failing_model, 'trial')
+    assert breaker.state == 'open' and breaker.stats()['times_opened'] == 2
+    with pytest.raises(CircuitOpenError):
+        executor.call(slow_model, 'too soon', 0)
+
+    time.sleep(0.06)
+    assert executor.call(slow_model, 'recovered', 0) == 'answer to recovered'
+    assert breaker.state == 'closed'
+
+
+def test_stream_deadline_applies_per_chunk():
+    executor = GuardedExecutor(timeout_seconds=0.1)
+    assert list(executor.stream(slow_stream, [0.01, 0.01])) == ['chunk', 'chunk']
+
+    received = []
+    with pytest.raises(LLMDeadlineExceeded):
+        for chunk in executor.stream(slow_stream, [0.01, 0.5]):
+            received.append(chunk)
+    assert received == ['chunk']
+
+
+def test_abandoned_stream_releases_the_half_open_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    executor = GuardedExecutor(timeout_seconds=1, breaker=breaker)
+    with pytest.raises(RuntimeError):
+        executor.call(failing_model, 'x')
+    time.sleep(0.06)
+
+    stream = executor.stream(slow_stream, [0.01, 0.01])
+    assert next(stream) == 'chunk'
+    stream.close()  # client went away mid-answer: neither success nor failure
+    assert executor.call(slow_model, 'next trial', 0) == 'answer to next trial'
+    assert breaker.state == 'closed'
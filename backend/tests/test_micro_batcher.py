@@ -0,0 +1,81 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from micro_batcher import MicroBatcher
+
+fork_only = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+
+
+def _score(matrix):
+    return [float(row.sum()) for row in matrix]
+
+
+def _submit_together(batcher, rows):
+    """Submit every row from its own thread, all at once, so they share batches"""
+    start = threading.Barrier(len(rows))
+
+    def call(row):
+        start.wait()
+        try:
+            return batcher.submit(row, timeout=5)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(len(rows)) as pool:
+        return list(pool.map(call, rows))
+
+
+def test_batched_results_equal_per_call_results():
+    batcher = MicroBatcher(_score, max_batch_size=8, max_wait_ms=20)
+    rows = [[i, i * 0.5, -i] for i in range(40)]
+    assert _submit_together(batcher, rows) == [_score(np.array([row]))[0] for row in rows]
+
+    stats = batcher.stats()
+    assert stats['rows'] == 40
+    assert stats['batches'] < 40  # some calls actually shared a batch
+    assert stats['queue_depth'] == 0
+
+
+def test_failing_row_fails_only_its_own_caller():
+    def score(matrix):
+        if np.isnan(matrix).any():
+            raise ValueError('NaN feature')
+        return _score(matrix)
+
+    batcher = MicroBatcher(score, max_batch_size=16, max_wait_ms=20)
+    rows = [[1, 2], [3, float('nan')], [5, 6], [7, 8]]
+    results = _submit_together(batcher, rows)
+    assert results[0] == 3.0 and results[2] == 11.0 and results[3] == 15.0
+    assert isinstance(results[1], ValueError)
+
+    # The worker is still serving afterwards
+    assert batcher.submit([1, 1], timeout=5) == 2.0
+
+
+def test_wrong_number_of_results_fails_instead_of_hanging():
+    batcher = MicroBatcher(lambda matrix: [], max_wait_ms=1)
+    with pytest.raises(ValueError):
+        batcher.submit([1, 2], timeout=5)
+
+
+@fork_only
+def test_forked_process_starts_its_own_worker():
+    batcher = MicroBatcher(_score, max_wait_ms=1)
+    assert batcher.submit([1, 2], timeout=5) == 3.0  # the parent's worker thread is running
+
+    # A pre-forking server forks after import; the child inherits the batcher but not its thread
+    pid = os.fork()
+    if pid == 0:
+        try:
+            ok = batcher.submit([2, 3], timeout=5) == 5.0 and batcher._worker_pid == os.getpid()
+        except Exception:
+            ok = False
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert batcher.submit([3, 4], timeout=5) == 7.0
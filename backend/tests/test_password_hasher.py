@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+import pytest
+
+from password_hasher import AuthOverloaded, PasswordHasher
+
+fork_only = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+
+
+def test_hash_and_check_round_trip():
+    hasher = PasswordHasher(workers=1, max_queue=0, rounds=4)
+    hashed = hasher.hash('correct horse')
+    assert bcrypt.checkpw(b'correct horse', hashed.encode())
+    assert hasher.check('correct horse', hashed)
+    assert not hasher.check('wrong', hashed)
+    assert hasher.stats()['hashes'] == 1 and hasher.stats()['checks'] == 2
+
+
+def test_never_forks_once_other_threads_are_running():
+    # pytest itself may be single-threaded, so make sure another thread exists
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        assert PasswordHasher(workers=1, rounds=4).executor == 'thread'
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_rejects_calls_beyond_workers_plus_queue():
+    hasher = PasswordHasher(workers=1, max_queue=0, rounds=12)
+    worker = threading.Thread(target=hasher.hash, args=('slow',))
+    worker.start()
+    while hasher.stats()['pending'] == 0:
+        time.sleep(0.001)
+    with pytest.raises(AuthOverloaded):
+        hasher.check('other', '$2b$04$' + 'a' * 53)
+    worker.join()
+    assert hasher.stats()['rejected'] == 1
+    assert hasher.stats()['pending'] == 0
+
+
+@fork_only
+def test_recovers_when_a_worker_process_dies():
+    hasher = PasswordHasher(workers=1, max_queue=0, rounds=4)
+    # A forked pool like the one app.py creates at startup, whose worker then gets OOM-killed
+    pool = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('fork'))
+    pid = pool.submit(os.getpid).result()
+    hasher._pool, hasher.executor = pool, 'process'
+    os.kill(pid, signal.SIGKILL)
+
+    hashed = hasher.hash('still works')
+    assert hasher.check('still works', hashed)
+    assert hasher.executor == 'thread'
+    assert hasher.stats()['rebuilds'] == 1
+    assert hasher.stats()['failures'] == 0
+
+
+def test_overloaded_auth_answers_429(monkeypatch, tmp_path):
+    app = pytest.importorskip('app')
+    from storage import SQLiteStorage
+
+    hasher = PasswordHasher(workers=1, max_queue=0, rounds=4)
+    monkeypatch.setattr(app, 'password_hasher', hasher)
+    monkeypatch.setattr(app, 'storage', SQLiteStorage(str(tmp_path / 'auth.db')))
+    monkeypatch.setattr(app, 'DATABASE_CONNECTED', True)
+    client = app.app.test_client()
+
+    credentials = {'email': 'a@example.com', 'password': 'pw', 'name': 'A'}
+    assert client.post('/api/auth/signup', json=credentials).status_code == 200
+
+    hasher._pending = hasher.max_pending  # every slot taken
+    for route in ('/api/auth/signup', '/api/auth/login'):
+        response = client.post(route, json=dict(credentials, email='b@example.com' if 'signup' in route else 'a@example.com'))
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '1'
+
+    hasher._pending = 0
+    assert client.post('/api/auth/login', json=credentials).status_code == 200
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+app = pytest.importorskip('app')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    app.predict_cache.clear()
+    app.risk_cache.clear()
+    calls = []
+    calculate = app.calculate_ingredient_features
+    monkeypatch.setattr(app, 'calculate_ingredient_features', lambda ingredients: calls.append(ingredients) or calculate(ingredients))
+    client = app.app.test_client()
+    client.feature_calls = calls
+    return client
+
+
+def _predict(client, product, skin_type='normal', allergies=''):
+    response = client.post('/api/predict', json={'product': product, 'skin_type': skin_type, 'allergies': allergies})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_repeat_query_is_served_from_the_response_cache(client):
+    first = _predict(client, 'water, glycerin, fragrance', 'dry', 'fragrance')
+    second = _predict(client, '  Water,  Glycerin, FRAGRANCE ', 'dry', 'Fragrance')
+    assert second == first
+    assert len(client.feature_calls) == 1
+    assert app.predict_cache.hits == 1
+
+
+def test_same_ingredients_reuse_features_whatever_the_spelling_or_order(client):
+    first = _predict(client, 'Water, Glycerin, Parabens')
+    spaced = _predict(client, 'water,glycerin,parabens')
+    reordered = _predict(client, 'parabens, water, glycerin')
+    assert len(client.feature_calls) == 1
+    assert app.risk_cache.hits == 2
+
+    # Each response still describes the list as the user sent it
+    assert spaced == first
+    assert reordered['analysis']['all_ingredients'] == ['parabens', 'water', 'glycerin']
+    assert reordered['prediction'] == first['prediction']
+
+
+def test_different_skin_type_or_allergies_are_separate_responses(client):
+    plain = _predict(client, 'water, fragrance, alcohol')
+    allergic = _predict(client, 'water, fragrance, alcohol', 'sensitive', 'fragrance')
+    assert plain['allergy_warnings'] == [] and allergic['allergy_warnings']
+    assert allergic['skin_type_warnings'] and not plain['skin_type_warnings']
+    assert len(client.feature_calls) == 1
+
+
+def test_batch_scores_each_distinct_ingredient_list_once(client):
+    single = _predict(client, 'water, sls, menthol')
+    client.feature_calls.clear()
+    response = client.post('/api/predict/batch', json={'products': [
+        'water, sls, menthol', 'menthol, water, sls', 'shea butter, water', 'water,shea butter', ''
+    ]}).get_json()
+    results = response['results']
+    assert [r['success'] for r in results] == [True, True, True, True, False]
+    assert client.feature_calls == [['shea butter', 'water']]
+    assert {k: v for k, v in results[0].items() if k != 'index'} == single
+    assert results[1]['prediction'] == single['prediction']
+
+
+def test_entries_expire_after_the_ttl(client, monkeypatch):
+    monkeypatch.setattr(app.predict_cache, 'ttl', 0.05)
+    monkeypatch.setattr(app.risk_cache, 'ttl', 0.05)
+    _predict(client, 'water, retinol')
+    _predict(client, 'water, retinol')
+    assert len(client.feature_calls) == 1
+
+    time.sleep(0.1)
+    _predict(client, 'water, retinol')
+    assert len(client.feature_calls) == 2
+    assert app.predict_cache.expirations >= 1 and app.risk_cache.expirations >= 1
+
+
+def test_knowledge_base_change_invalidates_cached_results(client, monkeypatch):
+    monkeypatch.setattr(app, 'KNOWLEDGE_CHECK_SECONDS', 0)
+    original = app.INGREDIENT_DATA['jojoba oil']
+    before = _predict(client, 'water, jojoba oil')
+    assert before['analysis']['high_risk_count'] == 0
+
+    app.INGREDIENT_DATA['jojoba oil'] = dict(original, risk=80)
+    try:
+        after = _predict(client, 'water, jojoba oil')
+        assert after['analysis']['high_risk_ingredients'] == ['jojoba oil']
+        assert len(client.feature_calls) == 2
+        assert app.predict_cache.invalidations >= 1 and app.risk_cache.invalidations >= 1
+    finally:
+        # Put the knowledge base back the way the other tests expect it
+        app.INGREDIENT_DATA['jojoba oil'] = original
+        app.refresh_knowledge_version()
+    assert app.KNOWLEDGE_VERSION == app.knowledge_base_fingerprint()
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from product_search import ProductCatalog, TrigramIndex, normalize_name, trigrams
+
+PRODUCTS = [
+    {'name': 'Moisturizing Cream', 'brand': 'CeraVe', 'category': 'Moisturizer'},
+    {'name': 'Hydrating Facial Cleanser', 'brand': 'CeraVe', 'category': 'Cleanser'},
+    {'name': 'Toleriane Double Repair Face Moisturizer', 'brand': 'La Roche-Posay', 'category': 'Moisturizer'},
+    {'name': 'Niacinamide 10% + Zinc 1%', 'brand': 'The Ordinary', 'category': 'Treatment'},
+    {'name': 'Ultra Facial Cream', 'brand': "Kiehl's", 'category': 'Moisturizer'},
+    {'name': 'C E Ferulic', 'brand': 'SkinCeuticals', 'category': 'Treatment'},
+    {'name': 'Oil', 'brand': 'Bio-Oil', 'category': 'Treatment'},
+]
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return ProductCatalog(PRODUCTS)
+
+
+def _names(results):
+    return [product['name'] for _, product, _ in results]
+
+
+def test_trigrams_pad_words_like_pg_trgm():
+    assert trigrams('Cat') == {'  c', ' ca', 'cat', 'at '}
+    assert trigrams('a-b') == {'  a', ' a ', '  b', ' b '}
+    assert trigrams('  !! ') == set()
+
+
+def test_typos_and_spelling_variants_rank_the_right_product_first(catalog):
+    assert _names(catalog.search('moisturising creme'))[0] == 'Moisturizing Cream'
+    assert _names(catalog.search('cerave moisturizng cream'))[0] == 'Moisturizing Cream'
+    assert _names(catalog.search('niacinamid zinc'))[0] == 'Niacinamide 10% + Zinc 1%'
+    assert _names(catalog.search('kiehls ultra facial'))[0] == 'Ultra Facial Cream'
+
+
+def test_brand_only_query_finds_every_product_of_the_brand_once(catalog):
+    results = catalog.search('cerave', min_score=0.1)
+    assert set(_names(results)[:2]) == {'Moisturizing Cream', 'Hydrating Facial Cleanser'}
+    doc_ids = [doc_id for doc_id, _, _ in results]
+    assert len(doc_ids) == len(set(doc_ids))
+
+
+def test_queries_shorter_than_three_characters(catalog):
+    # Padding gives even one- and two-letter words trigrams of their own
+    assert _names(catalog.search('oi', min_score=0.2))[0] == 'Oil'
+    assert _names(catalog.search('c e ferulic'))[0] == 'C E Ferulic'
+    assert catalog.search('x') == []
+    assert catalog.search('%%') == []
+    assert catalog.search('') == []
+
+
+def test_scores_are_ranked_and_limited(catalog):
+    results = catalog.search('facial cream', limit=2, min_score=0.1)
+    assert len(results) == 2
+    assert [score for _, _, score in results] == sorted((score for _, _, score in results), reverse=True)
+    assert all(0.1 <= score <= 1.0 for _, _, score in results)
+
+
+def test_empty_catalog_returns_nothing():
+    assert ProductCatalog([]).search('cerave') == []
+
+
+def _dice_reference(keys, key_docs, query, limit, min_score):
+    q = trigrams(query)
+    best = {}
+    for key, doc in zip(keys, key_docs):
+        grams = trigrams(key)
+        score = 2.0 * len(q & grams) / (len(q) + len(grams)) if q and grams else 0.0
+        if score >= min_score and score > best.get(doc, -1):
+            best[doc] = score
+    return sorted(best.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+@pytest.mark.parametrize('min_score', [0.2, 0.3, 0.5])
+def test_matches_a_brute_force_dice_ranking(min_score):
+    # Candidate pruning (probing the rarest grams) must not lose any match
+    rng = random.Random(11)
+    words = ['cream', 'creme', 'serum', 'gel', 'oil', 'face', 'facial', 'hydra', 'hydrating', 'night',
+             'vitamin', 'c', 'retinol', 'spf', '30', 'gentle', 'cleanser', 'moisturizer', 'zinc', 'ac']
+    keys = [normalize_name(' '.join(rng.choices(words, k=rng.randint(1, 5)))) for _ in range(500)]
+    key_docs = [i // 2 for i in range(len(keys))]  # two keys per document
+    index = TrigramIndex.build(keys, key_docs)
+
+    for query in ['hydrating cream', 'vitamin c serum', 'oil', 'retinl nigth creme', 'spf 30 face', 'zz']:
+        expected = _dice_reference(keys, key_docs, query, 10, min_score)
+        actual = index.search(query, limit=10, min_score=min_score)
+        assert [score for _, score in actual] == pytest.approx([score for _, score in expected])
+        assert [doc for doc, _ in actual] == [doc for doc, _ in expected]
@@ -0,0 +1,125 @@
+import base64
+import json
+import random
+
+import pytest
+
+from review_summary import ReviewSummaries
+from storage import SQLiteStorage
+
+SKIN_TYPES = ['oily', 'dry', 'normal', None]
+
+
+def _random_reviews(n, seed=1):
+    rng = random.Random(seed)
+    return [{'id': i + 1, 'product_name': rng.choice(['serum', 'cream', 'toner']),
+             'rating': rng.choice([1, 2, 3, 4, 5, 4.6, '3', 0, 9, None, 'great']),
+             'skin_type': rng.choice(SKIN_TYPES)} for i in range(n)]
+
+
+def test_incremental_updates_equal_a_full_recompute():
+    reviews = _random_reviews(500)
+    incremental = ReviewSummaries()
+    for review in reviews:
+        incremental.add(review)
+    full = ReviewSummaries()
+    full.rebuild(reviews)
+    for product in ('serum', 'cream', 'toner', 'unknown'):
+        assert incremental.get(product) == full.get(product)
+
+
+def test_summary_counts_means_and_histograms():
+    summaries = ReviewSummaries()
+    for rating, skin_type in [(5, 'oily'), (4, 'oily'), (1, 'dry'), (4.6, None), (0, 'dry'), (True, 'dry')]:
+        summaries.add({'product_name': 'serum', 'rating': rating, 'skin_type': skin_type})
+    summary = summaries.get('serum')
+    assert summary['count'] == 4 and summary['mean_rating'] == 3.75
+    assert summary['histogram'] == {'1': 1, '2': 0, '3': 0, '4': 1, '5': 2}
+    assert summary['by_skin_type']['oily']['mean_rating'] == 4.5
+    assert summary['by_skin_type']['unspecified']['count'] == 1
+    assert summaries.stats()['skipped'] == 2
+    assert summaries.get('nothing')['count'] == 0 and summaries.get('nothing')['mean_rating'] is None
+
+
+def test_review_added_during_a_rebuild_is_counted_once():
+    summaries = ReviewSummaries()
+    table = [{'id': 1, 'product_name': 'serum', 'rating': 5, 'skin_type': 'oily'}]
+
+    def scan():
+        yield table[0]
+        # Written while the scan is running: one review the scan will still see, one it has passed
+        for review in ({'id': 3, 'product_name': 'serum', 'rating': 1, 'skin_type': 'dry'},
+                       {'id': 2, 'product_name': 'serum', 'rating': 3, 'skin_type': 'dry'}):
+            summaries.add(review)
+        yield {'id': 3, 'product_name': 'serum', 'rating': 1, 'skin_type': 'dry'}
+
+    summaries.rebuild(scan())
+    assert summaries.get('serum')['count'] == 3
+    assert summaries.get('serum')['histogram'] == {'1': 1, '2': 0, '3': 1, '4': 0, '5': 1}
+
+
+@pytest.fixture
+def reviews_client(monkeypatch, tmp_path):
+    app = pytest.importorskip('app')
+    storage = SQLiteStorage(str(tmp_path / 'reviews.db'))
+    monkeypatch.setattr(app, 'storage', storage)
+    monkeypatch.setattr(app, 'review_summaries', ReviewSummaries())
+    monkeypatch.setattr(app, 'DATABASE_CONNECTED', True)
+    client = app.app.test_client()
+    client.storage = storage
+    return client
+
+
+def _add(client, created_at, rating=4, product='serum'):
+    review = client.storage.add_review({'user_id': '1', 'product_name': product, 'rating': rating,
+                                        'review_text': 'ok', 'skin_type': 'oily', 'created_at': created_at})
+    return review['id']
+
+
+def test_cursor_pages_through_reviews_that_share_a_timestamp(reviews_client):
+    # Seven reviews in the same second, so only the id tells pages apart
+    ids = [_add(reviews_client, '2025-03-01T10:00:00') for _ in range(7)]
+    ids += [_add(reviews_client, '2025-03-02T10:00:00.123456') for _ in range(2)]
+    ids.append(_add(reviews_client, '2025-02-01T00:00:00'))
+    _add(reviews_client, '2025-03-05T00:00:00', product='cream')
+
+    walked, cursor, pages = [], None, 0
+    while True:
+        url = '/api/reviews/serum?limit=3&fields=id,rating' + (f'&cursor={cursor}' if cursor else '')
+        body = reviews_client.get(url).get_json()
+        assert all(set(review) == {'id', 'rating'} for review in body['reviews'])
+        walked += [review['id'] for review in body['reviews']]
+        pages += 1
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+
+    # Newest first, ties broken by id, nothing skipped or repeated
+    assert walked == ids[7:9][::-1] + ids[:7][::-1] + [ids[9]]
+    assert pages == 4
+
+
+def test_cursor_encodes_the_last_review_of_the_page(reviews_client):
+    _add(reviews_client, '2025-03-01T10:00:00')
+    last = _add(reviews_client, '2025-03-01T09:00:00')
+    _add(reviews_client, '2025-03-01T08:00:00')
+    cursor = reviews_client.get('/api/reviews/serum?limit=2').get_json()['next_cursor']
+    assert json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))) == ['2025-03-01T09:00:00', last]
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor',
+    base64.urlsafe_b64encode(b'["2025-03-01T10:00:00", "1 OR 1=1"]').decode(),
+    base64.urlsafe_b64encode(b'["yesterday", 3]').decode(),
+    base64.urlsafe_b64encode(b'["2025-03-01T10:00:00"]').decode(),
+    base64.urlsafe_b64encode(b'{"created_at": "2025-03-01"}').decode(),
+])
+def test_tampered_cursor_is_400(reviews_client, cursor):
+    _add(reviews_client, '2025-03-01T10:00:00')
+    response = reviews_client.get(f'/api/reviews/serum?cursor={cursor}')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'invalid cursor'
+
+
+def test_unknown_fields_are_400(reviews_client):
+    assert reviews_client.get('/api/reviews/serum?fields=id,password').status_code == 400
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import SingleFlight
+
+CALLERS = 16
+
+
+def _call_together(flights, key, fn):
+    """CALLERS threads call flights.do(key, fn) at once; returns (result or exception, shared) per caller"""
+    start = threading.Barrier(CALLERS)
+
+    def call():
+        start.wait()
+        try:
+            return flights.do(key, fn, timeout=5)
+        except Exception as e:
+            return e, None
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        futures = [pool.submit(call) for _ in range(CALLERS)]
+        return [future.result() for future in futures]
+
+
+def _slow(runs, outcome):
+    def fn():
+        runs.append(threading.current_thread().name)
+        time.sleep(0.2)  # long enough for every caller to arrive while the leader is running
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return fn
+
+
+def test_concurrent_identical_calls_run_the_leader_once():
+    flights, runs = SingleFlight(), []
+    answer = {'reply': 'Use a gentle cleanser'}
+    results = _call_together(flights, 'chat|oily skin', _slow(runs, answer))
+
+    assert len(runs) == 1
+    assert all(result is answer for result, _ in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * (CALLERS - 1)
+    assert flights.stats() == {'in_flight': 0, 'leader_calls': 1, 'shared_calls': CALLERS - 1}
+
+
+def test_every_waiter_gets_the_leaders_exception():
+    flights, runs = SingleFlight(), []
+    error = RuntimeError('Gemini unavailable')
+    results = _call_together(flights, 'chat|oily skin', _slow(runs, error))
+
+    assert len(runs) == 1
+    assert all(result is error for result, _ in results)
+    assert flights.stats()['in_flight'] == 0
+
+    # A failure isn't remembered: the next call runs again
+    assert flights.do('chat|oily skin', lambda: 'recovered') == ('recovered', False)
+
+
+def test_different_keys_run_separately():
+    flights, runs = SingleFlight(), []
+    with ThreadPoolExecutor(2) as pool:
+        a = pool.submit(flights.do, 'a', _slow(runs, 'A'))
+        b = pool.submit(flights.do, 'b', _slow(runs, 'B'))
+        assert (a.result(), b.result()) == (('A', False), ('B', False))
+    assert len(runs) == 2
+
+
+def test_waiter_gives_up_after_its_timeout():
+    flights = SingleFlight()
+    call, leader = flights.begin('slow')
+    assert leader
+    with pytest.raises(TimeoutError):
+        flights.do('slow', lambda: 'never runs', timeout=0.05)
+
+    flights.finish('slow', call, 'late')
+    flights.finish('slow', call, 'ignored')  # only the first outcome is published
+    assert call.wait(0) == 'late'
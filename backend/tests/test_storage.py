@@ -0,0 +1,52 @@
+import pytest
+
+from storage import SQLiteStorage, Storage
+
+
+def test_incomplete_backend_fails_when_created():
+    class HalfDone(Storage):
+        def create_user(self, user):
+            return user
+
+    with pytest.raises(TypeError):
+        HalfDone()
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return SQLiteStorage(str(tmp_path / 'test.db'))
+
+
+def test_sqlite_users(storage):
+    user = storage.create_user({'email': 'a@example.com', 'password': 'hash', 'name': 'A'})
+    assert storage.get_user_by_email('a@example.com')['id'] == user['id']
+    assert storage.update_user(user['id'], {'name': 'B'}, ('id', 'name')) == {'id': user['id'], 'name': 'B'}
+    assert storage.update_user(user['id'] + 1, {'name': 'C'}) is None
+    with pytest.raises(ValueError):
+        storage.get_user(user['id'], ('id', 'password; DROP TABLE users'))
+
+
+def test_sqlite_review_pages_cover_every_review_once(storage):
+    # Several reviews share a timestamp, so the id has to break ties
+    for i in range(25):
+        storage.add_review({'product_name': 'P', 'rating': i % 5 + 1, 'created_at': f'2025-01-01T00:00:{i // 4:02d}'})
+    storage.add_review({'product_name': 'Q', 'rating': 5, 'created_at': '2025-01-02T00:00:00'})
+
+    seen, after = [], None
+    while True:
+        page = storage.list_reviews('P', ('id', 'created_at'), 4, after)
+        seen += [row['id'] for row in page]
+        if len(page) < 4:
+            break
+        after = (page[-1]['created_at'], page[-1]['id'])
+    assert seen == sorted(seen, reverse=True)
+    assert len(seen) == len(set(seen)) == 25
+
+
+def test_sqlite_scans_and_rejections(storage):
+    storage.add_game_scores([{'user_id': f'u{i}', 'score': i, 'game_type': 'g'} for i in range(7)])
+    assert [row['score'] for row in storage.iter_game_scores(page_size=3)] == list(range(7))
+    with pytest.raises(Exception) as error:
+        storage.add_game_scores([{'user_id': 'u', 'score': {'not': 'a number'}, 'game_type': 'g'}])
+    assert storage.is_rejection(error.value)
+    assert not storage.is_rejection(ConnectionError('down'))
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from structured_output import IMAGE_ANALYSIS_SCHEMA, OutputInvalid, StructuredOutput
+
+EXPECTED = {'severity': 'mild', 'type': 'eczema', 'confidence': 85,
+            'observations': ['redness'], 'recommendations': ['moisturize']}
+
+
+@pytest.fixture
+def output():
+    return StructuredOutput(IMAGE_ANALYSIS_SCHEMA, ranges={'confidence': (0, 100)})
+
+
+def _reply(**changes):
+    return json.dumps(dict(EXPECTED, **changes))
+
+
+def test_valid_output_is_returned_as_is(output):
+    assert output.parse(json.dumps(EXPECTED)) == EXPECTED
+    assert output.stats()['valid'] == 1 and output.stats()['repaired'] == 0
+
+
+@pytest.mark.parametrize('text', [
+    '```json\n' + json.dumps(EXPECTED) + '\n```',
+    'Analysis: {"severity": "mild", "type": "eczema", "confidence": 85, '
+    '"observations": ["redness"], "recommendations": ["moisturize",],}',
+    _reply(observations='redness'),
+    _reply(confidence='85%'),
+    _reply(confidence=' 85.2 '),
+    _reply(severity='Mild'),
+    _reply(severity='mild to moderate'),
+    _reply(observations=['redness', '', None]),
+    _reply(notes='extra field'),
+])
+def test_near_misses_are_repaired_locally(output, text):
+    assert output.parse(text) == EXPECTED
+    assert output.stats()['repaired'] == 1
+
+
+@pytest.mark.parametrize('confidence, expected', [(140, 100), (-5, 0), ('250%', 100)])
+def test_confidence_is_clamped_to_its_range(output, confidence, expected):
+    assert output.parse(_reply(confidence=confidence))['confidence'] == expected
+
+
+def test_missing_list_becomes_empty(output):
+    reply = dict(EXPECTED)
+    del reply['recommendations']
+    assert output.parse(json.dumps(reply)) == dict(EXPECTED, recommendations=[])
+
+
+@pytest.mark.parametrize('text', [
+    'I cannot assess this image',
+    '{"severity": "mild"',
+    '["mild"]',
+    json.dumps({k: v for k, v in EXPECTED.items() if k != 'confidence'}),
+    json.dumps({k: v for k, v in EXPECTED.items() if k != 'type'}),
+    _reply(severity='unclear'),
+    _reply(confidence='high'),
+    _reply(confidence=True),
+    _reply(confidence='inf'),
+    _reply(confidence='-Infinity'),
+    _reply(confidence='1e400'),
+    _reply(confidence='nan'),
+    _reply(observations={'skin': 'red'}),
+    _reply(type=['eczema']),
+])
+def test_unrepairable_output_needs_a_reprompt(output, text):
+    with pytest.raises(OutputInvalid):
+        output.parse(text)
+    assert output.stats()['parse_failures'] == 1
+
+
+def test_reprompt_outcomes_are_counted_separately(output):
+    with pytest.raises(OutputInvalid):
+        output.parse('{"severity": "mild"}')
+    with pytest.raises(OutputInvalid):
+        output.parse('still not JSON', reprompted=True)
+    assert output.parse(json.dumps(EXPECTED), reprompted=True) == EXPECTED
+    stats = output.stats()
+    assert (stats['responses'], stats['parse_failures'], stats['discarded'], stats['recovered_by_reprompt']) == (1, 1, 1, 1)
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from term_matcher import PhraseMatcher, TermMatcher
+
+HARMFUL = {
+    'high_risk': ['parabens', 'methylparaben', 'propylparaben', 'formaldehyde', 'triclosan'],
+    'moderate_risk': ['fragrance', 'parfum', 'alcohol denat', 'sodium lauryl sulfate', 'sls'],
+    'comedogenic': ['coconut oil', 'cocoa butter', 'isopropyl myristate'],
+    'irritants': ['menthol', 'camphor', 'alcohol'],
+}
+
+
+def _substring_counts(ingredients, terms_by_label):
+    # The loop TermMatcher replaced: one any() per label per ingredient
+    return {label: sum(any(term in ing for term in terms) for ing in ingredients)
+            for label, terms in terms_by_label.items()}
+
+
+def _matcher_counts(ingredients, matcher):
+    return {label: sum(label in matcher.match(ing) for ing in ingredients) for label in matcher.labels}
+
+
+@pytest.mark.parametrize('ingredients', [
+    ['alcohol', 'alcohol denat', 'denatured alcohol', 'cetearyl alcohol'],
+    ['sls', 'sodium lauryl sulfate', 'glossy finish', 'isls', 'tassels'],
+    ['methylparaben', 'parabens', 'paraben', 'propylparaben'],
+    ['coconut oil', 'coconut', 'cocoa butter extract', 'isopropyl myristate'],
+    ['water', 'glycerin', 'parfum', 'menthol', 'camphorated oil'],
+    [''],
+    [],
+])
+def test_counts_match_substring_loop(ingredients):
+    assert _matcher_counts(ingredients, TermMatcher(HARMFUL)) == _substring_counts(ingredients, HARMFUL)
+
+
+def test_overlapping_terms_match_every_label():
+    matcher = TermMatcher(HARMFUL)
+    # "alcohol" is an irritant and also a prefix of the moderate-risk "alcohol denat"
+    assert matcher.match('alcohol denat') == {'moderate_risk', 'irritants'}
+    assert matcher.match('alcohol') == {'irritants'}
+    # Substring semantics, as before: "sls" inside a longer word still counts
+    assert matcher.match('teaslsalt') == {'moderate_risk'}
+    assert matcher.match('') == frozenset()
+
+
+def test_random_knowledge_base_matches_substring_loop():
+    rng = random.Random(0)
+    # Short terms over a small alphabet, so terms overlap and nest a lot
+    terms = {label: [''.join(rng.choices('abc', k=rng.randint(1, 4))) for _ in range(8)]
+             for label in ('a', 'b', 'c', 'd')}
+    ingredients = [''.join(rng.choices('abcd ', k=rng.randint(0, 12))) for _ in range(300)]
+    assert _matcher_counts(ingredients, TermMatcher(terms)) == _substring_counts(ingredients, terms)
+
+
+def test_blank_terms_are_ignored():
+    matcher = TermMatcher({'x': ['', '  ', 'Fragrance'], 'y': []})
+    assert matcher.match('unscented') == frozenset()
+    assert matcher.match('fragrance free') == {'x'}
+    assert matcher.match_mask('fragrance') == matcher.bit('x')
+
+
+@pytest.fixture
+def phrases():
+    matcher = PhraseMatcher()
+    for phrase, payload in [('tea', 'tea tree oil'), ('tea tree oil', 'tea tree oil'), ('the ordinary', 'brand'),
+                            ('vitamin c', 'ascorbic acid'), ('ascorbic acid', 'ascorbic acid'), ('oil', 'oil'),
+                            ('sls', 'sls'), ('  ', 'blank')]:
+        matcher.add(phrase, payload)
+    return matcher
+
+
+def test_phrases_only_match_whole_words(phrases):
+    # Substrings of other words don't count
+    assert phrases.find('is this aesthetic?') == []
+    assert phrases.find('steady, with a bit of boiled water') == []
+    assert phrases.find('glossy teaslsalt') == []
+    assert phrases.find('') == []
+
+
+def test_multi_word_phrases_match_longest_first(phrases):
+    assert phrases.find('Does The Ordinary sell vitamin C?') == ['brand', 'ascorbic acid']
+    assert phrases.find('is tea tree oil ok') == ['tea tree oil', 'oil']
+    assert phrases.find('the ordinary') == ['brand']
+    assert phrases.find('the') == []
+
+
+def test_each_payload_is_reported_once_in_order(phrases):
+    text = 'ascorbic acid, also called vitamin c - sls and more sls, then oil'
+    assert phrases.find(text) == ['ascorbic acid', 'sls', 'oil']
+    assert phrases.size == 7  # blank phrase ignored
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from tree_compiler import compile_risk_model
+
+
+def _risk_data(n_classes, n_rows=400, n_features=12, seed=0):
+    # Non-negative counts, like the ingredient feature vectors the risk model sees
+    rng = np.random.default_rng(seed)
+    X = rng.poisson(3, size=(n_rows, n_features)).astype(float)
+    score = X[:, 0] * 2 + X[:, 1] - X[:, 2] + rng.normal(0, 1, n_rows)
+    y = np.digitize(score, np.quantile(score, np.linspace(0, 1, n_classes + 1)[1:-1]))
+    return X, y
+
+
+def _assert_matches(classifier, X, y):
+    scaler = StandardScaler().fit(X)
+    classifier.fit(scaler.transform(X), y)
+    compiled = compile_risk_model(classifier, scaler)
+
+    # Fresh rows, not the ones compile_risk_model probed with
+    rows, _ = _risk_data(2, n_rows=500, n_features=X.shape[1], seed=1)
+    expected = classifier.predict_proba(scaler.transform(rows))
+    actual = compiled.predict_proba(rows)
+    assert np.allclose(actual, expected, atol=1e-6)
+    assert (classifier.classes_[actual.argmax(axis=1)] == classifier.predict(scaler.transform(rows))).all()
+
+
+@pytest.mark.parametrize('n_classes', [2, 3])
+def test_random_forest(n_classes):
+    _assert_matches(RandomForestClassifier(n_estimators=25, max_depth=6, random_state=0), *_risk_data(n_classes))
+
+
+@pytest.mark.parametrize('n_classes', [2, 3])
+def test_gradient_boosting(n_classes):
+    _assert_matches(GradientBoostingClassifier(n_estimators=30, max_depth=3, random_state=0), *_risk_data(n_classes))
+
+
+@pytest.mark.parametrize('n_classes', [2, 3])
+def test_xgboost(n_classes):
+    xgboost = pytest.importorskip('xgboost')
+    _assert_matches(xgboost.XGBClassifier(n_estimators=30, max_depth=4, random_state=0), *_risk_data(n_classes))
+
+
+def test_decision_tree():
+    _assert_matches(DecisionTreeClassifier(max_depth=8, random_state=0), *_risk_data(3))
+
+
+def test_unsupported_model_is_refused():
+    X, y = _risk_data(2)
+    with pytest.raises(TypeError):
+        compile_risk_model(LogisticRegression().fit(X, y))
@@ -0,0 +1,83 @@
+import json
+import time
+
+from write_behind import WriteBehindBuffer
+
+
+class FakeTable:
+    """Bulk insert that refuses any batch holding a bad row, or everything while down"""
+
+    def __init__(self):
+        self.rows = []
+        self.down = False
+
+    def insert(self, batch):
+        if self.down:
+            raise ConnectionError('database unreachable')
+        if any(not isinstance(row['score'], int) for row in batch):
+            raise ValueError('invalid input syntax for type integer')
+        self.rows.extend(batch)
+
+
+def _scores(n, start=0):
+    return [{'user_id': f'u{i}', 'score': i} for i in range(start, start + n)]
+
+
+def test_lone_row_is_flushed_after_the_interval():
+    table = FakeTable()
+    writer = WriteBehindBuffer(table.insert, max_rows=200, interval_ms=20)
+    writer.add({'user_id': 'u', 'score': 1})
+    time.sleep(0.2)
+    assert table.rows == [{'user_id': 'u', 'score': 1}]
+    writer.close()
+
+
+def test_rejected_batch_is_split_and_bad_row_set_aside(tmp_path):
+    table = FakeTable()
+    spill = tmp_path / 'scores.jsonl'
+    writer = WriteBehindBuffer(table.insert, max_rows=10, interval_ms=20, spill_path=str(spill), backoff_ms=1)
+    rows = _scores(4)
+    rows.insert(2, {'user_id': 'bad', 'score': 'lots'})
+    for row in rows:
+        writer.add(row)
+    writer.close()
+
+    assert table.rows == [row for row in rows if row['user_id'] != 'bad']
+    assert writer.rejected == 1
+    assert not spill.exists()
+    rejected = [json.loads(line) for line in (tmp_path / 'scores.jsonl.rejected').read_text().splitlines()]
+    assert [entry['row'] for entry in rejected] == [{'user_id': 'bad', 'score': 'lots'}]
+
+
+def test_bad_spilled_row_does_not_block_replay(tmp_path):
+    table = FakeTable()
+    spill = tmp_path / 'scores.jsonl'
+    spilled = _scores(3) + [{'user_id': 'bad', 'score': None}] + _scores(3, start=3)
+    spill.write_text(''.join(json.dumps(row) + '\n' for row in spilled))
+
+    writer = WriteBehindBuffer(table.insert, max_rows=2, interval_ms=20, spill_path=str(spill), backoff_ms=1)
+    writer.close()
+
+    assert table.rows == [row for row in spilled if row['user_id'] != 'bad']
+    assert writer.replayed == 6 and writer.rejected == 1
+    assert not spill.exists() and not (tmp_path / 'scores.jsonl.replay').exists()
+
+
+def test_unreachable_database_spills_then_replays(tmp_path):
+    table = FakeTable()
+    table.down = True
+    spill = tmp_path / 'scores.jsonl'
+    writer = WriteBehindBuffer(table.insert, max_rows=5, interval_ms=20, spill_path=str(spill),
+                               max_attempts=2, backoff_ms=1)
+    for row in _scores(5):
+        writer.add(row)
+    deadline = time.monotonic() + 2
+    while writer.spilled < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.spilled == 5 and writer.rejected == 0
+
+    table.down = False
+    writer.add({'user_id': 'next', 'score': 9})
+    writer.close()
+    assert sorted(row['score'] for row in table.rows) == [0, 1, 2, 3, 4, 9]
+    assert not spill.exists()
@@ -0,0 +1,247 @@
+"""
+Compiled tree-ensemble evaluator
+Flattens the risk classifier produced by SkincareMLPipeline (Random Forest,
+Decision Tree, Gradient Boosting or XGBoost) and its StandardScaler into plain
+NumPy node arrays, so serving skips sklearn's per-call input validation.
+"""
+
+import json
+
+import numpy as np
+
+
+class FlatTrees:
+    def __init__(self, trees):
+        """Concatenate per-tree node arrays into one global node table"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for tree in trees:
+            n_nodes = len(tree['left'])
+            left = np.asarray(tree['left'], dtype=np.int64)
+            right = np.asarray(tree['right'], dtype=np.int64)
+            is_leaf = left < 0
+
+            # Leaves point at themselves so extra traversal steps are no-ops
+            own = np.arange(n_nodes, dtype=np.int64)
+            left = np.where(is_leaf, own, left) + offset
+            right = np.where(is_leaf, own, right) + offset
+
+            features.append(np.where(is_leaf, 0, tree['feature']).astype(np.int64))
+            thresholds.append(np.where(is_leaf, np.inf, tree['threshold']).astype(np.float64))
+            lefts.append(left)
+            rights.append(right)
+            values.append(np.asarray(tree['value'], dtype=np.float64).reshape(n_nodes, -1))
+            roots.append(offset)
+
+            max_depth = max(max_depth, tree['depth'])
+            offset += n_nodes
+
+        self.feature = np.concatenate(features)
+        self.threshold = np.concatenate(thresholds)
+        self.left = np.concatenate(lefts)
+        self.right = np.concatenate(rights)
+        self.value = np.concatenate(values)
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.max_depth = max_depth
+
+    def apply(self, X, strict=False):
+        """Leaf index reached by every row in every tree, shape (n_rows, n_trees)"""
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        rows = np.arange(X.shape[0])[:, None]
+
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[nodes]]
+            thr = self.threshold[nodes]
+            # sklearn sends x <= threshold left, XGBoost sends x < split_condition left
+            go_left = x < thr if strict else x <= thr
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return nodes
+
+
+class CompiledForest:
+    def __init__(self, trees, classes):
+        """Averaged leaf class distributions (Random Forest, Decision Tree)"""
+        self.trees = FlatTrees(trees)
+        self.classes_ = np.asarray(classes)
+
+        totals = self.trees.value.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1.0
+        self.leaf_proba = self.trees.value / totals
+
+    def predict_proba(self, X):
+        leaves = self.trees.apply(X)
+        return self.leaf_proba[leaves].mean(axis=1)
+
+
+class CompiledBoosting:
+    def __init__(self, trees, tree_class, n_classes, classes, learning_rate=1.0,
+                 strict=False, link_scale=1.0):
+        """Summed leaf margins plus sigmoid/softmax (Gradient Boosting, XGBoost)"""
+        self.trees = FlatTrees(trees)
+        self.classes_ = np.asarray(classes)
+        self.n_classes = n_classes
+        self.learning_rate = learning_rate
+        self.strict = strict
+        self.link_scale = link_scale
+
+        self.leaf_value = self.trees.value[:, 0]
+        n_outputs = 1 if n_classes == 2 else n_classes
+        self.tree_onehot = np.zeros((len(tree_class), n_outputs))
+        self.tree_onehot[np.arange(len(tree_class)), tree_class] = 1.0
+        self.base_margin = np.zeros(n_outputs)
+
+    def leaf_margin(self, X):
+        leaves = self.trees.apply(X, strict=self.strict)
+        return self.learning_rate * (self.leaf_value[leaves] @ self.tree_onehot)
+
+    def decision_function(self, X):
+        return self.base_margin + self.leaf_margin(X)
+
+    def predict_proba(self, X):
+        margin = self.decision_function(X) * self.link_scale
+        if self.n_classes == 2:
+            positive = 1.0 / (1.0 + np.exp(-margin[:, 0]))
+            return np.column_stack([1.0 - positive, positive])
+        margin = margin - margin.max(axis=1, keepdims=True)
+        exp = np.exp(margin)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+class CompiledRiskModel:
+    def __init__(self, ensemble, mean=None, scale=None, n_features=None):
+        """StandardScaler + tree ensemble evaluated with NumPy only"""
+        self.ensemble = ensemble
+        self.mean = mean
+        self.scale = scale
+        self.n_features = n_features
+        self.classes_ = ensemble.classes_
+
+    def transform(self, X):
+        return _standardize(X, self.mean, self.scale)
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or (self.n_features and X.shape[1] != self.n_features):
+            raise ValueError(f"Expected a 2D array with {self.n_features} features, got shape {X.shape}")
+        return self.ensemble.predict_proba(self.transform(X))
+
+
+def _standardize(X, mean, scale):
+    X = np.asarray(X, dtype=np.float64)
+    if mean is not None:
+        X = X - mean
+    if scale is not None:
+        X = X / scale
+    # Tree models compare on float32 inputs, same as sklearn and XGBoost
+    return X.astype(np.float32)
+
+
+def _sklearn_tree(tree):
+    t = tree.tree_
+    return {
+        'feature': t.feature,
+        'threshold': t.threshold,
+        'left': t.children_left,
+        'right': t.children_right,
+        'value': t.value.reshape(t.node_count, -1),
+        'depth': t.max_depth,
+    }
+
+
+def _xgboost_tree(tree):
+    left = np.asarray(tree['left_children'], dtype=np.int64)
+    right = np.asarray(tree['right_children'], dtype=np.int64)
+    if tree.get('categories_nodes'):
+        raise TypeError("Categorical XGBoost splits are not supported")
+
+    # Depth via parent links (children always have larger ids than parents)
+    depth = np.zeros(len(left), dtype=np.int64)
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[node] + 1
+            depth[right[node]] = depth[node] + 1
+
+    conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+    return {
+        'feature': np.asarray(tree['split_indices'], dtype=np.int64),
+        'threshold': conditions,
+        'left': left,
+        'right': right,
+        # Leaf weights are stored in split_conditions for leaf nodes
+        'value': conditions.astype(np.float64),
+        'depth': int(depth.max()),
+    }
+
+
+def _calibrate_base_margin(compiled, reference_margin, probe):
+    """Recover the constant init/base_score term from the reference model"""
+    margin = np.asarray(reference_margin(probe), dtype=np.float64).reshape(len(probe), -1)
+    compiled.base_margin = (margin - compiled.leaf_margin(probe))[0]
+
+
+def compile_ensemble(model, probe):
+    name = type(model).__name__
+
+    if name in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+        return CompiledForest([_sklearn_tree(est) for est in model.estimators_], model.classes_)
+
+    if name == 'DecisionTreeClassifier':
+        return CompiledForest([_sklearn_tree(model)], model.classes_)
+
+    if name == 'GradientBoostingClassifier':
+        stages = model.estimators_
+        trees = [_sklearn_tree(est) for stage in stages for est in stage]
+        tree_class = [k for _ in stages for k in range(stages.shape[1])]
+        link_scale = 2.0 if getattr(model, 'loss', 'log_loss') == 'exponential' else 1.0
+        compiled = CompiledBoosting(trees, tree_class, len(model.classes_), model.classes_,
+                                    learning_rate=model.learning_rate, link_scale=link_scale)
+        _calibrate_base_margin(compiled, model.decision_function, probe)
+        return compiled
+
+    if name == 'XGBClassifier':
+        booster = model.get_booster()
+        dump = json.loads(booster.save_raw(raw_format='json'))
+        gbm = dump['learner']['gradient_booster']
+        if gbm.get('name') != 'gbtree':
+            raise TypeError(f"Unsupported XGBoost booster '{gbm.get('name')}'")
+        trees = [_xgboost_tree(tree) for tree in gbm['model']['trees']]
+        tree_class = gbm['model']['tree_info']
+        n_classes = len(model.classes_)
+        compiled = CompiledBoosting(trees, tree_class, n_classes, model.classes_, strict=True)
+        _calibrate_base_margin(compiled, lambda X: model.predict(X, output_margin=True), probe)
+        return compiled
+
+    raise TypeError(f"Cannot compile model of type {name}")
+
+
+def compile_risk_model(classifier, scaler=None, n_probe=256, tolerance=1e-6):
+    """Compile classifier (+ scaler) and check it matches the original on random rows"""
+    if scaler is not None and type(scaler).__name__ != 'StandardScaler':
+        raise TypeError(f"Cannot compile scaler of type {type(scaler).__name__}")
+
+    n_features = getattr(classifier, 'n_features_in_', None)
+    if scaler is not None:
+        n_features = scaler.n_features_in_
+    mean = getattr(scaler, 'mean_', None) if scaler is not None else None
+    scale = getattr(scaler, 'scale_', None) if scaler is not None else None
+
+    # Probe rows spread around the training distribution
+    rng = np.random.default_rng(0)
+    center = mean if mean is not None else np.zeros(n_features)
+    spread = scale if scale is not None else np.ones(n_features)
+    raw_probe = center + rng.normal(0, 2, size=(n_probe, n_features)) * spread
+    raw_probe = np.round(np.abs(raw_probe))
+
+    ensemble = compile_ensemble(classifier, _standardize(raw_probe, mean, scale))
+    compiled = CompiledRiskModel(ensemble, mean, scale, n_features)
+
+    expected = classifier.predict_proba(scaler.transform(raw_probe) if scaler is not None else raw_probe)
+    actual = compiled.predict_proba(raw_probe)
+    if not np.allclose(actual, expected, atol=tolerance, rtol=1e-4):
+        worst = float(np.abs(actual - expected).max())
+        raise ValueError(f"Compiled model disagrees with original (max diff {worst:.2e})")
+
+    return compiled
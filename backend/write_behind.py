@@ -0,0 +1,264 @@
+"""
+Write-behind buffer for high-volume inserts
+Rows are appended to a bounded in-memory buffer and written in bulk by a
+background flusher every max_rows rows or interval_ms, whichever comes first.
+Failed batches are retried with exponential backoff and then spilled to a
+local append-only JSON-lines file, which is replayed once the database is
+reachable again, so rows are delayed rather than lost. A batch the database
+refuses outright is retried row by row and the refused rows are set aside in
+a .rejected file, so one bad row can't hold up the rest.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows: the spill file is then only safe within one process
+    fcntl = None
+
+
+class _FileLock:
+    """flock on a side file; shared by every process spilling to the same path"""
+
+    def __init__(self, path, blocking=True):
+        self.path = path
+        self.blocking = blocking
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is None:
+            return True
+        self._file = open(self.path, 'a')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | (0 if self.blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def __exit__(self, *_):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class WriteBehindBuffer:
+    def __init__(self, sink, max_rows=200, interval_ms=1000, max_buffer=20000, spill_path=None,
+                 max_attempts=3, backoff_ms=500, max_backoff_ms=30000, is_rejection=None, name='write-behind'):
+        """sink(rows) performs one bulk insert and raises on failure; is_rejection(error) tells a
+        refusal of the rows themselves (bad data) apart from the database being unreachable"""
+        self.sink = sink
+        self.is_rejection = is_rejection or (lambda e: isinstance(e, (TypeError, ValueError)))
+        self.max_rows = max_rows
+        self.interval = interval_ms / 1000
+        self.max_buffer = max_buffer
+        self.spill_path = spill_path
+        self.max_attempts = max_attempts
+        self.backoff = backoff_ms / 1000
+        self.max_backoff = max_backoff_ms / 1000
+        self._rows = deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._consecutive_failures = 0
+
+        # Metrics
+        self.queued = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.last_error = None
+
+        self._thread = threading.Thread(target=self._run, name=f"{name}-flusher", daemon=True)
+        self._thread.start()
+
+    def add(self, row):
+        with self._cond:
+            if self._closing.is_set() or len(self._rows) >= self.max_buffer:
+                overflow = True
+            else:
+                overflow = False
+                self._rows.append(row)
+                self.queued += 1
+                # First row starts the interval timer; a full batch goes out at once
+                if len(self._rows) == 1 or len(self._rows) >= self.max_rows:
+                    self._cond.notify()
+        if overflow:
+            # Buffer full (database down for a while) or shutting down: straight to disk
+            self._spill([row])
+
+    def _run(self):
+        # Rows spilled by an earlier run go out as soon as the database answers
+        self._replay()
+        while True:
+            with self._cond:
+                while not self._rows and not self._closing.is_set():
+                    self._cond.wait()
+                # Give a partial batch until the interval to fill up
+                if len(self._rows) < self.max_rows and not self._closing.is_set():
+                    self._cond.wait(self.interval)
+                batch = [self._rows.popleft() for _ in range(min(self.max_rows, len(self._rows)))]
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    # e.g. the spill file isn't writable; keep the flusher alive for the next batch
+                    self.dropped += len(batch)
+                    print(f"❌ Dropped {len(batch)} rows - {e}")
+            elif self._closing.is_set():
+                return
+
+    def _delay(self):
+        return min(self.backoff * 2 ** (self._consecutive_failures - 1), self.max_backoff)
+
+    def _failed(self, error, rows):
+        self.failures += 1
+        self.last_error = str(error)
+        print(f"⚠️ Warning: bulk insert of {rows} rows failed - {error}")
+
+    def _deliver(self, batch):
+        """Send batch; returns the rows still unsent (a suffix of batch) when the database is unreachable"""
+        try:
+            self.sink(batch)
+        except Exception as e:
+            self._failed(e, len(batch))
+            if not self.is_rejection(e):
+                return batch
+            if len(batch) == 1:
+                self._reject(batch[0], e)
+                return []
+        else:
+            self.written += len(batch)
+            self.batches += 1
+            return []
+
+        # The database refused the batch: find the rows it refuses on their own
+        for i, row in enumerate(batch):
+            try:
+                self.sink([row])
+            except Exception as e:
+                self._failed(e, 1)
+                if not self.is_rejection(e):
+                    return batch[i:]
+                self._reject(row, e)
+            else:
+                self.written += 1
+                self.batches += 1
+        return []
+
+    def _write(self, batch):
+        for _ in range(self.max_attempts):
+            unsent = self._deliver(batch)
+            if len(unsent) < len(batch):
+                self._consecutive_failures = 0
+            if not unsent:
+                self._replay()
+                return
+            batch = unsent
+            self._consecutive_failures += 1
+            if self._closing.is_set():
+                break
+            self._closing.wait(self._delay())
+        self._spill(batch)
+
+    def _reject(self, row, error):
+        self.rejected += 1
+        print(f"❌ Rejected row {json.dumps(row, default=str)[:200]} - {error}")
+        if not self.spill_path:
+            return
+        with self._spill_lock, _FileLock(self.spill_path + '.lock'):
+            with open(self.spill_path + '.rejected', 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'row': row, 'error': str(error)}, default=str) + '\n')
+
+    def _spill(self, rows):
+        if not self.spill_path:
+            self.dropped += len(rows)
+            print(f"❌ Dropped {len(rows)} rows: no spill file configured")
+            return
+        with self._spill_lock:
+            directory = os.path.dirname(self.spill_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with _FileLock(self.spill_path + '.lock'), open(self.spill_path, 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + '\n')
+            self.spilled += len(rows)
+
+    def _replay(self):
+        """Send spilled rows after a successful write; the file only shrinks as batches succeed"""
+        replay_path = (self.spill_path or '') + '.replay'
+        if not self.spill_path or not (os.path.exists(self.spill_path) or os.path.exists(replay_path)):
+            return
+        # Every process sharing the spill file may get here; only one replays at a time
+        with _FileLock(replay_path + '.lock', blocking=False) as replaying:
+            if not replaying:
+                return
+            with self._spill_lock, _FileLock(self.spill_path + '.lock'):
+                if not os.path.exists(replay_path):
+                    if not os.path.exists(self.spill_path):
+                        return
+                    # New spills go to a fresh file while this one is replayed
+                    os.replace(self.spill_path, replay_path)
+
+            with open(replay_path, encoding='utf-8') as f:
+                rows = []
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        pass  # torn last line from a crash mid-write
+            while rows:
+                batch = rows[:self.max_rows]
+                written = self.written
+                unsent = self._deliver(batch)
+                self.replayed += self.written - written
+                sent = len(batch) - len(unsent)
+                rows = rows[sent:]
+                if sent:
+                    # Rewrite what's left so a crash never replays a batch twice
+                    tmp_path = replay_path + '.tmp'
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        f.writelines(json.dumps(row, default=str) + '\n' for row in rows)
+                    os.replace(tmp_path, replay_path)
+                if unsent:
+                    return
+            os.remove(replay_path)
+            print(f"✅ Replayed spilled rows from {self.spill_path}")
+
+    def close(self, timeout=10):
+        """Flush what's buffered (one attempt per batch, spilling failures) and stop the flusher"""
+        with self._cond:
+            self._closing.set()
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            buffered = len(self._rows)
+        return {
+            'buffered': buffered,
+            'max_rows': self.max_rows,
+            'interval_ms': self.interval * 1000,
+            'max_buffer': self.max_buffer,
+            'queued': self.queued,
+            'written': self.written,
+            'batches': self.batches,
+            'avg_batch_rows': round(self.written / self.batches, 1) if self.batches else 0.0,
+            'failures': self.failures,
+            'spilled': self.spilled,
+            'replayed': self.replayed,
+            'rejected': self.rejected,
+            'dropped': self.dropped,
+            'spill_pending': bool(self.spill_path) and (os.path.exists(self.spill_path) or
+                                                        os.path.exists(self.spill_path + '.replay')),
+            'last_error': self.last_error,
+        }
@@ -120,28 +120,29 @@ async function analyzeAllergy(e) {
     document.getElementById('loading').classList.add('active');
     document.getElementById('allergyCheckForm').classList.remove('active'); // Changed from style.display
 
-    let imageBase64 = null;
-
+    // Multipart sends the file as raw bytes (no base64 inflation); the browser sets the boundary header
+    const formData = new FormData();
+    formData.append('symptoms', symptomsField.value);
+    formData.append('suspected_ingredients', document.getElementById('suspectedIngredients').value);
     if (imageFile) {
-        imageBase64 = await new Promise((resolve) => {
-            const reader = new FileReader();
-            reader.onload = () => resolve(reader.result.split(',')[1]);
-            reader.readAsDataURL(imageFile);
-        });
+        formData.append('image', imageFile);
     }
 
     try {
         const res = await fetch(`${API_URL}/allergy/analyze`, {
             method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({
-                symptoms: symptomsField.value,
-                suspected_ingredients: document.getElementById('suspectedIngredients').value,
-                image: imageBase64
-            })
+            body: formData
         });
         const data = await res.json();
         
+        // Rejected uploads (too large, not an image) come back with an error message
+        if (!res.ok) {
+            showError(data.error || 'Allergy analysis failed. Please try again.');
+            document.getElementById('loading').classList.remove('active');
+            document.getElementById('allergyCheckForm').classList.add('active');
+            return;
+        }
+        
         document.getElementById('loading').classList.remove('active');
         const results = document.getElementById('results');
         results.classList.add('active');
@@ -153,30 +154,12 @@ async function analyzeAllergy(e) {
         document.getElementById('confidenceFill').style.width = '0%';
         document.getElementById('confidenceText').textContent = '';
         
-        let details = `<h3>🔍 Likely Culprits</h3>`;
-        details += `<p>${data.likely_culprits.join(', ')}</p>`;
+        renderAllergyDetails(data);
         
-        if (data.image_analysis) {
-            details += `<h3>📸 Image Analysis</h3>`;
-            details += `<p><strong>Severity:</strong> ${data.image_analysis.severity}</p>`;
-            details += `<p><strong>Type:</strong> ${data.image_analysis.type}</p>`;
-            details += `<p><strong>Confidence:</strong> ${data.image_analysis.confidence}%</p>`;
-            if (data.image_analysis.observations) {
-                details += `<p><strong>Observations:</strong></p><ul>`;
-                data.image_analysis.observations.forEach(o => details += `<li>${o}</li>`);
-                details += `</ul>`;
-            }
+        // The photo is analyzed in the background; fill it in when the job finishes
+        if (data.image_job) {
+            watchImageJob(data);
         }
-        
-        details += `<h3>💊 Remedies</h3>`;
-        data.remedies.forEach(r => {
-            details += `<p><strong>${r.ingredient}:</strong> ${r.remedy}</p>`;
-        });
-        details += `<h3>📋 General Advice</h3><ul>`;
-        data.general_advice.forEach(a => details += `<li>${a}</li>`);
-        details += `</ul>`;
-        
-        document.getElementById('resultDetails').innerHTML = details;
     } catch (err) {
         showError('Allergy analysis failed. Please try again.');
         document.getElementById('loading').classList.remove('active');
@@ -184,6 +167,78 @@ async function analyzeAllergy(e) {
     }
 }
 
+function renderAllergyDetails(data) {
+    let details = `<h3>🔍 Likely Culprits</h3>`;
+    details += `<p>${data.likely_culprits.join(', ')}</p>`;
+    
+    if (data.image_job && !data.image_analysis) {
+        details += `<h3>📸 Image Analysis</h3>`;
+        details += `<p>⏳ Analyzing your photo...</p>`;
+    } else if (data.image_analysis) {
+        details += `<h3>📸 Image Analysis</h3>`;
+        details += `<p><strong>Severity:</strong> ${data.image_analysis.severity}</p>`;
+        details += `<p><strong>Type:</strong> ${data.image_analysis.type}</p>`;
+        details += `<p><strong>Confidence:</strong> ${data.image_analysis.confidence}%</p>`;
+        if (data.image_analysis.observations) {
+            details += `<p><strong>Observations:</strong></p><ul>`;
+            data.image_analysis.observations.forEach(o => details += `<li>${o}</li>`);
+            details += `</ul>`;
+        }
+    }
+    
+    details += `<h3>💊 Remedies</h3>`;
+    data.remedies.forEach(r => {
+        details += `<p><strong>${r.ingredient}:</strong> ${r.remedy}</p>`;
+    });
+    details += `<h3>📋 General Advice</h3><ul>`;
+    data.general_advice.forEach(a => details += `<li>${a}</li>`);
+    details += `</ul>`;
+    
+    document.getElementById('resultDetails').innerHTML = details;
+}
+
+function watchImageJob(data) {
+    const showAnalysis = (job) => {
+        data.image_analysis = job.image_analysis || {
+            severity: 'unknown',
+            type: 'analysis failed',
+            confidence: 0,
+            observations: ['Could not analyze image - please try again']
+        };
+        renderAllergyDetails(data);
+    };
+    
+    // Polling works everywhere; it is also the fallback if the event stream drops
+    const poll = async () => {
+        try {
+            const res = await fetch(`${API_URL}/allergy/jobs/${data.image_job.id}`);
+            const job = await res.json();
+            if (res.ok && (job.status === 'queued' || job.status === 'running')) {
+                setTimeout(poll, 2000);
+                return;
+            }
+            showAnalysis(job);
+        } catch {
+            showAnalysis({});
+        }
+    };
+    
+    if (!window.EventSource) {
+        setTimeout(poll, 2000);
+        return;
+    }
+    
+    const events = new EventSource(`${API_URL}/allergy/jobs/${data.image_job.id}/stream`);
+    events.addEventListener('done', (e) => {
+        events.close();
+        showAnalysis(JSON.parse(e.data));
+    });
+    events.onerror = () => {
+        events.close();
+        poll();
+    };
+}
+
 function previewAllergyImage(event) {
     const file = event.target.files[0];
     const preview = document.getElementById('imagePreview');
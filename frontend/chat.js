@@ -14,6 +14,18 @@ function toggleChat() {
     }
 }
 
+// Random id per browser tab so the server can remember this conversation
+function getChatSessionId() {
+    let id = sessionStorage.getItem('chatSessionId');
+    if (!id) {
+        id = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : Date.now().toString(36) + Math.random().toString(36).slice(2);
+        sessionStorage.setItem('chatSessionId', id);
+    }
+    return id;
+}
+
 async function sendMessage() {
     const input = document.getElementById('chatInput');
     const msg = input.value.trim();
@@ -26,29 +38,92 @@ async function sendMessage() {
     addTypingIndicator();
     
     try {
-        const res = await fetch(`${API_URL}/chat`, {
+        const res = await fetch(`${API_URL}/chat/stream`, {
             method: 'POST',
-            headers: {'Content-Type': 'application/json'},
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
             body: JSON.stringify({
                 message: msg, 
-                user_id: currentUser || 'guest'
+                user_id: currentUser || 'guest',
+                session_id: getChatSessionId()
             })
         });
-        const data = await res.json();
-        
-        removeTypingIndicator();
         
-        if (data.success) {
-            addChatMessage(data.response, 'bot');
-        } else {
-            addChatMessage('Sorry, I encountered an error. Please try again!', 'bot');
+        // Older browsers (or proxies) without streaming bodies get the whole answer at once
+        const contentType = res.headers.get('Content-Type') || '';
+        if (!res.body || !contentType.includes('text/event-stream')) {
+            const data = await res.json();
+            removeTypingIndicator();
+            if (data.success) {
+                addChatMessage(data.response, 'bot');
+            } else {
+                addChatMessage('Sorry, I encountered an error. Please try again!', 'bot');
+            }
+            return;
         }
+        
+        await readChatStream(res.body);
     } catch {
         removeTypingIndicator();
         addChatMessage('Sorry, I\'m having trouble connecting. Please try again!', 'bot');
     }
 }
 
+// Render Server-Sent Events: "token" events append text, "done" carries the final answer
+async function readChatStream(body) {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    let bubble = null;
+    
+    const render = (content) => {
+        if (!bubble) {
+            removeTypingIndicator();
+            bubble = addChatMessage('', 'bot');
+        }
+        bubble.innerHTML = content;
+        const messagesContainer = document.getElementById('chatMessages');
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    };
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            
+            let event = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            if (!data) continue;
+            
+            const payload = JSON.parse(data);
+            if (event === 'token') {
+                text += payload.text;
+                render(text);
+            } else if (event === 'done') {
+                render(payload.response);
+                return;
+            }
+        }
+    }
+    
+    if (!bubble) {
+        removeTypingIndicator();
+        addChatMessage('Sorry, I encountered an error. Please try again!', 'bot');
+    }
+}
+
 function addChatMessage(text, sender) {
     const div = document.createElement('div');
     div.className = `chat-message ${sender}`;
@@ -57,6 +132,7 @@ function addChatMessage(text, sender) {
     const messagesContainer = document.getElementById('chatMessages');
     messagesContainer.appendChild(div);
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    return div.firstElementChild;
 }
 
 function addTypingIndicator() {
@@ -457,18 +457,19 @@ async function saveScore(score) {
 
 async function loadLeaderboard() {
     try {
-        const res = await fetch(`${API_URL}/game/leaderboard`);
+        const params = new URLSearchParams({game_type: 'balloon_hit', limit: 10, user_id: currentUser || 'guest'});
+        const res = await fetch(`${API_URL}/game/leaderboard?${params}`);
         const data = await res.json();
         
         if (data.success && data.leaderboard) {
-            displayLeaderboard(data.leaderboard);
+            displayLeaderboard(data.leaderboard, data.me);
         }
     } catch (err) {
         console.log('Failed to load leaderboard');
     }
 }
 
-function displayLeaderboard(scores) {
+function displayLeaderboard(scores, me) {
     const list = document.getElementById('leaderboardList');
     if (!list) return;
     
@@ -483,6 +484,17 @@ function displayLeaderboard(scores) {
             <span class="leaderboard-score">${s.score} pts</span>
         </div>
     `).join('');
+    
+    // Show the player's own rank when they're outside the top 10
+    if (me && me.rank > 10) {
+        list.innerHTML += `
+            <div class="leaderboard-item">
+                <span class="leaderboard-rank">${me.rank}</span>
+                <span class="leaderboard-name">You</span>
+                <span class="leaderboard-score">${me.score} pts</span>
+            </div>
+        `;
+    }
 }
 
 function toggleLeaderboard() {